@@ -46,6 +46,38 @@ DEFAULT_SETTINGS = {
         "description": "Enable caching for HTTP API requests",
         "value": True,
     },
+    "enable_download_cache": {
+        "description": "Keep downloaded package archives for the next installations",
+        "value": True,
+    },
+    "enable_library_store": {
+        "description": (
+            "Share the registry libraries between projects and environments "
+            "using a store in the core directory"
+        ),
+        "value": False,
+    },
+    "enable_library_store_hardlinks": {
+        "description": (
+            "Link the library files from the store with hard links, the files "
+            "are shared and must not be modified in the project"
+        ),
+        "value": False,
+    },
+    "enable_registry_index": {
+        "description": (
+            "Resolve registry packages using a local index snapshot "
+            "(see `pio pkg index update`)"
+        ),
+        "value": False,
+    },
+    "enable_build_daemon": {
+        "description": (
+            "Keep a build server with the preloaded modules per project "
+            "environment to skip the interpreter startup (POSIX only)"
+        ),
+        "value": False,
+    },
     "force_verbose": {
         "description": "Force verbose output when processing environments",
         "value": False,
@@ -0,0 +1,343 @@
+# Copyright (c) 2014-present PlatformIO <contact@platformio.org>
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import hashlib
+import importlib
+import json
+import math
+import multiprocessing
+import os
+from concurrent.futures import ProcessPoolExecutor
+
+from platformio import __version__, fs
+from platformio.compat import IS_WINDOWS, hashlib_encode_data
+
+
+class LibDependencyCache:  # pylint: disable=too-many-instance-attributes
+    """Persistent cache of the Library Dependency Finder.
+
+    Stores resolved includes per source file and the final dependency graph.
+    A file entry is valid while the file and all resolved includes keep the
+    same modification time and size. An entry is bound to a scope, which
+    covers the effective CPPDEFINES, LDF mode and include directories.
+    The whole cache is dropped when the fingerprint (library dependencies,
+    storages and manifests) changes.
+    """
+
+    VERSION = 1
+
+    def __init__(self, path, fingerprint):
+        self.path = path
+        self.fingerprint = fingerprint
+        self._files = {}
+        self._graph = None
+        self._stats = {}
+        self._used_keys = set()
+        self._scanned_paths = set()
+        self._modified = False
+        self.load()
+
+    @staticmethod
+    def compute_hash(*items):
+        return hashlib.sha1(
+            hashlib_encode_data(json.dumps(items, sort_keys=True, default=str))
+        ).hexdigest()
+
+    def load(self):
+        if not os.path.isfile(self.path):
+            return
+        try:
+            data = fs.load_json(self.path)
+        except Exception:  # pylint: disable=broad-except
+            return
+        if (
+            not isinstance(data, dict)
+            or data.get("version") != self.VERSION
+            or data.get("core_version") != __version__
+            or data.get("fingerprint") != self.fingerprint
+        ):
+            return
+        self._files = data.get("files") or {}
+        self._graph = data.get("graph")
+
+    def save(self):
+        # drop obsolete entries if the tree was scanned during this build
+        if self._used_keys and len(self._used_keys) != len(self._files):
+            self._files = {
+                key: value
+                for key, value in self._files.items()
+                if key in self._used_keys
+            }
+            self._modified = True
+        if not self._modified:
+            return
+        try:
+            with open(self.path, mode="w", encoding="utf8") as fp:
+                json.dump(
+                    dict(
+                        version=self.VERSION,
+                        core_version=__version__,
+                        fingerprint=self.fingerprint,
+                        files=self._files,
+                        graph=self._graph,
+                    ),
+                    fp,
+                )
+            self._modified = False
+        except IOError:
+            pass
+
+    def stat(self, path):
+        """Returns `[mtime, size]` of a file or directory, cached per build"""
+        if path not in self._stats:
+            try:
+                st = os.stat(path)
+                self._stats[path] = [st.st_mtime_ns, st.st_size]
+            except OSError:
+                self._stats[path] = None
+        return self._stats[path]
+
+    def make_scope(self, ldf_mode, cppdefines, include_dirs):
+        return self.compute_hash(
+            ldf_mode,
+            cppdefines,
+            [(d, self.stat(d)) for d in include_dirs],
+        )[:16]
+
+    def get_includes(self, scope, path):
+        key = "%s:%s" % (scope, path)
+        entry = self._files.get(key)
+        if entry:
+            self._used_keys.add(key)
+        if not entry or entry[0] != self.stat(path):
+            return None
+        for item, item_stat in zip(entry[1], entry[2]):
+            if self.stat(item) != item_stat:
+                return None
+        self._scanned_paths.add(path)
+        self._scanned_paths.update(entry[1])
+        return entry[1]
+
+    def set_includes(self, scope, path, includes):
+        key = "%s:%s" % (scope, path)
+        self._used_keys.add(key)
+        self._scanned_paths.add(path)
+        self._scanned_paths.update(includes)
+        self._files[key] = [
+            self.stat(path),
+            includes,
+            [self.stat(item) for item in includes],
+        ]
+        self._modified = True
+
+    def get_graph(self, key):
+        if not self._graph or self._graph.get("key") != key:
+            return None
+        for path, path_stat in self._graph["stats"].items():
+            if self.stat(path) != path_stat:
+                return None
+        return self._graph
+
+    def set_graph(self, key, deps, circular_deps, paths):
+        """`deps` and `circular_deps` map a library path to the paths of its
+        dependencies, `paths` are extra files and directories to watch.
+        All scanned files and their includes are watched too."""
+        paths = set(paths) | self._scanned_paths
+        graph = dict(
+            key=key,
+            deps=deps,
+            circular_deps=circular_deps,
+            stats={path: self.stat(path) for path in sorted(paths)},
+        )
+        if graph != self._graph:
+            self._graph = graph
+            self._modified = True
+
+
+class LibBuilderIndex:
+    """Maps root directories of library builders to builders.
+
+    The owners of a file are found by walking up its parent directories,
+    so a lookup costs as many dictionary probes as the path has components
+    instead of a prefix comparison with each library.
+    """
+
+    def __init__(self, lib_builders):
+        self._lib_builders = set(lib_builders)
+        self._roots = {}
+        self._real_roots = {}
+        self._realpaths = {}
+        for lb in lib_builders:
+            self._roots.setdefault(self._normalize(lb.path), []).append(lb)
+            self._real_roots.setdefault(
+                self._normalize(self._realpath(lb.path)), []
+            ).append(lb)
+
+    @staticmethod
+    def _normalize(path):
+        return path.lower() if IS_WINDOWS else path
+
+    def _realpath(self, path):
+        if path not in self._realpaths:
+            self._realpaths[path] = os.path.realpath(path)
+        return self._realpaths[path]
+
+    @staticmethod
+    def _lookup(roots, path, found):
+        while True:
+            if path in roots:
+                found.extend(roots[path])
+            parent = os.path.dirname(path)
+            if parent == path:
+                return
+            path = parent
+
+    def is_actual(self, lib_builders):
+        return len(lib_builders) == len(self._lib_builders) and all(
+            lb in self._lib_builders for lb in lib_builders
+        )
+
+    def find(self, path):
+        """Returns builders whose root directory contains `path`"""
+        found = []
+        self._lookup(self._roots, self._normalize(path), found)
+        # try to resolve paths
+        self._lookup(
+            self._real_roots,
+            self._normalize(os.path.dirname(self._realpath(path))),
+            found,
+        )
+        return list(dict.fromkeys(found)) if len(found) > 1 else found
+
+
+def _make_path_cpp_scanner_class():
+    cpp = importlib.import_module("SCons.cpp")
+    scons_util = importlib.import_module("SCons.Util")
+
+    class PathCPPConditionalScanner(cpp.PreProcessor):
+        """A path based equivalent of `SConsCPPConditionalScanner`, which does
+        not depend on the SCons file system nodes and can be used in
+        a worker process"""
+
+        def __init__(self, *args, **kwargs):
+            super().__init__(*args, **kwargs)
+            self.result = scons_util.UniqueList()
+            self.missing = []
+            self._known_paths = []
+
+        def initialize_result(self, fname):
+            self.result = scons_util.UniqueList([fname])
+
+        def find_include_file(self, t):
+            _, quote, fname = t
+            paths = tuple(self._known_paths) + self.searchpath[quote]
+            if quote == '"':
+                paths = (os.path.dirname(self.current_file),) + paths
+            for path in paths:
+                result = os.path.normpath(os.path.join(path, fname))
+                if not os.path.isfile(result):
+                    continue
+                for known_path in self.searchpath[quote]:
+                    if result.startswith(known_path):
+                        self._known_paths.append(known_path)
+                        break
+                return result
+            self.missing.append((fname, self.current_file))
+            return None
+
+        def read_file(self, file):
+            try:
+                with open(file, "rb") as fp:
+                    return scons_util.to_Text(fp.read())
+            except OSError:
+                self.missing.append((file, self.current_file))
+                return ""
+
+    return PathCPPConditionalScanner
+
+
+_PATH_CPP_SCANNER_CLASS = None
+
+
+def scan_conditional_includes(paths, include_dirs, cppdefines, depth):
+    """Returns `[(path, includes, missing)]` for the source files, where
+    `includes` is `None` when a file could not be pre-processed.
+
+    The includes are resolved on disk, so the generated files and the
+    sources of variant directories are reported as `missing`"""
+    global _PATH_CPP_SCANNER_CLASS  # pylint: disable=global-statement
+    if not _PATH_CPP_SCANNER_CLASS:
+        _PATH_CPP_SCANNER_CLASS = _make_path_cpp_scanner_class()
+    result = []
+    for path in paths:
+        scanner = _PATH_CPP_SCANNER_CLASS(
+            current=os.path.dirname(path),
+            cpppath=include_dirs,
+            dict=cppdefines,
+            depth=depth,
+        )
+        try:
+            result.append((path, scanner(path), scanner.missing))
+        except Exception:  # pylint: disable=broad-except
+            result.append((path, None, []))
+    return result
+
+
+class LibDependencyScanner:
+    """Pre-processes independent source files of the Library Dependency
+    Finder in a pool of worker processes.
+
+    The pool is started on the first call with enough files, results are
+    returned in the order of the requested files.
+    """
+
+    MIN_FILES = 16
+
+    def __init__(self, jobs):
+        self.jobs = jobs
+        self._executor = None
+
+    def is_applicable(self, file_nums):
+        return self.jobs > 1 and file_nums >= self.MIN_FILES
+
+    def _get_executor(self):
+        if not self._executor:
+            self._executor = ProcessPoolExecutor(
+                max_workers=self.jobs,
+                mp_context=(
+                    multiprocessing.get_context("fork")
+                    if "fork" in multiprocessing.get_all_start_methods()
+                    else None
+                ),
+            )
+        return self._executor
+
+    def scan(self, paths, include_dirs, cppdefines, depth):
+        chunk_size = max(1, math.ceil(len(paths) / (self.jobs * 4)))
+        chunks = [paths[i : i + chunk_size] for i in range(0, len(paths), chunk_size)]
+        result = []
+        for items in self._get_executor().map(
+            scan_conditional_includes,
+            chunks,
+            [include_dirs] * len(chunks),
+            [cppdefines] * len(chunks),
+            [depth] * len(chunks),
+        ):
+            result.extend(items)
+        return result
+
+    def close(self):
+        if self._executor:
+            self._executor.shutdown(wait=True)
+            self._executor = None
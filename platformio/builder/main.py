@@ -28,7 +28,7 @@ from SCons.Script import DefaultEnvironment  # pylint: disable=import-error
 from SCons.Script import Import  # pylint: disable=import-error
 from SCons.Script import Variables  # pylint: disable=import-error
 
-from platformio import app, fs
+from platformio import app, fs, tracing
 from platformio.platform.base import PlatformBase
 from platformio.proc import get_pythonexe_path
 from platformio.project.helpers import get_project_dir
@@ -44,6 +44,7 @@ clivars.AddVariables(
     ("PIOTEST_RUNNING_NAME",),
     ("UPLOAD_PORT",),
     ("PROGRAM_ARGS",),
+    ("TRACE_FILE",),
 )
 
 DEFAULT_ENV_OPTIONS = dict(
@@ -62,10 +63,14 @@ DEFAULT_ENV_OPTIONS = dict(
         "piolib",
         "pioupload",
         "piosize",
+        "piosizediff",
         "pioino",
         "piomisc",
         "piointegration",
         "piomaxlen",
+        "piotrace",
+        "pioarchivecache",
+        "pioobjectcache",
     ],
     toolpath=[os.path.join(fs.get_source_dir(), "builder", "tools")],
     variables=clivars,
@@ -128,6 +133,10 @@ env.Replace(
     PROJECT_BUILD_DIR=config.get("platformio", "build_dir"),
     BUILD_TYPE=env.GetBuildType(),
     BUILD_CACHE_DIR=config.get("platformio", "build_cache_dir"),
+    BUILD_CACHE_MODE=config.get("platformio", "build_cache_mode"),
+    BUILD_CACHE_URL=config.get("platformio", "build_cache_url"),
+    BUILD_CACHE_SIZE=config.get("platformio", "build_cache_size"),
+    BUILD_ARCHIVE_CACHE_DIR=config.get("platformio", "build_archive_cache_dir"),
     LIBSOURCE_DIRS=[
         config.get("platformio", "lib_dir"),
         os.path.join("$PROJECT_LIBDEPS_DIR", "$PIOENV"),
@@ -139,11 +148,17 @@ if int(ARGUMENTS.get("ISATTY", 0)):
     # pylint: disable=protected-access
     click._compat.isatty = lambda stream: True
 
-if env.subst("$BUILD_CACHE_DIR"):
+if env.subst("$BUILD_CACHE_MODE") == "content":
+    env.ConfigureObjectCache()
+elif env.subst("$BUILD_CACHE_DIR"):
     if not os.path.isdir(env.subst("$BUILD_CACHE_DIR")):
         os.makedirs(env.subst("$BUILD_CACHE_DIR"))
     env.CacheDir("$BUILD_CACHE_DIR")
 
+# the spawned commands are traced including the object cache
+env.ConfigureBuildTrace()
+tracing.begin("Read SConscript files", cat="scons")
+
 if not int(ARGUMENTS.get("PIOVERBOSE", 0)):
     click.echo("Verbose mode can be enabled via `-v, --verbose` option")
 
@@ -164,20 +179,23 @@ env.SConsignFile(
     )
 )
 
-env.SConscript(env.GetExtraScripts("pre"), exports="env")
+with tracing.span("Extra scripts (pre)", cat="scons"):
+    env.SConscript(env.GetExtraScripts("pre"), exports="env")
 
 if env.IsCleanTarget():
     env.CleanProject(fullclean=int(ARGUMENTS.get("FULLCLEAN", 0)))
     env.Exit(0)
 
-env.SConscript("$BUILD_SCRIPT")
+with tracing.span("Build script", cat="scons"):
+    env.SConscript("$BUILD_SCRIPT")
 
 if "UPLOAD_FLAGS" in env:
     env.Prepend(UPLOADERFLAGS=["$UPLOAD_FLAGS"])
 if env.GetProjectOption("upload_command"):
     env.Replace(UPLOADCMD=env.GetProjectOption("upload_command"))
 
-env.SConscript(env.GetExtraScripts("post"), exports="env")
+with tracing.span("Extra scripts (post)", cat="scons"):
+    env.SConscript(env.GetExtraScripts("post"), exports="env")
 
 ##############################################################################
 
@@ -246,8 +264,26 @@ if "sizedata" in COMMAND_LINE_TARGETS:
 
     Default("sizedata")
 
+if "sizediff" in COMMAND_LINE_TARGETS:
+    AlwaysBuild(
+        env.Alias(
+            "sizediff",
+            DEFAULT_TARGETS,
+            env.VerboseAction(env.DumpSizeDiff, "Comparing memory usage..."),
+        )
+    )
+
+    Default("sizediff")
+
 # issue #4604: process targets sequentially
 for index, target in enumerate(
     [t for t in COMMAND_LINE_TARGETS if not t.startswith("__")][1:]
 ):
     env.Depends(target, COMMAND_LINE_TARGETS[index])
+
+# restore the static libraries from cache when flags are final
+env.ProcessArchiveCache()
+
+# the build of targets is traced until the exit
+tracing.end("Read SConscript files")
+tracing.begin("Build targets", cat="scons")
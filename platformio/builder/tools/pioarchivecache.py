@@ -0,0 +1,243 @@
+# Copyright (c) 2014-present PlatformIO <contact@platformio.org>
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import hashlib
+import os
+import shutil
+
+from platformio import tracing
+from platformio.package.meta import PackageItem, PackageMetadata
+from platformio.proc import where_is_program
+
+ARCHIVE_CACHE_VERSION = 1
+ARCHIVE_CACHE_TOOLS = ("CC", "CXX", "AS", "AR", "RANLIB")
+ARCHIVE_CACHE_COMMANDS = ("CCCOM", "CXXCOM", "ASCOM", "ASPPCOM", "ARCOM", "RANLIBCOM")
+ARCHIVE_CACHE_FLAGS = (
+    "CCFLAGS",
+    "CFLAGS",
+    "CXXFLAGS",
+    "ASFLAGS",
+    "ASPPFLAGS",
+    "ARFLAGS",
+    "RANLIBFLAGS",
+    "_CPPDEFFLAGS",
+)
+
+# the libraries which are resolved at the end of reading of SConscript files,
+# when the construction variables (flags) are final
+_pending_libraries = []
+_stats = dict(hits=0, misses=0)
+_fingerprints = {}
+
+
+def get_package_fingerprint(path):
+    """Returns the name and the version of the installed package which contains
+    the path, or None when the path is not a part of the immutable package"""
+    if path in _fingerprints:
+        return _fingerprints[path]
+    result = None
+    for location in (".git", ".hg", ".svn", ""):
+        manifest_path = os.path.join(path, location, PackageItem.METAFILE_NAME)
+        if not os.path.isfile(manifest_path):
+            continue
+        try:
+            metadata = PackageMetadata.load(manifest_path)
+        except (OSError, ValueError, KeyError, TypeError):
+            break
+        uri = metadata.spec.uri if metadata.spec else None
+        if not uri or not uri.startswith(("symlink://", "file://")):
+            result = "%s@%s" % (metadata.name, metadata.version)
+        break
+    else:
+        parent = os.path.dirname(path)
+        if parent != path:
+            result = get_package_fingerprint(parent)
+    _fingerprints[path] = result
+    return result
+
+
+def _compute_tree_hash(root, files):
+    h = hashlib.sha1()
+    for relpath in sorted(files):
+        h.update(relpath.replace(os.sep, "/").encode("utf8"))
+        with open(os.path.join(root, relpath), "rb") as fp:
+            h.update(hashlib.sha1(fp.read()).digest())
+    return h.hexdigest()
+
+
+def _get_tree_files(root):
+    for dirpath, _, filenames in os.walk(root):
+        for name in filenames:
+            yield os.path.relpath(os.path.join(dirpath, name), root)
+
+
+def _get_dir_fingerprint(path):
+    """Returns the fingerprint of the package which contains the directory,
+    or the hash of every file in the directory, the headers with any
+    extension and the included sources"""
+    key = ("dir", path)
+    if key not in _fingerprints:
+        if not os.path.isdir(path):
+            _fingerprints[key] = None
+        else:
+            _fingerprints[key] = get_package_fingerprint(path) or (
+                _compute_tree_hash(path, _get_tree_files(path))
+            )
+    return _fingerprints[key]
+
+
+def get_program_fingerprint(program, envpath=None):
+    """Returns the name and the version of the toolchain package, or the size
+    and the modification time of the program outside of the packages"""
+    path = where_is_program(program, envpath)
+    key = ("program", path)
+    if key not in _fingerprints:
+        _fingerprints[key] = get_package_fingerprint(os.path.dirname(path))
+        if not _fingerprints[key] and os.path.isfile(path):
+            stat = os.stat(path)
+            _fingerprints[key] = "%s:%d:%d" % (path, stat.st_size, stat.st_mtime)
+    return _fingerprints[key] or program
+
+
+def get_base_dirs(env):
+    """Returns the project and the environment specific locations, which are
+    replaced in the cache keys, so the identical artifacts are shared between
+    the build environments and projects"""
+    result = []
+    for name, path in (
+        ("$BUILD_DIR", "$BUILD_DIR"),
+        ("$LIBDEPS_DIR", os.path.join("$PROJECT_LIBDEPS_DIR", "$PIOENV")),
+        ("$PROJECT_DIR", "$PROJECT_DIR"),
+        ("$PACKAGES_DIR", "$PROJECT_PACKAGES_DIR"),
+        ("$CORE_DIR", "$PROJECT_CORE_DIR"),
+    ):
+        path = env.subst(path)
+        if path:
+            result.append((name, path))
+    return result
+
+
+def normalize_paths(value, base_dirs):
+    for name, path in base_dirs:
+        value = value.replace(path, name)
+    return value
+
+
+def _compute_archive_key(env, src_dir, src_filter):
+    h = hashlib.sha1()
+
+    def _update(*values):
+        for value in values:
+            h.update(str(value).encode("utf8"))
+            h.update(b"\0")
+
+    _update(ARCHIVE_CACHE_VERSION)
+    base_dirs = get_base_dirs(env)
+    envpath = env.subst("${ENV['PATH']}")
+    for name in ARCHIVE_CACHE_TOOLS:
+        program = env.subst("$%s" % name)
+        _update(name, get_program_fingerprint(program, envpath) if program else None)
+    for name in ARCHIVE_CACHE_COMMANDS:
+        value = env.get(name)
+        _update(name, value if isinstance(value, str) else type(value).__name__)
+    for name in ARCHIVE_CACHE_FLAGS:
+        _update(name, normalize_paths(env.subst("$%s" % name), base_dirs))
+    for path in env.get("CPPPATH", []):
+        path = env.Dir(path).get_abspath()
+        _update(normalize_paths(path, base_dirs), _get_dir_fingerprint(path))
+    _update(
+        normalize_paths(src_dir, base_dirs),
+        env.subst(src_filter) if src_filter else None,
+        _get_dir_fingerprint(src_dir),
+    )
+    return h.hexdigest()
+
+
+def _get_archive_path(env, variant_dir):
+    variant_dir = os.path.normpath(env.subst(variant_dir))
+    prefix = env.subst("$LIBPREFIX")
+    suffix = env.subst("$LIBSUFFIX")
+    name = os.path.basename(variant_dir)
+    if prefix and not name.startswith(prefix):
+        name = prefix + name
+    if suffix and not name.endswith(suffix):
+        name += suffix
+    return os.path.join(os.path.dirname(variant_dir), name)
+
+
+def _restore_archive(target, source, env):  # pylint: disable=unused-argument
+    shutil.copyfile(source[0].get_abspath(), target[0].get_abspath())
+
+
+def _store_archive(cache_path):
+    def _action(target, source, env):  # pylint: disable=unused-argument
+        if not os.path.isdir(os.path.dirname(cache_path)):
+            os.makedirs(os.path.dirname(cache_path), exist_ok=True)
+        # an atomic replace, the cache is shared between the concurrent builds
+        tmp_path = "%s.%d.tmp" % (cache_path, os.getpid())
+        shutil.copyfile(target[0].get_abspath(), tmp_path)
+        os.replace(tmp_path, cache_path)
+
+    return _action
+
+
+def BuildCachedLibrary(env, variant_dir, src_dir, src_filter=None, nodes=None):
+    """The archive is restored from `$BUILD_ARCHIVE_CACHE_DIR` or built at the
+    end of reading of SConscript files (see `ProcessArchiveCache`)"""
+    archive = env.File(_get_archive_path(env, variant_dir))
+    _pending_libraries.append(
+        (env, archive, variant_dir, env.subst(src_dir), src_filter, nodes)
+    )
+    return [archive]
+
+
+@tracing.traced("scons")
+def ProcessArchiveCache(env):
+    if not _pending_libraries:
+        return
+    cache_dir = env.subst("$BUILD_ARCHIVE_CACHE_DIR")
+    while _pending_libraries:
+        lib_env, archive, variant_dir, src_dir, src_filter, nodes = (
+            _pending_libraries.pop(0)
+        )
+        key = _compute_archive_key(lib_env, src_dir, src_filter)
+        cache_path = os.path.join(cache_dir, key[:2], key + lib_env.subst("$LIBSUFFIX"))
+        if os.path.isfile(cache_path):
+            _stats["hits"] += 1
+            lib_env.Command(
+                archive,
+                cache_path,
+                lib_env.VerboseAction(_restore_archive, "Restoring $TARGET from cache"),
+            )
+            continue
+        _stats["misses"] += 1
+        nodes = nodes or lib_env.CollectBuildFiles(variant_dir, src_dir, src_filter)
+        lib_env.StaticLibrary(archive, nodes)
+        lib_env.AddPostAction(
+            archive,
+            lib_env.VerboseAction(_store_archive(cache_path), "Caching $TARGET"),
+        )
+    print(
+        "Library archive cache: %d hits, %d misses" % (_stats["hits"], _stats["misses"])
+    )
+
+
+def exists(_):
+    return True
+
+
+def generate(env):
+    env.AddMethod(BuildCachedLibrary)
+    env.AddMethod(ProcessArchiveCache)
+    return env
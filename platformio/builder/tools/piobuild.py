@@ -23,7 +23,7 @@ from SCons.Script import AlwaysBuild  # pylint: disable=import-error
 from SCons.Script import DefaultEnvironment  # pylint: disable=import-error
 from SCons.Script import SConscript  # pylint: disable=import-error
 
-from platformio import __version__, fs
+from platformio import __version__, fs, tracing
 from platformio.compat import IS_MACOS, string_types
 from platformio.package.version import pepver_to_semver
 from platformio.proc import where_is_program
@@ -57,6 +57,7 @@ def GetBuildType(env):
     return ", ".join(modes or ["release"])
 
 
+@tracing.traced("scons")
 def BuildProgram(env):
     env.ProcessProgramDeps()
     env.ProcessCompileDbToolchainOption()
@@ -159,6 +160,7 @@ def ProcessCompileDbIncludeToolchainOption(env):
     if "compiledbtc" in COMMAND_LINE_TARGETS:
         ProccessCompileDb(env, include_toolchain=True)
 
+@tracing.traced("scons")
 def ProcessProjectDeps(env):
     plb = env.ConfigureProjectLibBuilder()
 
@@ -340,6 +342,7 @@ def AddBuildMiddleware(env, callback, pattern=None):
     env.Append(__PIO_BUILD_MIDDLEWARES=[(callback, pattern)])
 
 
+@tracing.traced("scons")
 def BuildFrameworks(env, frameworks):
     if not frameworks:
         return
@@ -368,6 +371,13 @@ def BuildFrameworks(env, frameworks):
 
 def BuildLibrary(env, variant_dir, src_dir, src_filter=None, nodes=None):
     env.ProcessUnFlags(env.get("BUILD_UNFLAGS"))
+    if (
+        env.subst("$BUILD_ARCHIVE_CACHE_DIR")
+        # the compilation database and middlewares need the object files
+        and not env.get("__PIO_BUILD_MIDDLEWARES")
+        and not set(["compiledb", "compiledbtc"]) & set(COMMAND_LINE_TARGETS)
+    ):
+        return env.BuildCachedLibrary(variant_dir, src_dir, src_filter, nodes)
     nodes = nodes or env.CollectBuildFiles(variant_dir, src_dir, src_filter)
     return env.StaticLibrary(env.subst(variant_dir), nodes)
 
@@ -15,6 +15,7 @@
 # pylint: disable=too-many-instance-attributes, too-many-public-methods
 # pylint: disable=assignment-from-no-return, unused-argument, too-many-lines
 
+import collections
 import hashlib
 import io
 import os
@@ -22,11 +23,18 @@ import re
 import sys
 
 import click
+import SCons.Node.FS  # pylint: disable=import-error
 import SCons.Scanner  # pylint: disable=import-error
+import SCons.Warnings  # pylint: disable=import-error
 from SCons.Script import ARGUMENTS  # pylint: disable=import-error
 from SCons.Script import DefaultEnvironment  # pylint: disable=import-error
 
-from platformio import exception, fs
+from platformio import exception, fs, tracing
+from platformio.builder.ldf import (
+    LibBuilderIndex,
+    LibDependencyCache,
+    LibDependencyScanner,
+)
 from platformio.builder.tools import piobuild
 from platformio.compat import IS_WINDOWS, hashlib_encode_data, string_types
 from platformio.http import HTTPClientError, InternetConnectionError
@@ -140,7 +148,7 @@ class LibBuilderBase:
 
         self._deps_are_processed = False
         self._circular_deps = []
-        self._processed_search_files = []
+        self._processed_search_files = set()
 
         # pass a macro to the projenv + libs
         if "test" in env["BUILD_TYPE"]:
@@ -352,9 +360,7 @@ class LibBuilderBase:
             )
         ]
 
-    def get_implicit_includes(  # pylint: disable=too-many-branches
-        self, search_files=None
-    ):
+    def _get_search_include_dirs(self):
         # all include directories
         if not LibBuilderBase._INCLUDE_DIRS_CACHE:
             LibBuilderBase._INCLUDE_DIRS_CACHE = [
@@ -371,33 +377,65 @@ class LibBuilderBase:
         # append self include directories
         include_dirs = [self.env.Dir(d) for d in self.get_include_dirs()]
         include_dirs.extend(LibBuilderBase._INCLUDE_DIRS_CACHE)
+        return include_dirs
+
+    def get_implicit_includes(  # pylint: disable=too-many-branches, too-many-locals
+        self, search_files=None
+    ):
+        include_dirs = self._get_search_include_dirs()
+        ldf_cache = DefaultEnvironment().get("__PIO_LDF_CACHE")
+        ldf_cache_scope = None
+        if ldf_cache:
+            ldf_cache_scope = ldf_cache.make_scope(
+                self.lib_ldf_mode,
+                self.env.Flatten(self.env.subst("$CPPDEFINES")),
+                [d.get_abspath() for d in include_dirs],
+            )
 
         result = []
-        search_files = search_files or []
+        result_set = set()
+        search_files = collections.deque(search_files or [])
+        queued_files = set(search_files)
+        prescanned = {}
         while search_files:
-            node = self.env.File(search_files.pop(0))
+            node = self.env.File(search_files.popleft())
+            queued_files.discard(node.get_abspath())
             if node.get_abspath() in self._processed_search_files:
                 continue
-            self._processed_search_files.append(node.get_abspath())
-
-            try:
-                assert "+" in self.lib_ldf_mode
-                candidates = LibBuilderBase.CCONDITIONAL_SCANNER(
-                    node,
-                    self.env,
-                    tuple(include_dirs),
-                    depth=self.CCONDITIONAL_SCANNER_DEPTH,
-                )
+            self._processed_search_files.add(node.get_abspath())
 
-            except Exception as exc:  # pylint: disable=broad-except
-                if self.verbose and "+" in self.lib_ldf_mode:
-                    sys.stderr.write(
-                        "Warning! Classic Pre Processor is used for `%s`, "
-                        "advanced has failed with `%s`\n" % (node.get_abspath(), exc)
+            cached_candidates = (
+                ldf_cache.get_includes(ldf_cache_scope, node.get_abspath())
+                if ldf_cache
+                else None
+            )
+            if cached_candidates is not None:
+                candidates = [self.env.File(item) for item in cached_candidates]
+            else:
+                if node.get_abspath() not in prescanned:
+                    # pre-process the rest of the queue concurrently
+                    paths = [node.get_abspath()]
+                    for item in search_files:
+                        item_path = self.env.File(item).get_abspath()
+                        if (
+                            item_path not in prescanned
+                            and item_path not in self._processed_search_files
+                        ):
+                            paths.append(item_path)
+                    prescanned.update(
+                        self._prescan_includes(
+                            paths, include_dirs, ldf_cache, ldf_cache_scope
+                        )
+                    )
+                candidates = prescanned.pop(node.get_abspath(), None)
+                if candidates is None:
+                    candidates = self._scan_includes(node, include_dirs)
+                if ldf_cache:
+                    ldf_cache.set_includes(
+                        ldf_cache_scope,
+                        node.get_abspath(),
+                        [item.get_abspath() for item in candidates],
                     )
-                candidates = LibBuilderBase.CLASSIC_SCANNER(
-                    node, self.env, tuple(include_dirs)
-                )
 
             # print(node.get_abspath(), [c.get_abspath() for c in candidates])
             for item in candidates:
@@ -405,11 +443,13 @@ class LibBuilderBase:
                 # process internal files recursively
                 if (
                     item_path not in self._processed_search_files
-                    and item_path not in search_files
+                    and item_path not in queued_files
                     and item_path in self
                 ):
                     search_files.append(item_path)
-                if item not in result:
+                    queued_files.add(item_path)
+                if item not in result_set:
+                    result_set.add(item)
                     result.append(item)
                 if not self.PARSE_SRC_BY_H_NAME:
                     continue
@@ -420,11 +460,80 @@ class LibBuilderBase:
                     if not os.path.isfile("%s.%s" % (item_fname, ext)):
                         continue
                     item_c_node = self.env.File("%s.%s" % (item_fname, ext))
-                    if item_c_node not in result:
+                    if item_c_node not in result_set:
+                        result_set.add(item_c_node)
                         result.append(item_c_node)
 
         return result
 
+    def _prescan_includes(self, paths, include_dirs, ldf_cache, ldf_cache_scope):
+        """Returns a map of file paths to includes for the files which are
+        pre-processed in parallel. The other files are mapped to `None`
+        and scanned serially with `_scan_includes`."""
+        result = {path: None for path in paths}
+        ldf_scanner = DefaultEnvironment().get("__PIO_LDF_SCANNER")
+        if not ldf_scanner or "+" not in self.lib_ldf_mode:
+            return result
+        paths = [
+            path
+            for path in result
+            if not (
+                ldf_cache and ldf_cache.get_includes(ldf_cache_scope, path) is not None
+            )
+        ]
+        if not ldf_scanner.is_applicable(len(paths)):
+            return result
+        try:
+            scanned_items = ldf_scanner.scan(
+                paths,
+                [d.get_abspath() for d in include_dirs],
+                SCons.Scanner.C.dictify_CPPDEFINES(self.env),
+                self.CCONDITIONAL_SCANNER_DEPTH,
+            )
+        except Exception as exc:  # pylint: disable=broad-except
+            if self.verbose:
+                sys.stderr.write(
+                    "Warning! Parallel dependency scanning has failed with `%s`\n" % exc
+                )
+            return result
+        for path, includes, missing in scanned_items:
+            if includes is None:
+                continue
+            # a generated file is known only to SCons, scan serially
+            if any(
+                SCons.Node.FS.find_file(
+                    included,
+                    [self.env.Dir(os.path.dirname(includer))] + list(include_dirs),
+                )
+                for included, includer in missing
+            ):
+                continue
+            result[path] = [self.env.File(item) for item in includes]
+            for included, includer in missing:
+                SCons.Warnings.warn(
+                    SCons.Warnings.DependencyWarning,
+                    "No dependency generated for file: %s (included from: %s) "
+                    "-- file not found" % (included, includer),
+                )
+        return result
+
+    def _scan_includes(self, node, include_dirs):
+        try:
+            assert "+" in self.lib_ldf_mode
+            return LibBuilderBase.CCONDITIONAL_SCANNER(
+                node,
+                self.env,
+                tuple(include_dirs),
+                depth=self.CCONDITIONAL_SCANNER_DEPTH,
+            )
+        except Exception as exc:  # pylint: disable=broad-except
+            if self.verbose and "+" in self.lib_ldf_mode:
+                sys.stderr.write(
+                    "Warning! Classic Pre Processor is used for `%s`, "
+                    "advanced has failed with `%s`\n" % (node.get_abspath(), exc)
+                )
+            return LibBuilderBase.CLASSIC_SCANNER(node, self.env, tuple(include_dirs))
+
     def search_deps_recursive(self, search_files=None):
         self.process_dependencies()
 
@@ -435,26 +544,45 @@ class LibBuilderBase:
         if self.lib_ldf_mode.startswith("deep"):
             search_files = self.get_search_files()
 
+        lib_builders = self.env.GetLibBuilders()
+        lib_builders_order = {lb: i for i, lb in enumerate(lib_builders)}
+        # builders with a custom path matching are checked one by one
+        custom_lib_builders = [
+            lb
+            for lb in lib_builders
+            if type(lb).__contains__ is not LibBuilderBase.__contains__
+        ]
+        lib_builders_index = _get_lib_builders_index(
+            [lb for lb in lib_builders if lb not in custom_lib_builders]
+        )
         lib_inc_map = {}
         for inc in self.get_implicit_includes(search_files):
             inc_path = inc.get_abspath()
-            for lb in self.env.GetLibBuilders():
-                if inc_path in lb:
-                    if lb not in lib_inc_map:
-                        lib_inc_map[lb] = []
-                    lib_inc_map[lb].append(inc_path)
-                    break
+            owners = lib_builders_index.find(inc_path)
+            owners.extend(lb for lb in custom_lib_builders if inc_path in lb)
+            if not owners:
+                continue
+            # the first builder in the original order wins
+            lb = min(owners, key=lib_builders_order.get)
+            if lb not in lib_inc_map:
+                lib_inc_map[lb] = []
+            lib_inc_map[lb].append(inc_path)
 
         for lb, lb_search_files in lib_inc_map.items():
             self.depend_on(lb, search_files=lb_search_files)
 
     def depend_on(self, lb, search_files=None, recursive=True):
         def _already_depends(_lb):
-            if self in _lb.depbuilders:
-                return True
-            for __lb in _lb.depbuilders:
-                if _already_depends(__lb):
+            visited = set()
+            stack = [_lb]
+            while stack:
+                _lb = stack.pop()
+                if _lb in visited:
+                    continue
+                visited.add(_lb)
+                if self in _lb.depbuilders:
                     return True
+                stack.extend(_lb.depbuilders)
             return False
 
         # assert isinstance(lb, LibBuilderBase)
@@ -1141,6 +1269,119 @@ def GetLibBuilders(_):  # pylint: disable=too-many-branches
     return env["__PIO_LIB_BUILDERS"]
 
 
+def _get_lib_builders_index(lib_builders):
+    env = DefaultEnvironment()
+    index = env.get("__PIO_LIB_BUILDERS_INDEX")
+    if index is None or not index.is_actual(lib_builders):
+        index = LibBuilderIndex(lib_builders)
+        env.Replace(__PIO_LIB_BUILDERS_INDEX=index)
+    return index
+
+
+def _compute_ldf_fingerprint(env, project, lib_builders):
+    manifests = []
+    for lb in lib_builders:
+        for name in (
+            ".piopm",
+            "library.json",
+            "library.properties",
+            "module.json",
+            "library.yml",
+        ):
+            path = os.path.join(lb.path, name)
+            if os.path.isfile(path):
+                manifests.append((path, os.path.getmtime(path)))
+    return LibDependencyCache.compute_hash(
+        project.lib_ldf_mode,
+        project.lib_compat_mode,
+        project.dependencies,
+        env.GetProjectOption("lib_extra_dirs", []),
+        env.GetProjectOption("lib_ignore", []),
+        [lb.path for lb in lib_builders],
+        manifests,
+    )
+
+
+def _get_nested_dirs(path):
+    # a new file changes the modification time of its parent directory only
+    return [path] + [
+        os.path.join(root, name) for root, dirs, _ in os.walk(path) for name in dirs
+    ]
+
+
+def _store_deps_graph(ldf_cache, key, project, lib_builders):
+    deps = {}
+    circular_deps = {}
+    paths = []
+    for lb in [project] + lib_builders:
+        deps[lb.path] = [item.path for item in lb.depbuilders]
+        # pylint: disable=protected-access
+        circular_deps[lb.path] = [item.path for item in lb._circular_deps]
+        for path in dict.fromkeys(lb.get_include_dirs() + [lb.src_dir]):
+            paths.extend(_get_nested_dirs(path))
+    ldf_cache.set_graph(key, deps, circular_deps, paths)
+
+
+def _restore_deps_graph(project, lib_builders, graph):
+    if not graph:
+        return False
+    builders = {lb.path: lb for lb in lib_builders}
+    builders[project.path] = project
+    paths = list(graph["deps"].keys()) + [
+        path for items in graph["deps"].values() for path in items
+    ]
+    if set(paths) - set(builders.keys()):
+        return False
+    for path, items in graph["deps"].items():
+        builders[path].depbuilders = [builders[item] for item in items]
+        for item in items:
+            if builders[item] != builders[path]:
+                builders[item].is_dependent = True
+    for path, items in graph["circular_deps"].items():
+        lb = builders[path]
+        lb._circular_deps = [  # pylint: disable=protected-access
+            builders[item] for item in items if item in builders
+        ]
+        if lb.verbose:
+            for item in items:
+                sys.stderr.write(
+                    "Warning! Circular dependencies detected "
+                    "between `%s` and `%s`\n" % (path, item)
+                )
+    return True
+
+
+def _search_project_deps(env, project, lib_builders, correct_found_libs):
+    ldf_cache = LibDependencyCache(
+        env.subst(os.path.join("$BUILD_DIR", "ldfcache.json")),
+        _compute_ldf_fingerprint(env, project, lib_builders),
+    )
+    env.Replace(
+        __PIO_LDF_CACHE=ldf_cache,
+        __PIO_LDF_SCANNER=LibDependencyScanner(env.GetOption("num_jobs") or 1),
+    )
+    graph_key = LibDependencyCache.compute_hash(
+        env["BUILD_TYPE"],
+        env.get("PIOTEST_RUNNING_NAME"),
+        project.env.Flatten(project.env.subst("$CPPDEFINES")),
+        project.get_search_files(),
+    )
+    try:
+        if not _restore_deps_graph(
+            project, lib_builders, ldf_cache.get_graph(graph_key)
+        ):
+            project.search_deps_recursive()
+            # pylint: disable=no-member
+            ldf_mode = LibBuilderBase.lib_ldf_mode.fget(project)
+            if ldf_mode.startswith("chain") and project.depbuilders:
+                correct_found_libs(lib_builders)
+            _store_deps_graph(ldf_cache, graph_key, project, lib_builders)
+    finally:
+        env["__PIO_LDF_SCANNER"].close()
+    ldf_cache.save()
+
+
+@tracing.traced("scons")
 def ConfigureProjectLibBuilder(env):
     _pm_storage = {}
 
@@ -1208,10 +1449,7 @@ def ConfigureProjectLibBuilder(env):
     click.echo("Found %d compatible libraries" % len(lib_builders))
 
     click.echo("Scanning dependencies...")
-    project.search_deps_recursive()
-
-    if ldf_mode.startswith("chain") and project.depbuilders:
-        _correct_found_libs(lib_builders)
+    _search_project_deps(env, project, lib_builders, _correct_found_libs)
 
     if project.depbuilders:
         click.echo("Dependency Graph")
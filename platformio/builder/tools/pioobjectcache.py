@@ -0,0 +1,328 @@
+# Copyright (c) 2014-present PlatformIO <contact@platformio.org>
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""
+The content-addressed cache of the object files (`build_cache_mode = content`).
+
+It works as a compiler wrapper on top of SCons `SPAWN`, similar to "ccache".
+The key of an object file is computed from the preprocessed source and the
+compiler flags, where the project, the build and the packages locations are
+replaced with placeholders. So the objects are shared between the build
+environments and the checkouts of a project in different directories.
+
+The absolute paths embedded into the objects (the debugging information,
+`__FILE__`) point to the location of the first build, and the compiler
+warnings are not repeated for the objects restored from cache.
+"""
+
+import atexit
+import hashlib
+import os
+import re
+import shlex
+import shutil
+import sys
+import tempfile
+import threading
+
+from platformio.builder.tools.pioarchivecache import (
+    get_base_dirs,
+    get_program_fingerprint,
+    normalize_paths,
+)
+
+OBJECT_CACHE_VERSION = 1
+OBJECT_CACHE_SRC_EXT = ("c", "cc", "cpp", "cxx", "c++", "S", "spp", "SPP", "sx")
+# the options which produce the extra outputs or depend on the runtime data
+OBJECT_CACHE_UNSUPPORTED_FLAGS = re.compile(
+    r"^(-M|-E$|-S$|-save-temps|--coverage|-fprofile-|-ftest-coverage|-fauto-profile)"
+)
+
+
+class ObjectCache:
+    """The local storage with LRU eviction and the optional HTTP storage,
+    `GET` and `PUT` of `<url>/<key>` (a shared cache of the team or CI)"""
+
+    def __init__(self, cache_dir=None, url=None, max_size=None):
+        self.cache_dir = cache_dir
+        self.url = url.rstrip("/") + "/" if url else None
+        self.max_size = max_size
+        self.stats = dict(hits=0, remote_hits=0, misses=0, stored=0)
+        self._lock = threading.Lock()
+        self._local = threading.local()
+
+    def _update_stats(self, name):
+        with self._lock:
+            self.stats[name] += 1
+
+    def get_local_path(self, key):
+        return os.path.join(self.cache_dir, key[:2], key + ".o")
+
+    def get(self, key, dst_path):
+        if self.cache_dir and self._get_local(key, dst_path):
+            self._update_stats("hits")
+            return True
+        data = self._request("get", key) if self.url else None
+        if data is not None:
+            with open(dst_path, "wb") as fp:
+                fp.write(data)
+            if self.cache_dir:
+                self._put_local(key, dst_path)
+            self._update_stats("remote_hits")
+            return True
+        self._update_stats("misses")
+        return False
+
+    def put(self, key, src_path):
+        if self.cache_dir:
+            self._put_local(key, src_path)
+        if self.url:
+            with open(src_path, "rb") as fp:
+                self._request("put", key, fp.read())
+        self._update_stats("stored")
+
+    def _get_local(self, key, dst_path):
+        path = self.get_local_path(key)
+        try:
+            shutil.copyfile(path, dst_path)
+            # the recently used objects are evicted last
+            os.utime(path)
+        except OSError:  # not found or evicted by another build
+            return False
+        return True
+
+    def _put_local(self, key, src_path):
+        path = self.get_local_path(key)
+        if not os.path.isdir(os.path.dirname(path)):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+        # an atomic replace, the cache is shared between the concurrent builds
+        tmp_path = "%s.%d.%d.tmp" % (path, os.getpid(), threading.get_ident())
+        shutil.copyfile(src_path, tmp_path)
+        os.replace(tmp_path, path)
+
+    def _request(self, method, key, data=None):
+        if not self.url:
+            return None
+        # pylint: disable=import-outside-toplevel
+        import requests
+
+        from platformio.http import HTTPSession
+
+        if not hasattr(self._local, "session"):
+            self._local.session = HTTPSession(x_base_url=self.url)
+        try:
+            if method == "put":
+                self._local.session.put(key, data=data).raise_for_status()
+                return None
+            response = self._local.session.get(key)
+            if response.status_code == 404:
+                return None
+            response.raise_for_status()
+            return response.content
+        except requests.exceptions.RequestException as exc:
+            # the remote storage is not used till the end of build
+            if self.url:
+                self.url = None
+                sys.stderr.write(
+                    "Warning! Remote build cache is not available: %s\n" % exc
+                )
+        return None
+
+    def cleanup(self):
+        """Evicts the least recently used objects when the local storage
+        exceeds `max_size`"""
+        if not self.cache_dir or not self.max_size or not self.stats["stored"]:
+            return
+        items = []
+        total_size = 0
+        for root, _, files in os.walk(self.cache_dir):
+            for name in files:
+                path = os.path.join(root, name)
+                try:
+                    stat = os.stat(path)
+                except OSError:
+                    continue
+                total_size += stat.st_size
+                items.append((stat.st_mtime, stat.st_size, path))
+        if total_size <= self.max_size:
+            return
+        for _, size, path in sorted(items):
+            try:
+                os.remove(path)
+            except OSError:
+                continue
+            total_size -= size
+            if total_size <= self.max_size:
+                break
+
+
+def parse_cache_size(value):
+    match = re.match(r"^\s*(\d+(?:\.\d+)?)\s*([KMGT]?)i?B?\s*$", str(value), re.I)
+    if not match:
+        raise ValueError("Invalid cache size `%s`, e.g. 500MB or 5GB" % value)
+    return int(
+        float(match.group(1)) * 1024 ** " KMGT".index(match.group(2).upper() or " ")
+    )
+
+
+def _expand_response_files(args):
+    result = []
+    for arg in args:
+        path = arg[1:].strip("\"'") if arg.startswith("@") else None
+        if path and os.path.isfile(path):
+            with open(path, encoding="utf8") as fp:
+                result.extend(shlex.split(fp.read()))
+        else:
+            result.append(arg)
+    return result
+
+
+def _parse_compile_command(args):
+    """Returns the arguments, the output and the source of the compile
+    command, or None when the command is not cacheable"""
+    args = _expand_response_files(args)
+    if "-c" not in args or "-o" not in args[:-1]:
+        return None
+    if any(OBJECT_CACHE_UNSUPPORTED_FLAGS.match(arg) for arg in args[1:]):
+        return None
+    output = args[args.index("-o") + 1]
+    sources = [
+        arg
+        for arg in args[1:]
+        if arg != output
+        and not arg.startswith("-")
+        and arg.rsplit(".", 1)[-1] in OBJECT_CACHE_SRC_EXT
+    ]
+    if len(sources) != 1:
+        return None
+    return args, output, sources[0]
+
+
+def _write_response_file(args):
+    fd, path = tempfile.mkstemp(prefix="pio-objcache-", suffix=".tmp")
+    with os.fdopen(fd, mode="w", encoding="utf8") as fp:
+        fp.write(
+            " ".join(
+                '"%s"' % arg.replace("\\", "\\\\").replace('"', '\\"') for arg in args
+            )
+        )
+    return path
+
+
+def _preprocess(run, args, use_response_file):
+    """Runs the preprocessor with the same compiler, flags and shell, `run`
+    spawns the command with the redirected output"""
+    args = list(args)
+    index = args.index("-o")
+    del args[index : index + 2]
+    args[args.index("-c")] = "-E"
+    response_path = None
+    if use_response_file:
+        response_path = _write_response_file(args[1:])
+        args = [args[0], "@" + response_path]
+    try:
+        with tempfile.TemporaryFile(
+            mode="w+", encoding="utf8", errors="surrogateescape"
+        ) as stdout, tempfile.TemporaryFile(mode="w+") as stderr:
+            if run(args, stdout, stderr) != 0:
+                return None
+            stdout.seek(0)
+            return stdout.read()
+    finally:
+        if response_path:
+            os.remove(response_path)
+
+
+def _compute_object_key(run, args, envpath, base_dirs):
+    """Returns the key and the output of the compile command"""
+    command = _parse_compile_command(args)
+    if not command:
+        return None
+    cmd_args, output, _ = command
+    data = _preprocess(
+        run, cmd_args, use_response_file=any(arg.startswith("@") for arg in args)
+    )
+    if data is None:
+        return None
+    h = hashlib.sha1()
+    for value in [
+        OBJECT_CACHE_VERSION,
+        get_program_fingerprint(cmd_args[0], envpath),
+    ] + [arg for arg in cmd_args[1:] if arg != output]:
+        h.update(normalize_paths(str(value), base_dirs).encode("utf8"))
+        h.update(b"\0")
+    h.update(normalize_paths(data, base_dirs).encode("utf8", errors="surrogateescape"))
+    return h.hexdigest(), output
+
+
+def _object_cache_spawn(spawn, pspawn, cache, base_dirs):
+    def _spawn(sh, escape, cmd, args, env):
+        def _run(pp_args, stdout, stderr):
+            return pspawn(sh, escape, pp_args[0], pp_args, env, stdout, stderr)
+
+        result = _compute_object_key(_run, args, env.get("PATH"), base_dirs)
+        if not result:
+            return spawn(sh, escape, cmd, args, env)
+        key, output = result
+        if cache.get(key, output):
+            return 0
+        returncode = spawn(sh, escape, cmd, args, env)
+        if returncode == 0 and os.path.isfile(output):
+            cache.put(key, output)
+        return returncode
+
+    return _spawn
+
+
+def _print_stats(cache):
+    cache.cleanup()
+    stats = cache.stats
+    if not any(stats.values()):
+        return
+    print(
+        "Object cache: %d hits (%d remote), %d misses"
+        % (stats["hits"] + stats["remote_hits"], stats["remote_hits"], stats["misses"])
+    )
+
+
+def ConfigureObjectCache(env):
+    """Enables the content-addressed cache of the object files in the local
+    `$BUILD_CACHE_DIR` and the remote `$BUILD_CACHE_URL` storages"""
+    try:
+        max_size = parse_cache_size(env.subst("$BUILD_CACHE_SIZE"))
+    except ValueError as exc:
+        sys.stderr.write("Error: %s\n" % exc)
+        env.Exit(1)
+    cache_dir = env.subst("$BUILD_CACHE_DIR") or os.path.join(
+        env.GetProjectConfig().get("platformio", "cache_dir"), "build"
+    )
+    cache = ObjectCache(cache_dir, env.subst("$BUILD_CACHE_URL") or None, max_size)
+    base_dirs = get_base_dirs(env)
+    # the paths are escaped in the preprocessor line markers on Windows
+    base_dirs.extend(
+        (name, path.replace("\\", "\\\\")) for name, path in base_dirs if "\\" in path
+    )
+    atexit.register(_print_stats, cache)
+    env.Replace(
+        SPAWN=_object_cache_spawn(env["SPAWN"], env["PSPAWN"], cache, base_dirs)
+    )
+
+
+def exists(_):
+    return True
+
+
+def generate(env):
+    env.AddMethod(ConfigureObjectCache)
+    return env
@@ -19,7 +19,7 @@ from SCons.Script import ARGUMENTS  # pylint: disable=import-error
 from SCons.Script import COMMAND_LINE_TARGETS  # pylint: disable=import-error
 from SCons.Script import DefaultEnvironment  # pylint: disable=import-error
 
-from platformio import fs, util
+from platformio import fs, tracing, util
 from platformio.compat import IS_MACOS, IS_WINDOWS
 from platformio.package.meta import PackageItem
 from platformio.package.version import get_original_version
@@ -62,6 +62,7 @@ def GetFrameworkScript(env, framework):
     return script_path
 
 
+@tracing.traced("scons")
 def LoadPioPlatform(env):
     p = env.PioPlatform()
 
@@ -12,6 +12,7 @@
 # See the License for the specific language governing permissions and
 # limitations under the License.
 
+from platformio import tracing
 from platformio.compat import MISSING
 from platformio.project.config import ProjectConfig
 
@@ -28,6 +29,7 @@ def GetProjectOption(env, option, default=MISSING):
     return env.GetProjectConfig().get("env:" + env["PIOENV"], option, default)
 
 
+@tracing.traced("scons")
 def LoadProjectOptions(env):
     config = env.GetProjectConfig()
     section = "env:" + env["PIOENV"]
@@ -14,17 +14,88 @@
 
 # pylint: disable=too-many-locals
 
+import hashlib
 import json
+import struct
 import sys
-from os import environ, makedirs, remove
-from os.path import isdir, join, splitdrive
+from array import array
+from bisect import bisect_right
+from os import environ, getpid, makedirs, remove, replace
+from os.path import isdir, isfile, join, splitdrive
 
+from elftools.common.exceptions import DWARFError, ELFError, ELFParseError
 from elftools.elf.descriptions import describe_sh_flags
 from elftools.elf.elffile import ELFFile
+from elftools.elf.enums import ENUM_ST_INFO_BIND, ENUM_ST_INFO_TYPE
 
+from platformio import fs, tracing
 from platformio.compat import IS_WINDOWS
 from platformio.proc import exec_command
 
+SIZEDATA_CACHE_VERSION = 1
+SYMBOL_TYPES = {v: k for k, v in ENUM_ST_INFO_TYPE.items() if isinstance(v, int)}
+SYMBOL_BINDS = {v: k for k, v in ENUM_ST_INFO_BIND.items() if isinstance(v, int)}
+
+# the sizes of the values of the DWARF attribute forms
+DWARF_FORM_SIZES = {
+    "DW_FORM_flag_present": 0,
+    "DW_FORM_implicit_const": 0,
+    "DW_FORM_data1": 1,
+    "DW_FORM_ref1": 1,
+    "DW_FORM_flag": 1,
+    "DW_FORM_strx1": 1,
+    "DW_FORM_addrx1": 1,
+    "DW_FORM_data2": 2,
+    "DW_FORM_ref2": 2,
+    "DW_FORM_strx2": 2,
+    "DW_FORM_addrx2": 2,
+    "DW_FORM_strx3": 3,
+    "DW_FORM_addrx3": 3,
+    "DW_FORM_data4": 4,
+    "DW_FORM_ref4": 4,
+    "DW_FORM_strx4": 4,
+    "DW_FORM_addrx4": 4,
+    "DW_FORM_ref_sup4": 4,
+    "DW_FORM_data8": 8,
+    "DW_FORM_ref8": 8,
+    "DW_FORM_ref_sig8": 8,
+    "DW_FORM_ref_sup8": 8,
+    "DW_FORM_data16": 16,
+}
+DWARF_OFFSET_FORMS = (
+    "DW_FORM_ref_addr",
+    "DW_FORM_strp",
+    "DW_FORM_line_strp",
+    "DW_FORM_sec_offset",
+    "DW_FORM_strp_sup",
+    "DW_FORM_GNU_strp_alt",
+    "DW_FORM_GNU_ref_alt",
+)
+DWARF_LEB128_FORMS = (
+    "DW_FORM_sdata",
+    "DW_FORM_udata",
+    "DW_FORM_ref_udata",
+    "DW_FORM_strx",
+    "DW_FORM_addrx",
+    "DW_FORM_loclistx",
+    "DW_FORM_rnglistx",
+    "DW_FORM_GNU_addr_index",
+    "DW_FORM_GNU_str_index",
+)
+DWARF_UNIT_REF_FORMS = (
+    "DW_FORM_ref1",
+    "DW_FORM_ref2",
+    "DW_FORM_ref4",
+    "DW_FORM_ref8",
+    "DW_FORM_ref_udata",
+)
+# the sizes of the lengths of the blocks
+DWARF_BLOCK_FORMS = {
+    "DW_FORM_block1": (1,),
+    "DW_FORM_block2": (2,),
+    "DW_FORM_block4": (4,),
+}
+
 
 def _run_tool(cmd, env, tool_args):
     sysenv = environ.copy()
@@ -99,6 +170,462 @@ def _collect_sections_info(env, elffile):
 
 
 def _collect_symbols_info(env, elffile, elf_path, sections):
+    """Returns the cached symbols of the ELF file or collects them
+    in-process and caches by the hash of the ELF file"""
+    cache_path = join(env.subst("$BUILD_DIR"), "sizedata-cache.json")
+    cache_key = hashlib.sha1(
+        (
+            fs.calculate_file_hashsum("sha1", elf_path)
+            + json.dumps(sections, sort_keys=True)
+        ).encode()
+    ).hexdigest()
+    try:
+        with open(cache_path, encoding="utf8") as fp:
+            data = json.load(fp)
+        if data["version"] == SIZEDATA_CACHE_VERSION and data["key"] == cache_key:
+            return data["symbols"]
+    except (OSError, ValueError, KeyError):
+        pass
+
+    try:
+        symbols = _collect_symbols_info_in_process(env, elffile, sections)
+    except (DWARFError, ELFError, ELFParseError) as exc:
+        sys.stderr.write("Warning! Could not parse ELF file: %s\n" % exc)
+        return _collect_symbols_info_with_tools(env, elffile, elf_path, sections)
+
+    # the cache is optional, e.g. the build directory is not writable
+    tmp_path = "%s.%d.tmp" % (cache_path, getpid())
+    try:
+        with open(tmp_path, mode="w", encoding="utf8") as fp:
+            json.dump(
+                dict(version=SIZEDATA_CACHE_VERSION, key=cache_key, symbols=symbols),
+                fp,
+            )
+        replace(tmp_path, cache_path)
+    except OSError:
+        if isfile(tmp_path):
+            remove(tmp_path)
+    return symbols
+
+
+def _collect_symbols_info_in_process(env, elffile, sections):
+    symtab = _parse_symbol_table(elffile)
+    if symtab is None:
+        sys.stderr.write("Couldn't find symbol table. Is ELF file stripped?")
+        env.Exit(1)
+    names, addrs, sizes, infos = symtab
+    determine_section = _get_section_resolver(env, sections)
+
+    symbols = []
+    mangled_names = []
+    for name, symbol_addr, symbol_size, symbol_info in zip(names, addrs, sizes, infos):
+        symbol_type = SYMBOL_TYPES.get(symbol_info & 0xF, symbol_info & 0xF)
+        if not env.pioSizeIsValidSymbol(name, symbol_type, symbol_addr):
+            continue
+        symbols.append(
+            {
+                "addr": symbol_addr,
+                "bind": SYMBOL_BINDS.get(symbol_info >> 4, symbol_info >> 4),
+                "name": name,
+                "type": symbol_type,
+                "size": symbol_size,
+                "section": determine_section(symbol_addr),
+            }
+        )
+        if name.startswith("_Z"):
+            mangled_names.append(name)
+
+    locate = _get_line_resolver(elffile)
+    demangled_names = _get_demangled_names(env, mangled_names)
+    variable_locations = None
+    for symbol in symbols:
+        if symbol["name"].startswith("_Z"):
+            symbol["demangled_name"] = demangled_names.get(symbol["name"])
+        location = locate(symbol["addr"])
+        # the variables are not present in the line programs
+        if not location and symbol["type"] == "STT_OBJECT":
+            if variable_locations is None:
+                variable_locations = _get_variable_locations(elffile)
+            location = variable_locations.get(symbol["addr"])
+        if location:
+            _set_symbol_location(symbol, "%s:%d" % location)
+    return symbols
+
+
+def _parse_symbol_table(elffile):
+    """Returns the names, addresses, sizes and infos of the symbols
+    as the columns, the raw entries are unpacked at once"""
+    symtab = elffile.get_section_by_name(".symtab")
+    if not symtab or symtab.is_null():
+        return None
+    strtab = elffile.get_section(symtab["sh_link"]).data()
+    byteorder = "<" if elffile.little_endian else ">"
+    if elffile.elfclass == 32:
+        entries = struct.iter_unpack(byteorder + "IIIBBH", symtab.data())
+        columns = ((e[0], e[1], e[2], e[3]) for e in entries)
+    else:
+        entries = struct.iter_unpack(byteorder + "IBBHQQ", symtab.data())
+        columns = ((e[0], e[4], e[5], e[1]) for e in entries)
+    name_offsets, addrs, sizes, infos = (
+        array("L"),
+        array("Q"),
+        array("Q"),
+        array("B"),
+    )
+    for name_offset, addr, size, info in columns:
+        name_offsets.append(name_offset)
+        addrs.append(addr)
+        sizes.append(size)
+        infos.append(info)
+    names = [
+        (
+            strtab[offset : strtab.index(b"\0", offset)].decode("utf-8", "replace")
+            if offset
+            else ""
+        )
+        for offset in name_offsets
+    ]
+    return names, addrs, sizes, infos
+
+
+def _get_section_resolver(env, sections):
+    """Returns the function which maps an address to the section name"""
+    if getattr(env.pioSizeDetermineSection, "method", None) is not (
+        pioSizeDetermineSection
+    ):
+        # the method is overridden by the development platform
+        return lambda addr: env.pioSizeDetermineSection(sections, addr)
+
+    # the sections can overlap, the first one wins as in `pioSizeDetermineSection`
+    intervals = [
+        (info["start_addr"], info["start_addr"] + info["size"], name)
+        for name, info in sections.items()
+        if (info.get("in_flash", False) or info.get("in_ram", False)) and info["size"]
+    ]
+    bounds = sorted(set(b for start, end, _ in intervals for b in (start, end)))
+    owners = []
+    for bound in bounds:
+        owners.append(
+            next(
+                (name for start, end, name in intervals if start <= bound < end),
+                "unknown",
+            )
+        )
+
+    def _resolve(addr):
+        index = bisect_right(bounds, addr) - 1
+        return owners[index] if index >= 0 else "unknown"
+
+    return _resolve
+
+
+def _get_line_resolver(elffile):
+    """Decodes the line programs of DWARF `.debug_line` in one pass and returns
+    the function which maps an address to the source file and line"""
+    if not elffile.has_dwarf_info():
+        return lambda _: None
+    starts, ends, lines = array("Q"), array("Q"), array("L")
+    files = []
+    dwarfinfo = elffile.get_dwarf_info()
+    if not dwarfinfo.debug_line_sec:
+        return lambda _: None
+    stream = dwarfinfo.debug_line_sec.stream
+    stream.seek(0)
+    data = stream.read()
+    byteorder = "little" if elffile.little_endian else "big"
+    for cu in dwarfinfo.iter_CUs():
+        lineprog = dwarfinfo.line_program_for_CU(cu)
+        if not lineprog:
+            continue
+        paths = _get_line_program_paths(cu, lineprog)
+        prev_address, prev_file, prev_line = None, 0, 0
+        for address, file_index, line, end_sequence in _iter_line_program_rows(
+            data, lineprog, byteorder
+        ):
+            if prev_address is not None and address > prev_address:
+                starts.append(prev_address)
+                ends.append(address)
+                lines.append(prev_line)
+                files.append(paths[prev_file] if prev_file < len(paths) else None)
+            prev_address = None if end_sequence else address
+            prev_file, prev_line = file_index, line
+
+    order = sorted(range(len(starts)), key=starts.__getitem__)
+    starts = array("Q", (starts[i] for i in order))
+    ends = array("Q", (ends[i] for i in order))
+    lines = array("L", (lines[i] for i in order))
+    files = [files[i] for i in order]
+
+    def _resolve(addr):
+        index = bisect_right(starts, addr) - 1
+        # the sequences of the discarded code can overlap
+        for i in range(index, max(index - 32, -1), -1):
+            if starts[i] <= addr < ends[i]:
+                return (files[i], lines[i]) if files[i] and lines[i] else None
+        return None
+
+    return _resolve
+
+
+def _iter_line_program_rows(
+    data, lineprog, byteorder
+):  # pylint: disable=too-many-branches
+    """Generates the (address, file, line, end_sequence) rows of the line
+    program, the header is decoded by `pyelftools`"""
+    header = lineprog.header
+    min_length = header["minimum_instruction_length"]
+    line_base = header["line_base"]
+    line_range = header["line_range"]
+    opcode_base = header["opcode_base"]
+    opcode_lengths = header["standard_opcode_lengths"]
+    address, file_index, line = 0, 1, 1
+    pos = lineprog.program_start_offset
+    end = lineprog.program_end_offset
+    while pos < end:
+        opcode = data[pos]
+        pos += 1
+        if opcode >= opcode_base:  # special opcode
+            opcode -= opcode_base
+            address += (opcode // line_range) * min_length
+            line += line_base + opcode % line_range
+            yield address, file_index, line, False
+        elif opcode == 0:  # extended opcode
+            length, pos = _read_uleb128(data, pos)
+            if data[pos] == 0x01:  # DW_LNE_end_sequence
+                yield address, file_index, line, True
+                address, file_index, line = 0, 1, 1
+            elif data[pos] == 0x02:  # DW_LNE_set_address
+                address = int.from_bytes(data[pos + 1 : pos + length], byteorder)
+            pos += length
+        elif opcode == 0x01:  # DW_LNS_copy
+            yield address, file_index, line, False
+        elif opcode == 0x02:  # DW_LNS_advance_pc
+            value, pos = _read_uleb128(data, pos)
+            address += value * min_length
+        elif opcode == 0x03:  # DW_LNS_advance_line
+            value, pos = _read_sleb128(data, pos)
+            line += value
+        elif opcode == 0x04:  # DW_LNS_set_file
+            file_index, pos = _read_uleb128(data, pos)
+        elif opcode == 0x08:  # DW_LNS_const_add_pc
+            address += ((255 - opcode_base) // line_range) * min_length
+        elif opcode == 0x09:  # DW_LNS_fixed_advance_pc
+            address += int.from_bytes(data[pos : pos + 2], byteorder)
+            pos += 2
+        else:  # skip the operands
+            for _ in range(opcode_lengths[opcode - 1]):
+                _, pos = _read_uleb128(data, pos)
+
+
+def _get_variable_locations(elffile):
+    """Maps the static addresses of the variables to their declarations.
+    The `.debug_info` is walked directly, only the variables are decoded"""
+    result = {}
+    if not elffile.has_dwarf_info():
+        return result
+    dwarfinfo = elffile.get_dwarf_info()
+    stream = dwarfinfo.debug_info_sec.stream
+    stream.seek(0)
+    data = stream.read()
+    byteorder = "little" if elffile.little_endian else "big"
+    for cu in dwarfinfo.iter_CUs():
+        lineprog = dwarfinfo.line_program_for_CU(cu)
+        paths = _get_line_program_paths(cu, lineprog) if lineprog else []
+        abbrevs = _DwarfAbbrevs(cu)
+        specifications = []
+        pos = cu.cu_die_offset
+        end = cu.cu_offset + cu.size
+        while pos < end:
+            code, pos = _read_uleb128(data, pos)
+            if not code:
+                continue
+            tag, attr_specs, plan = abbrevs[code]
+            if tag != "DW_TAG_variable":
+                pos = _skip_dwarf_values(data, pos, plan)
+                continue
+            attrs, pos = _read_dwarf_attrs(data, pos, attr_specs, byteorder)
+            location = attrs.get("DW_AT_location")
+            # the single `DW_OP_addr` operation
+            if (
+                not isinstance(location, bytes)
+                or len(location) != cu["address_size"] + 1
+                or location[0] != 0x03
+            ):
+                continue
+            addr = int.from_bytes(location[1:], byteorder)
+            if "DW_AT_decl_file" in attrs:
+                _add_variable_location(result, paths, addr, attrs)
+            elif "DW_AT_specification" in attrs:
+                specifications.append((addr, attrs))
+        # the definitions inherit the location from the declarations
+        for addr, attrs in specifications:
+            offset = attrs["DW_AT_specification"]
+            if cu.cu_die_offset <= offset < end:
+                code, pos = _read_uleb128(data, offset)
+                decl_attrs, _ = _read_dwarf_attrs(
+                    data, pos, abbrevs[code][1], byteorder
+                )
+                decl_attrs.update(attrs)
+                _add_variable_location(result, paths, addr, decl_attrs)
+    return result
+
+
+def _add_variable_location(result, paths, addr, attrs):
+    file_index = attrs.get("DW_AT_decl_file")
+    line = attrs.get("DW_AT_decl_line")
+    if (
+        addr not in result
+        and line
+        and isinstance(file_index, int)
+        and file_index < len(paths)
+        and paths[file_index]
+    ):
+        result[addr] = (paths[file_index], line)
+
+
+class _DwarfAbbrevs(dict):
+    """The abbreviations of the unit with the precomputed sizes of the
+    attribute values, the unit-relative references are made absolute"""
+
+    def __init__(self, cu):
+        super().__init__()
+        self.cu = cu
+        self.table = cu.get_abbrev_table()
+
+    def __missing__(self, code):
+        abbrev = self.table.get_abbrev(code)
+        unit = dict(
+            address_size=self.cu["address_size"],
+            offset_size=self.cu.structs.dwarf_format // 8,
+            version=self.cu["version"],
+        )
+        attr_specs = []
+        plan = []
+        for spec in abbrev["attr_spec"]:
+            step = _get_dwarf_form_step(spec.form, unit)
+            base = self.cu.cu_offset if spec.form in DWARF_UNIT_REF_FORMS else 0
+            attr_specs.append((spec.name, step, base, getattr(spec, "value", None)))
+            # merge the fixed sizes
+            if plan and isinstance(step, int) and isinstance(plan[-1], int):
+                plan[-1] += step
+            else:
+                plan.append(step)
+        self[code] = (abbrev["tag"], attr_specs, plan)
+        return self[code]
+
+
+def _read_dwarf_attrs(data, pos, attr_specs, byteorder):
+    attrs = {}
+    for name, step, base, implicit_value in attr_specs:
+        value, pos = _read_dwarf_value(data, pos, step, byteorder)
+        if value is None:
+            value = implicit_value
+        elif base:
+            value += base
+        attrs[name] = value
+    return attrs, pos
+
+
+def _get_dwarf_form_step(form, unit):
+    if form in DWARF_FORM_SIZES:
+        return DWARF_FORM_SIZES[form]
+    if form == "DW_FORM_addr" or (form == "DW_FORM_ref_addr" and unit["version"] == 2):
+        return unit["address_size"]
+    if form in DWARF_OFFSET_FORMS:
+        return unit["offset_size"]
+    if form in ("DW_FORM_string", "DW_FORM_block", "DW_FORM_exprloc"):
+        return form
+    if form in DWARF_LEB128_FORMS:
+        return "leb128"
+    if form in DWARF_BLOCK_FORMS:
+        return DWARF_BLOCK_FORMS[form]
+    raise DWARFError("Unsupported DWARF form %s" % form)
+
+
+def _skip_dwarf_values(data, pos, plan):
+    for step in plan:
+        if isinstance(step, int):
+            pos += step
+        elif step == "leb128":
+            while data[pos] & 0x80:
+                pos += 1
+            pos += 1
+        elif step == "DW_FORM_string":
+            pos = data.index(b"\0", pos) + 1
+        else:
+            _, pos = _read_dwarf_value(data, pos, step, "little")
+    return pos
+
+
+def _read_dwarf_value(data, pos, step, byteorder):
+    """Returns the integer value or the bytes of the block"""
+    if isinstance(step, int):
+        if not step:
+            return None, pos
+        return int.from_bytes(data[pos : pos + step], byteorder), pos + step
+    if step == "leb128":
+        return _read_uleb128(data, pos)
+    if step == "DW_FORM_string":
+        end = data.index(b"\0", pos)
+        return data[pos:end], end + 1
+    if isinstance(step, tuple):  # the length of the block is fixed-size
+        length = int.from_bytes(data[pos : pos + step[0]], byteorder)
+        pos += step[0]
+    else:
+        length, pos = _read_uleb128(data, pos)
+    return data[pos : pos + length], pos + length
+
+
+def _read_uleb128(data, pos):
+    result = 0
+    shift = 0
+    while True:
+        byte = data[pos]
+        pos += 1
+        result |= (byte & 0x7F) << shift
+        if byte < 0x80:
+            return result, pos
+        shift += 7
+
+
+def _read_sleb128(data, pos):
+    result, end = _read_uleb128(data, pos)
+    bits = 7 * (end - pos)
+    if data[end - 1] & 0x40:
+        result -= 1 << bits
+    return result, end
+
+
+def _get_line_program_paths(cu, lineprog):
+    top_die = cu.get_top_DIE()
+    comp_dir = ""
+    if "DW_AT_comp_dir" in top_die.attributes:
+        comp_dir = _decode_dwarf_str(top_die.attributes["DW_AT_comp_dir"].value)
+    version = lineprog.header["version"]
+    dirs = [_decode_dwarf_str(d) for d in lineprog.header["include_directory"]]
+    # the file and directory indexes are 1-based before DWARF 5
+    if version < 5:
+        dirs.insert(0, comp_dir)
+    paths = [] if version >= 5 else [None]
+    for entry in lineprog.header["file_entry"]:
+        dir_index = entry.dir_index
+        paths.append(
+            join(
+                comp_dir,
+                dirs[dir_index] if dir_index < len(dirs) else "",
+                _decode_dwarf_str(entry.name),
+            )
+        )
+    return paths
+
+
+def _decode_dwarf_str(value):
+    return value.decode("utf-8", "replace") if isinstance(value, bytes) else value
+
+
+def _collect_symbols_info_with_tools(env, elffile, elf_path, sections):
+    """The symbols are located with `addr2line` tool of the toolchain,
+    it is used if the ELF file can not be processed in-process"""
     symbols = []
 
     symbol_section = elffile.get_section_by_name(".symtab")
@@ -140,22 +667,25 @@ def _collect_symbols_info(env, elffile, elf_path, sections):
     for symbol in symbols:
         if symbol["name"].startswith("_Z"):
             symbol["demangled_name"] = demangled_names.get(symbol["name"])
-        location = symbol_locations.get(hex(symbol["addr"]))
-        if not location or "?" in location:
-            continue
-        if IS_WINDOWS:
-            drive, tail = splitdrive(location)
-            location = join(drive.upper(), tail)
-        symbol["file"] = location
-        symbol["line"] = 0
-        if ":" in location:
-            file_, line = location.rsplit(":", 1)
-            if line.isdigit():
-                symbol["file"] = file_
-                symbol["line"] = int(line)
+        _set_symbol_location(symbol, symbol_locations.get(hex(symbol["addr"])))
     return symbols
 
 
+def _set_symbol_location(symbol, location):
+    if not location or "?" in location:
+        return
+    if IS_WINDOWS:
+        drive, tail = splitdrive(location)
+        location = join(drive.upper(), tail)
+    symbol["file"] = location
+    symbol["line"] = 0
+    if ":" in location:
+        file_, line = location.rsplit(":", 1)
+        if line.isdigit():
+            symbol["file"] = file_
+            symbol["line"] = int(line)
+
+
 def pioSizeDetermineSection(_, sections, symbol_addr):
     for section, info in sections.items():
         if not info.get("in_flash", False) and not info.get("in_ram", False):
@@ -191,6 +721,15 @@ def pioSizeCalculateFirmwareSize(_, sections):
     return ram_size, flash_size
 
 
+def collect_size_info(env, elf_path):
+    """Returns the sections and the symbols of the ELF file"""
+    with open(elf_path, "rb") as fp:
+        elffile = ELFFile(fp)
+        sections = _collect_sections_info(env, elffile)
+        return sections, _collect_symbols_info(env, elffile, elf_path, sections)
+
+
+@tracing.traced("scons")
 def DumpSizeData(_, target, source, env):  # pylint: disable=unused-argument
     data = {"device": {}, "memory": {}, "version": 1}
 
@@ -0,0 +1,250 @@
+# Copyright (c) 2014-present PlatformIO <contact@platformio.org>
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import json
+import sys
+from os import getpid, replace
+from os.path import join
+
+from tabulate import tabulate
+
+from platformio import tracing
+from platformio.builder.tools import piosize
+
+SIZE_SNAPSHOT_VERSION = 1
+
+
+def _make_size_snapshot(env, sections, symbols):
+    """Returns the compact snapshot of the firmware size, the files and
+    the symbols are stored as the columns"""
+    ram_size, flash_size = env.pioSizeCalculateFirmwareSize(sections)
+    files = {}
+    columns = dict(name=[], file=[], section=[], size=[])
+    section_indexes = {name: index for index, name in enumerate(sections)}
+    for symbol in symbols:
+        section = sections.get(symbol.get("section", ""))
+        if not section:
+            continue
+        file_path = symbol.get("file") or "unknown"
+        if file_path not in files:
+            files[file_path] = [len(files), 0, 0]
+        symbol_size = symbol.get("size", 0)
+        if section.get("in_ram", False):
+            files[file_path][1] += symbol_size
+        if section.get("in_flash", False):
+            files[file_path][2] += symbol_size
+        columns["name"].append(symbol.get("demangled_name") or symbol["name"])
+        columns["file"].append(files[file_path][0])
+        columns["section"].append(section_indexes[symbol["section"]])
+        columns["size"].append(symbol_size)
+    return {
+        "version": SIZE_SNAPSHOT_VERSION,
+        "ram_size": ram_size,
+        "flash_size": flash_size,
+        "sections": {
+            name: dict(
+                size=info["size"],
+                in_ram=info.get("in_ram", False),
+                in_flash=info.get("in_flash", False),
+            )
+            for name, info in sections.items()
+        },
+        "files": dict(
+            path=list(files),
+            ram_size=[v[1] for v in files.values()],
+            flash_size=[v[2] for v in files.values()],
+        ),
+        "symbols": columns,
+    }
+
+
+def _load_size_snapshot(path):
+    try:
+        with open(path, encoding="utf8") as fp:
+            snapshot = json.load(fp)
+        if snapshot.get("version") == SIZE_SNAPSHOT_VERSION:
+            return snapshot
+    except (OSError, ValueError, AttributeError):
+        pass
+    return None
+
+
+def _save_size_snapshot(snapshot, path):
+    tmp_path = "%s.%d.tmp" % (path, getpid())
+    with open(tmp_path, mode="w", encoding="utf8") as fp:
+        json.dump(snapshot, fp, separators=(",", ":"))
+    replace(tmp_path, path)
+
+
+def _diff_size_snapshots(baseline, current):
+    """Returns the growth of the sections, files and symbols, which sizes
+    are changed, as `(name, baseline size, current size)` items"""
+
+    def _diff(old, new):
+        return [
+            (name, old.get(name, 0), new.get(name, 0))
+            for name in list(old) + [name for name in new if name not in old]
+            if old.get(name, 0) != new.get(name, 0)
+        ]
+
+    def _get_file_sizes(snapshot):
+        files = snapshot["files"]
+        return {
+            path: ram + flash
+            for path, ram, flash in zip(
+                files["path"], files["ram_size"], files["flash_size"]
+            )
+        }
+
+    def _get_symbol_sizes(snapshot):
+        symbols = snapshot["symbols"]
+        paths = snapshot["files"]["path"]
+        result = {}
+        for name, file_index, size in zip(
+            symbols["name"], symbols["file"], symbols["size"]
+        ):
+            key = "%s (%s)" % (name, paths[file_index])
+            result[key] = result.get(key, 0) + size
+        return result
+
+    return dict(
+        total=[
+            ("ram", baseline["ram_size"], current["ram_size"]),
+            ("flash", baseline["flash_size"], current["flash_size"]),
+        ],
+        sections=_diff(
+            {name: info["size"] for name, info in baseline["sections"].items()},
+            {name: info["size"] for name, info in current["sections"].items()},
+        ),
+        files=_diff(_get_file_sizes(baseline), _get_file_sizes(current)),
+        symbols=_diff(_get_symbol_sizes(baseline), _get_symbol_sizes(current)),
+    )
+
+
+def _parse_size_thresholds(items):
+    """Parses the `<section|ram|flash> = <bytes|percents%>` items"""
+    result = {}
+    for item in items:
+        name, _, value = item.partition("=")
+        name, value = name.strip(), value.strip()
+        is_percent = value.endswith("%")
+        try:
+            value = float(value[:-1]) if is_percent else int(value)
+        except ValueError as exc:
+            raise ValueError("Invalid size threshold `%s`" % item) from exc
+        if not name:
+            raise ValueError("Invalid size threshold `%s`" % item)
+        result[name] = (value, is_percent)
+    return result
+
+
+def _check_size_thresholds(diff, thresholds):
+    """Returns the error messages for the exceeded growth thresholds"""
+    errors = []
+    for name, old_size, new_size in diff["total"] + diff["sections"]:
+        if name not in thresholds or new_size <= old_size:
+            continue
+        value, is_percent = thresholds[name]
+        growth = new_size - old_size
+        if is_percent:
+            exceeded = not old_size or growth * 100.0 / old_size > value
+            limit = "%s%%" % value
+        else:
+            exceeded = growth > value
+            limit = "%d bytes" % value
+        if exceeded:
+            errors.append(
+                "The size of `%s` grew by %d bytes (from %d to %d bytes), "
+                "the threshold is %s" % (name, growth, old_size, new_size, limit)
+            )
+    return errors
+
+
+def _format_size_diff(diff, limit=10):
+    def _format_delta(old_size, new_size):
+        delta = "%+d" % (new_size - old_size)
+        if old_size:
+            delta += " (%+.1f%%)" % ((new_size - old_size) * 100.0 / old_size)
+        return delta
+
+    def _format_table(title, items):
+        items = sorted(items, key=lambda item: abs(item[2] - item[1]), reverse=True)
+        return tabulate(
+            [
+                (name, old_size, new_size, _format_delta(old_size, new_size))
+                for name, old_size, new_size in items[:limit]
+            ],
+            headers=[title, "Baseline", "Current", "Delta"],
+        )
+
+    lines = [
+        "%s %d bytes, delta %s"
+        % (
+            "RAM:  " if name == "ram" else "Flash:",
+            new_size,
+            _format_delta(old_size, new_size),
+        )
+        for name, old_size, new_size in diff["total"]
+    ]
+    for title, key in (
+        ("Section", "sections"),
+        ("File", "files"),
+        ("Symbol", "symbols"),
+    ):
+        if diff[key]:
+            lines.extend(["", _format_table(title, diff[key])])
+    return "\n".join(lines)
+
+
+@tracing.traced("scons")
+def DumpSizeDiff(_, target, source, env):  # pylint: disable=unused-argument
+    snapshot_path = join(env.subst("$BUILD_DIR"), "sizesnapshot.json")
+    baseline_path = env.GetProjectOption("sizediff_baseline") or snapshot_path
+    baseline_path = join(env.subst("$PROJECT_DIR"), baseline_path)
+    baseline = _load_size_snapshot(baseline_path)
+
+    sections, symbols = piosize.collect_size_info(env, env.subst("$PIOMAINPROG"))
+    snapshot = _make_size_snapshot(env, sections, symbols)
+
+    if not baseline:
+        _save_size_snapshot(snapshot, snapshot_path)
+        print("Size baseline is not found, saved the snapshot to %s" % snapshot_path)
+        return
+    diff = _diff_size_snapshots(baseline, snapshot)
+    print("Size diff against %s" % baseline_path)
+    print(_format_size_diff(diff))
+
+    try:
+        thresholds = _parse_size_thresholds(
+            env.GetProjectOption("sizediff_thresholds", [])
+        )
+    except ValueError as exc:
+        sys.stderr.write("Error: %s\n" % exc)
+        env.Exit(1)
+    errors = _check_size_thresholds(diff, thresholds)
+    for error in errors:
+        sys.stderr.write("Error: %s\n" % error)
+    if errors:
+        # the previous snapshot remains the baseline of the next build
+        env.Exit(1)
+    _save_size_snapshot(snapshot, snapshot_path)
+
+
+def exists(_):
+    return True
+
+
+def generate(env):
+    env.AddMethod(DumpSizeDiff)
+    return env
@@ -0,0 +1,66 @@
+# Copyright (c) 2014-present PlatformIO <contact@platformio.org>
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import atexit
+import os
+
+from platformio import tracing
+
+
+def _describe_command(args):
+    """Returns the name and the category of the span of the spawned command"""
+    tool = os.path.basename(args[0])
+    if "-o" in args[:-1]:
+        output = args[args.index("-o") + 1]
+        return output, "compile" if "-c" in args else "link"
+    if tool.endswith(("ar", "ar.exe", "ranlib", "ranlib.exe")):
+        archives = [arg for arg in args[1:] if arg.endswith(".a")]
+        if archives:
+            return archives[0], "archive"
+    return tool, "command"
+
+
+def _trace_spawn(spawn, build_dir):
+    tracer = tracing.get_tracer()
+
+    def _spawn(sh, escape, cmd, args, env):
+        start = tracer.now()
+        try:
+            return spawn(sh, escape, cmd, args, env)
+        finally:
+            name, cat = _describe_command(args)
+            if os.path.isabs(name) and name.startswith(build_dir):
+                name = os.path.relpath(name, build_dir)
+            tracer.add_span(name, start, tracer.now(), cat)
+
+    return _spawn
+
+
+def ConfigureBuildTrace(env):
+    """Traces the build process into `$TRACE_FILE` (`pio run --trace`),
+    the spawned commands such as compiling and linking are traced too"""
+    if not env.get("TRACE_FILE"):
+        return
+    tracing.start(env["TRACE_FILE"], "SCons (%s)" % env["PIOENV"])
+    atexit.register(tracing.stop)
+    env.Replace(SPAWN=_trace_spawn(env["SPAWN"], env.subst("$BUILD_DIR")))
+
+
+def exists(_):
+    return True
+
+
+def generate(env):
+    env.AddMethod(ConfigureBuildTrace)
+    return env
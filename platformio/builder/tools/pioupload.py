@@ -23,7 +23,7 @@ from time import sleep
 from SCons.Script import ARGUMENTS  # pylint: disable=import-error
 from serial import Serial, SerialException
 
-from platformio import exception, fs
+from platformio import exception, fs, tracing
 from platformio.device.finder import SerialPortFinder, find_mbed_disk, is_pattern_port
 from platformio.device.list.util import list_serial_ports
 from platformio.proc import exec_command
@@ -146,6 +146,7 @@ def UploadToDisk(_, target, source, env):
     )
 
 
+@tracing.traced("scons")
 def CheckUploadSize(_, target, source, env):
     check_conditions = [
         env.get("BOARD"),
@@ -14,29 +14,44 @@
 
 import hashlib
 import os
+import sqlite3
 from time import time
 
 from platformio import app, fs
 from platformio.compat import hashlib_encode_data
-from platformio.package.lockfile import LockFile
 from platformio.project.helpers import get_project_cache_dir
 
 
 class ContentCache:
+    """A key-value cache with expiration, stored in a SQLite database.
+
+    The database runs in the WAL mode, so concurrent processes may share
+    the same cache directory. Obsolete items are removed periodically and
+    the least recently used items are evicted when the total size of data
+    exceeds `MAX_SIZE`.
+    """
+
+    DB_NAME = "db.sqlite"
+    MAX_SIZE = 128 * 1024 * 1024  # bytes
+    CLEANUP_INTERVAL = 3600  # seconds
+    ACCESS_UPDATE_INTERVAL = 60  # seconds
+    BUSY_TIMEOUT = 30  # seconds
+
     def __init__(self, namespace=None):
         self.cache_dir = os.path.join(get_project_cache_dir(), namespace or "content")
-        self._db_path = os.path.join(self.cache_dir, "db.data")
-        self._lockfile = None
-        if not os.path.isdir(self.cache_dir):
-            os.makedirs(self.cache_dir)
+        self._db_path = os.path.join(self.cache_dir, self.DB_NAME)
+        self._conn = None
 
     def __enter__(self):
         # cleanup obsolete items
-        self.delete()
+        try:
+            self._cleanup()
+        except sqlite3.Error:
+            pass
         return self
 
     def __exit__(self, type_, value, traceback):
-        pass
+        self.close()
 
     @staticmethod
     def key_from_args(*args):
@@ -47,111 +62,171 @@ class ContentCache:
         return h.hexdigest()
 
     def get_cache_path(self, key):
+        """Returns a path of the item in the legacy file based layout"""
         assert "/" not in key and "\\" not in key
         key = str(key)
         assert len(key) > 3
         return os.path.join(self.cache_dir, key)
 
+    def _connect(self):
+        if self._conn:
+            return self._conn
+        os.makedirs(self.cache_dir, exist_ok=True)
+        conn = sqlite3.connect(
+            self._db_path, timeout=self.BUSY_TIMEOUT, isolation_level=None
+        )
+        try:
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS items (key TEXT PRIMARY KEY, "
+                "data TEXT NOT NULL, size INTEGER NOT NULL, "
+                "expire INTEGER NOT NULL, accessed INTEGER NOT NULL)"
+            )
+            conn.execute("CREATE INDEX IF NOT EXISTS items_expire ON items (expire)")
+            conn.execute(
+                "CREATE INDEX IF NOT EXISTS items_accessed ON items (accessed)"
+            )
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS meta "
+                "(name TEXT PRIMARY KEY, value INTEGER NOT NULL)"
+            )
+            self._conn = conn
+            self._migrate_legacy_items()
+        except sqlite3.Error:
+            self._conn = None
+            conn.close()
+            raise
+        return conn
+
+    def close(self):
+        if self._conn:
+            self._conn.close()
+            self._conn = None
+
+    def _migrate_legacy_items(self):
+        legacy_db_path = os.path.join(self.cache_dir, "db.data")
+        if not os.path.isfile(legacy_db_path):
+            return
+        paths = []
+        with self._conn:
+            self._conn.execute("BEGIN IMMEDIATE")
+            if not os.path.isfile(legacy_db_path):  # migrated by another process
+                return
+            with open(legacy_db_path, encoding="utf8") as fp:
+                lines = fp.readlines()
+            os.remove(legacy_db_path)
+            now = int(time())
+            for line in lines:
+                line = line.strip()
+                if "=" not in line:
+                    continue
+                expire, fname = line.split("=", 1)
+                path = os.path.join(self.cache_dir, fname)
+                paths.append(path)
+                try:
+                    if int(expire) <= now or not os.path.isfile(path):
+                        continue
+                    with open(path, encoding="utf8") as fp:
+                        data = fp.read()
+                except (ValueError, OSError, UnicodeError):
+                    continue
+                self._conn.execute(
+                    "INSERT OR REPLACE INTO items VALUES (?, ?, ?, ?, ?)",
+                    (fname, data, len(data), int(expire), now),
+                )
+        for path in paths:
+            try:
+                if os.path.isfile(path):
+                    os.remove(path)
+            except OSError:
+                pass
+
     def get(self, key):
-        cache_path = self.get_cache_path(key)
-        if not os.path.isfile(cache_path):
+        now = int(time())
+        try:
+            conn = self._connect()
+            row = conn.execute(
+                "SELECT data, accessed FROM items WHERE key = ? AND expire > ?",
+                (str(key), now),
+            ).fetchone()
+            if not row:
+                return None
+            # track usage for LRU eviction, but do not write on each read
+            if now - row[1] >= self.ACCESS_UPDATE_INTERVAL:
+                conn.execute(
+                    "UPDATE items SET accessed = ? WHERE key = ?", (now, str(key))
+                )
+        except sqlite3.Error:
             return None
-        with open(cache_path, "r", encoding="utf8") as fp:
-            return fp.read()
+        return row[0]
 
     def set(self, key, data, valid):
         if not app.get_setting("enable_cache"):
             return False
-        cache_path = self.get_cache_path(key)
-        if os.path.isfile(cache_path):
-            self.delete(key)
+        self.get_cache_path(key)  # validate key
         if not data:
+            self.delete(key)
             return False
         tdmap = {"s": 1, "m": 60, "h": 3600, "d": 86400}
         assert valid.endswith(tuple(tdmap))
-        expire_time = int(time() + tdmap[valid[-1]] * int(valid[:-1]))
-
-        if not self._lock_dbindex():
-            return False
-
-        if not os.path.isdir(os.path.dirname(cache_path)):
-            os.makedirs(os.path.dirname(cache_path))
+        now = int(time())
+        expire_time = int(now + tdmap[valid[-1]] * int(valid[:-1]))
         try:
-            with open(cache_path, mode="w", encoding="utf8") as fp:
-                fp.write(data)
-            with open(self._db_path, mode="a", encoding="utf8") as fp:
-                fp.write("%s=%s\n" % (str(expire_time), os.path.basename(cache_path)))
-        except UnicodeError:
-            if os.path.isfile(cache_path):
-                try:
-                    os.remove(cache_path)
-                except OSError:
-                    pass
-
-        return self._unlock_dbindex()
+            self._connect().execute(
+                "INSERT OR REPLACE INTO items VALUES (?, ?, ?, ?, ?)",
+                (str(key), data, len(data), expire_time, now),
+            )
+        except (sqlite3.Error, UnicodeError):
+            return False
+        return True
 
     def delete(self, keys=None):
         """Keys=None, delete expired items"""
-        if not os.path.isfile(self._db_path):
-            return None
-        if not keys:
-            keys = []
-        if not isinstance(keys, list):
-            keys = [keys]
-        paths_for_delete = [self.get_cache_path(k) for k in keys]
-        found = False
-        newlines = []
-        with open(self._db_path, encoding="utf8") as fp:
-            for line in fp.readlines():
-                line = line.strip()
-                if "=" not in line:
-                    continue
-                expire, fname = line.split("=")
-                path = os.path.join(self.cache_dir, fname)
-                try:
-                    if (
-                        time() < int(expire)
-                        and os.path.isfile(path)
-                        and path not in paths_for_delete
-                    ):
-                        newlines.append(line)
-                        continue
-                except ValueError:
-                    pass
-                found = True
-                if os.path.isfile(path):
-                    try:
-                        os.remove(path)
-                        if not os.listdir(os.path.dirname(path)):
-                            fs.rmtree(os.path.dirname(path))
-                    except OSError:
-                        pass
-
-        if found and self._lock_dbindex():
-            with open(self._db_path, mode="w", encoding="utf8") as fp:
-                fp.write("\n".join(newlines) + "\n")
-            self._unlock_dbindex()
-
+        try:
+            conn = self._connect()
+            if not keys:
+                conn.execute("DELETE FROM items WHERE expire <= ?", (int(time()),))
+                return True
+            if not isinstance(keys, list):
+                keys = [keys]
+            conn.executemany(
+                "DELETE FROM items WHERE key = ?", [(str(key),) for key in keys]
+            )
+        except sqlite3.Error:
+            return False
         return True
 
     def clean(self):
+        self.close()
         if not os.path.isdir(self.cache_dir):
             return
         fs.rmtree(self.cache_dir)
 
-    def _lock_dbindex(self):
-        self._lockfile = LockFile(self.cache_dir)
-        try:
-            self._lockfile.acquire()
-        except:  # pylint: disable=bare-except
-            return False
-
-        return True
-
-    def _unlock_dbindex(self):
-        if self._lockfile:
-            self._lockfile.release()
-        return True
+    def _cleanup(self):
+        now = int(time())
+        conn = self._connect()
+        row = conn.execute("SELECT value FROM meta WHERE name = 'cleanup'").fetchone()
+        # the clock could be moved backwards since the last cleanup
+        if row and 0 <= now - row[0] < self.CLEANUP_INTERVAL:
+            return
+        with conn:
+            conn.execute("BEGIN IMMEDIATE")
+            conn.execute("INSERT OR REPLACE INTO meta VALUES ('cleanup', ?)", (now,))
+            conn.execute("DELETE FROM items WHERE expire <= ?", (now,))
+            self._evict(conn)
+
+    def _evict(self, conn):
+        total_size = conn.execute("SELECT SUM(size) FROM items").fetchone()[0] or 0
+        if total_size <= self.MAX_SIZE:
+            return
+        keys = []
+        for key, size in conn.execute("SELECT key, size FROM items ORDER BY accessed"):
+            keys.append((key,))
+            total_size -= size
+            if total_size <= self.MAX_SIZE:
+                break
+        conn.executemany("DELETE FROM items WHERE key = ?", keys)
 
 
 #
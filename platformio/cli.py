@@ -13,43 +13,27 @@
 # limitations under the License.
 
 import importlib
-from pathlib import Path
 
 import click
 
+from platformio import cliindex
+
 
 class PlatformioCLI(click.Group):
     leftover_args = []
 
-    def __init__(self, *args, **kwargs):
-        super().__init__(*args, **kwargs)
-        self._pio_root_path = Path(__file__).parent
-        self._pio_cmd_aliases = dict(package="pkg")
-
-    def _find_pio_commands(self):
-        def _to_module_path(p):
-            return (
-                "platformio." + ".".join(p.relative_to(self._pio_root_path).parts)[:-3]
-            )
-
-        result = {}
-        for p in self._pio_root_path.rglob("cli.py"):
-            # skip this module
-            if p.parent == self._pio_root_path:
-                continue
-            cmd_name = p.parent.name
-            result[self._pio_cmd_aliases.get(cmd_name, cmd_name)] = _to_module_path(p)
-
-        # find legacy commands
-        for p in (self._pio_root_path / "commands").iterdir():
-            if p.name.startswith("_"):
-                continue
-            if (p / "command.py").is_file():
-                result[p.name] = _to_module_path(p / "command.py")
-            elif p.name.endswith(".py"):
-                result[p.name[:-3]] = _to_module_path(p)
+    _pio_commands = {}
+    _pio_commands_scanned = False
 
-        return result
+    @classmethod
+    def _find_pio_commands(cls, rescan=False):
+        if not cls._pio_commands or (rescan and not cls._pio_commands_scanned):
+            commands = None if rescan else cliindex.load_index()
+            if not commands:
+                commands = cliindex.build_index()
+                cls._pio_commands_scanned = True
+            cls._pio_commands = commands
+        return cls._pio_commands
 
     @staticmethod
     def in_silence():
@@ -89,9 +73,19 @@ class PlatformioCLI(click.Group):
 
     def get_command(self, ctx, cmd_name):
         commands = self._find_pio_commands()
+        if cmd_name not in commands:
+            # the index can be outdated in the development tree
+            commands = self._find_pio_commands(rescan=True)
         if cmd_name not in commands:
             return self._handle_obsolate_command(ctx, cmd_name)
-        module = importlib.import_module(commands[cmd_name])
+        try:
+            module = importlib.import_module(commands[cmd_name])
+        except ModuleNotFoundError as exc:
+            # the indexed module has been removed
+            if exc.name != commands[cmd_name] or self._pio_commands_scanned:
+                raise exc
+            self._find_pio_commands(rescan=True)
+            return self.get_command(ctx, cmd_name)
         return getattr(module, "cli")
 
     @staticmethod
@@ -108,3 +102,23 @@ class PlatformioCLI(click.Group):
             return cli
 
         raise click.UsageError('No such command "%s"' % cmd_name, ctx)
+
+
+class LazyCommandGroup(click.Group):
+    """The group which imports the subcommands on the first use,
+    `lazy_commands` maps the names to the "module:attribute" paths"""
+
+    def __init__(self, *args, lazy_commands=None, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.lazy_commands = lazy_commands or {}
+
+    def list_commands(self, ctx):
+        return sorted(set(super().list_commands(ctx)) | set(self.lazy_commands))
+
+    def get_command(self, ctx, cmd_name):
+        if cmd_name not in self.commands and cmd_name in self.lazy_commands:
+            module_path, attr = self.lazy_commands[cmd_name].split(":")
+            self.add_command(
+                getattr(importlib.import_module(module_path), attr), cmd_name
+            )
+        return super().get_command(ctx, cmd_name)
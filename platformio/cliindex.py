@@ -0,0 +1,90 @@
+# Copyright (c) 2014-present PlatformIO <contact@platformio.org>
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""The index of the CLI commands and their modules.
+
+The index is generated on install (see `setup.py`) or on the first run if it
+is missing, so the package tree is not scanned on every CLI invocation.
+This module must not depend on the third-party packages.
+"""
+
+import json
+import os
+from pathlib import Path
+
+from platformio import __version__
+
+INDEX_NAME = "cliindex.json"
+COMMAND_ALIASES = dict(package="pkg")
+
+
+def find_commands(root_path=None):
+    root_path = Path(root_path or os.path.dirname(__file__))
+
+    def _to_module_path(p):
+        return "platformio." + ".".join(p.relative_to(root_path).parts)[:-3]
+
+    result = {}
+    for p in root_path.rglob("cli.py"):
+        # skip the root module
+        if p.parent == root_path:
+            continue
+        cmd_name = p.parent.name
+        result[COMMAND_ALIASES.get(cmd_name, cmd_name)] = _to_module_path(p)
+
+    # find legacy commands
+    for p in (root_path / "commands").iterdir():
+        if p.name.startswith("_"):
+            continue
+        if (p / "command.py").is_file():
+            result[p.name] = _to_module_path(p / "command.py")
+        elif p.name.endswith(".py"):
+            result[p.name[:-3]] = _to_module_path(p)
+
+    return dict(sorted(result.items()))
+
+
+def get_index_path(root_path=None):
+    return os.path.join(root_path or os.path.dirname(__file__), INDEX_NAME)
+
+
+def load_index(root_path=None):
+    try:
+        with open(get_index_path(root_path), encoding="utf8") as fp:
+            data = json.load(fp)
+        if data["version"] == __version__:
+            return data["commands"]
+    except (OSError, ValueError, KeyError, TypeError):
+        pass
+    return None
+
+
+def save_index(commands, root_path=None):
+    index_path = get_index_path(root_path)
+    tmp_path = "%s.%d.tmp" % (index_path, os.getpid())
+    try:
+        with open(tmp_path, mode="w", encoding="utf8") as fp:
+            json.dump(dict(version=__version__, commands=commands), fp, indent=2)
+        os.replace(tmp_path, index_path)
+    except OSError:  # read-only installation
+        if os.path.isfile(tmp_path):
+            os.remove(tmp_path)
+        return False
+    return True
+
+
+def build_index(root_path=None):
+    commands = find_commands(root_path)
+    save_index(commands, root_path)
+    return commands
@@ -23,12 +23,26 @@ import sys
 
 from platformio.exception import UserSideException
 
-if sys.version_info >= (3, 7):
-    from asyncio import create_task as aio_create_task
-    from asyncio import get_running_loop as aio_get_running_loop
-else:
-    from asyncio import ensure_future as aio_create_task
-    from asyncio import get_event_loop as aio_get_running_loop
+# `asyncio` is imported on the first use, it slows down the CLI startup
+# pylint: disable=import-outside-toplevel
+
+
+def aio_create_task(coro, **kwargs):
+    import asyncio
+
+    return asyncio.create_task(coro, **kwargs)
+
+
+def aio_get_running_loop():
+    import asyncio
+
+    return asyncio.get_running_loop()
+
+
+async def aio_to_thread(func, /, *args, **kwargs):
+    import asyncio
+
+    return await asyncio.to_thread(func, *args, **kwargs)
 
 
 if sys.version_info >= (3, 8):
@@ -39,15 +53,6 @@ else:
         return " ".join(shlex.quote(arg) for arg in split_command)
 
 
-if sys.version_info >= (3, 9):
-    from asyncio import to_thread as aio_to_thread
-else:
-    try:
-        from starlette.concurrency import run_in_threadpool as aio_to_thread
-    except ImportError:
-        pass
-
-
 PY2 = sys.version_info[0] == 2  # DO NOT REMOVE IT. ESP8266/ESP32 depend on it
 PY36 = sys.version_info[0:2] == (3, 6)
 IS_CYGWIN = sys.platform.startswith("cygwin")
@@ -23,8 +23,6 @@ import serial
 from platformio.compat import IS_WINDOWS
 from platformio.device.list.util import list_logical_devices, list_serial_ports
 from platformio.fs import get_platformio_udev_rules_path
-from platformio.package.manager.platform import PlatformPackageManager
-from platformio.platform.factory import PlatformFactory
 from platformio.util import retry
 
 BLACK_MAGIC_HWIDS = [
@@ -235,6 +233,10 @@ class SerialPortFinder:
         @lru_cache(maxsize=1)
         def _fetch_hwids_from_platforms():
             """load from installed dev-platforms"""
+            # pylint: disable=import-outside-toplevel
+            from platformio.package.manager.platform import PlatformPackageManager
+            from platformio.platform.factory import PlatformFactory
+
             result = []
             for platform in PlatformPackageManager().get_installed():
                 p = PlatformFactory.new(platform)
@@ -18,7 +18,6 @@ import socket
 import click
 
 from platformio.compat import IS_WINDOWS, click_launch
-from platformio.home.run import run_server
 from platformio.package.manager.core import get_core_package_dir
 
 
@@ -94,6 +93,10 @@ def cli(port, host, no_open, shutdown_timeout, session_id):
             click_launch(home_url)
         return
 
+    # the web server stack is imported on demand
+    # pylint: disable=import-outside-toplevel
+    from platformio.home.run import run_server
+
     run_server(
         host=host,
         port=port,
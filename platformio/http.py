@@ -14,16 +14,24 @@
 
 import json
 import socket
-from urllib.parse import urljoin
+import threading
+import time
+from email.utils import parsedate_to_datetime
+from urllib.parse import urljoin, urlparse
 
 import requests.adapters
+import urllib3
 from urllib3.util.retry import Retry
 
-from platformio import __check_internet_hosts__, app, util
+from platformio import __check_internet_hosts__, app
 from platformio.cache import ContentCache, cleanup_content_cache
 from platformio.compat import is_proxy_set
 from platformio.exception import PlatformioException, UserSideException
 
+# https://urllib3.readthedocs.org
+# /en/latest/security.html#insecureplatformwarning
+urllib3.disable_warnings()
+
 __default_requests_timeout__ = (10, None)  # (connect, read)
 
 
@@ -45,47 +53,145 @@ class InternetConnectionError(UserSideException):
     )
 
 
+class SharedHTTPAdapter(requests.adapters.HTTPAdapter):
+    """A connection pool of the host which is shared by all sessions of
+    the process, so the connections and TLS handshakes are reused"""
+
+    POOL_MAXSIZE = 16
+    _instances = {}
+    _instances_lock = threading.Lock()
+
+    @classmethod
+    def get_instance(cls, url, max_retries=None):
+        url_parts = urlparse(url)
+        key = (url_parts.scheme.lower(), url_parts.netloc.lower(), max_retries)
+        with cls._instances_lock:
+            if key not in cls._instances:
+                cls._instances[key] = cls(
+                    pool_maxsize=cls.POOL_MAXSIZE,
+                    max_retries=(
+                        requests.adapters.DEFAULT_RETRIES
+                        if max_retries is None
+                        else max_retries
+                    ),
+                )
+            return cls._instances[key]
+
+    @classmethod
+    def close_all(cls):
+        with cls._instances_lock:
+            for adapter in cls._instances.values():
+                super(SharedHTTPAdapter, adapter).close()
+            cls._instances.clear()
+
+    def close(self):
+        # the pool outlives the sessions, see `close_all`
+        pass
+
+
+class HTTPRateLimiter:
+    """Adaptive per-host backoff driven by the "429 Too Many Requests"
+    responses and their "Retry-After" header"""
+
+    MIN_DELAY = 1  # seconds
+    MAX_DELAY = 60
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._hosts = {}  # host -> (not before time, last delay)
+
+    def wait(self, host):
+        with self._lock:
+            not_before = self._hosts.get(host, (0, 0))[0]
+        delay = not_before - time.time()
+        if delay > 0:
+            time.sleep(delay)
+
+    def update(self, host, response):
+        """Returns `True` if the server has limited the request rate"""
+        if response.status_code != 429:
+            if host in self._hosts:
+                with self._lock:
+                    self._hosts.pop(host, None)
+            return False
+        with self._lock:
+            delay = self.parse_retry_after(response.headers.get("Retry-After"))
+            if delay is None:  # double the previous delay
+                delay = max(self.MIN_DELAY, self._hosts.get(host, (0, 0))[1] * 2)
+            delay = min(delay, self.MAX_DELAY)
+            self._hosts[host] = (time.time() + delay, delay)
+        return True
+
+    @staticmethod
+    def parse_retry_after(value):
+        if not value:
+            return None
+        value = value.strip()
+        if value.isdigit():
+            return int(value)
+        try:
+            return max(0, parsedate_to_datetime(value).timestamp() - time.time())
+        except (TypeError, ValueError):
+            return None
+
+
 class HTTPSession(requests.Session):
+    RATE_LIMITER = HTTPRateLimiter()
+
     def __init__(self, *args, **kwargs):
         self._x_base_url = kwargs.pop("x_base_url") if "x_base_url" in kwargs else None
         super().__init__(*args, **kwargs)
+        # use the shared connection pools, see `get_adapter`
+        self.adapters.clear()
         self.headers.update({"User-Agent": app.get_user_agent()})
         try:
             self.verify = app.get_setting("enable_proxy_strict_ssl")
         except PlatformioException:
             self.verify = True
 
+    def get_adapter(self, url):
+        for prefix, adapter in self.adapters.items():
+            if url.lower().startswith(prefix.lower()):
+                return adapter
+        if url.lower().startswith(("http://", "https://")):
+            return SharedHTTPAdapter.get_instance(url)
+        return super().get_adapter(url)
+
     def request(  # pylint: disable=signature-differs,arguments-differ
         self, method, url, *args, **kwargs
     ):
         # print("HTTPSession::request", self._x_base_url, method, url, args, kwargs)
         if "timeout" not in kwargs:
             kwargs["timeout"] = __default_requests_timeout__
-        return super().request(
-            method,
-            (
-                url
-                if url.startswith("http") or not self._x_base_url
-                else urljoin(self._x_base_url, url)
-            ),
-            *args,
-            **kwargs
+        url = (
+            url
+            if url.startswith("http") or not self._x_base_url
+            else urljoin(self._x_base_url, url)
         )
+        host = urlparse(url).netloc.lower()
+        self.RATE_LIMITER.wait(host)
+        response = super().request(method, url, *args, **kwargs)
+        self.RATE_LIMITER.update(host, response)
+        _CONNECTIVITY_STATE["online"] = True
+        return response
 
 
 class HTTPSessionIterator:
+    # https://urllib3.readthedocs.io/en/stable/reference/urllib3.util.html
+    # "429" is handled by the `HTTPRateLimiter`
+    RETRY = Retry(
+        total=5,
+        backoff_factor=1,  # [0, 2, 4, 8, 16] secs
+        # method_whitelist=list(Retry.DEFAULT_METHOD_WHITELIST) + ["POST"],
+        status_forcelist=[413, 500, 502, 503, 504],
+    )
+
     def __init__(self, endpoints):
         if not isinstance(endpoints, list):
             endpoints = [endpoints]
         self.endpoints = endpoints
         self.endpoints_iter = iter(endpoints)
-        # https://urllib3.readthedocs.io/en/stable/reference/urllib3.util.html
-        self.retry = Retry(
-            total=5,
-            backoff_factor=1,  # [0, 2, 4, 8, 16] secs
-            # method_whitelist=list(Retry.DEFAULT_METHOD_WHITELIST) + ["POST"],
-            status_forcelist=[413, 429, 500, 502, 503, 504],
-        )
+        self.retry = self.RETRY
 
     def __iter__(self):  # pylint: disable=non-iterator-returned
         return self
@@ -93,12 +199,15 @@ class HTTPSessionIterator:
     def __next__(self):
         base_url = next(self.endpoints_iter)
         session = HTTPSession(x_base_url=base_url)
-        adapter = requests.adapters.HTTPAdapter(max_retries=self.retry)
-        session.mount(base_url, adapter)
+        session.mount(
+            base_url, SharedHTTPAdapter.get_instance(base_url, max_retries=self.retry)
+        )
         return session
 
 
 class HTTPClient:
+    MAX_RATE_LIMITED_ATTEMPTS = 5
+
     def __init__(self, endpoints):
         self._session_iter = HTTPSessionIterator(endpoints)
         self._session = None
@@ -118,7 +227,6 @@ class HTTPClient:
             self._session.close()
         self._session = next(self._session_iter)
 
-    @util.throttle(500)
     def send_request(self, method, path, **kwargs):
         # check Internet before and resolve issue with 60 seconds timeout
         ensure_internet_on(raise_exception=True)
@@ -138,14 +246,25 @@ class HTTPClient:
             )
         kwargs["headers"] = headers
 
+        rate_limited_attempts = 0
         while True:
             try:
-                return getattr(self._session, method)(path, **kwargs)
+                response = getattr(self._session, method)(path, **kwargs)
             except requests.exceptions.RequestException as exc:
                 try:
                     self._next_session()
                 except Exception as exc2:
                     raise HTTPClientError(str(exc2)) from exc
+                continue
+            # the session waits for the "Retry-After" before the next request
+            if (
+                response.status_code == 429
+                and rate_limited_attempts < self.MAX_RATE_LIMITED_ATTEMPTS
+            ):
+                rate_limited_attempts += 1
+                response.close()
+                continue
+            return response
 
     def fetch_json_data(self, method, path, **kwargs):
         if method not in ("get", "head", "options"):
@@ -187,8 +306,22 @@ class HTTPClient:
 #
 
 
-@util.memoized(expire="10s")
+_CONNECTIVITY_STATE = dict(online=False, checked_at=0)
+
+
 def _internet_on():
+    """The positive result (or any received HTTP response) is kept for
+    the process lifetime, the failed probe is repeated in 10 seconds"""
+    if _CONNECTIVITY_STATE["online"]:
+        return True
+    if time.time() - _CONNECTIVITY_STATE["checked_at"] < 10:
+        return False
+    _CONNECTIVITY_STATE["online"] = _probe_internet()
+    _CONNECTIVITY_STATE["checked_at"] = time.time()
+    return _CONNECTIVITY_STATE["online"]
+
+
+def _probe_internet():
     timeout = 2
     use_proxy = is_proxy_set()
     socket.setdefaulttimeout(timeout)
@@ -17,14 +17,12 @@ import shutil
 from time import time
 
 import click
-import semantic_version
 
 from platformio import __version__, app, fs
-from platformio.cache import cleanup_content_cache
 from platformio.cli import PlatformioCLI
-from platformio.package.manager.core import update_core_packages
-from platformio.package.version import pepver_to_semver
-from platformio.system.prune import calculate_unnecessary_system_data
+
+# pylint: disable=import-outside-toplevel
+# the package managers are imported on demand, they slow down the CLI startup
 
 
 def on_cmd_start(ctx, caller):
@@ -55,6 +53,8 @@ def set_caller(caller=None):
 
 class Upgrader:
     def __init__(self, from_version, to_version):
+        import semantic_version
+
         self.from_version = from_version
         self.to_version = to_version
         self._upgraders = [
@@ -93,6 +93,10 @@ class Upgrader:
 
 
 def after_upgrade(ctx):
+    from platformio.cache import cleanup_content_cache
+    from platformio.package.manager.core import update_core_packages
+    from platformio.package.version import pepver_to_semver
+
     last_version_str = app.get_state_item("last_version", "0.0.0")
     if last_version_str == __version__:
         return None
@@ -142,6 +146,8 @@ def check_prune_system():
     if not last_checked_time:
         return
 
+    from platformio.system.prune import calculate_unnecessary_system_data
+
     threshold_mb = int(app.get_setting("check_prune_system_threshold") or 0)
     if threshold_mb <= 0:
         return
@@ -15,6 +15,7 @@
 import click
 
 from platformio.package.commands.exec import package_exec_cmd
+from platformio.package.commands.index import package_index_cmd
 from platformio.package.commands.install import package_install_cmd
 from platformio.package.commands.list import package_list_cmd
 from platformio.package.commands.outdated import package_outdated_cmd
@@ -31,6 +32,7 @@ from platformio.package.commands.update import package_update_cmd
     "pkg",
     commands=[
         package_exec_cmd,
+        package_index_cmd,
         package_install_cmd,
         package_list_cmd,
         package_outdated_cmd,
@@ -0,0 +1,57 @@
+# Copyright (c) 2014-present PlatformIO <contact@platformio.org>
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import os
+
+import click
+
+from platformio import app
+from platformio.exception import UserSideException
+from platformio.registry.index import RegistryIndex
+
+
+@click.group("index", short_help="Manage the local registry index")
+def package_index_cmd():
+    pass
+
+
+@package_index_cmd.command(
+    "update", short_help="Import or refresh the local registry index"
+)
+@click.option(
+    "-s",
+    "--source",
+    metavar="<path or URL>",
+    help="A registry index snapshot (JSON, optionally compressed with GZip), "
+    "the previous source is used by default",
+)
+def package_index_update_cmd(source):
+    index = RegistryIndex.get_instance()
+    source = source or index.get_meta("source")
+    if not source:
+        raise UserSideException(
+            "Please specify a source of the registry index using `--source` option"
+        )
+    if not source.startswith(("http://", "https://")):
+        source = os.path.abspath(source)
+    click.echo("Updating the registry index from %s" % source)
+    total = index.update(source)
+    click.secho(
+        "The registry index has been updated with %d packages" % total, fg="green"
+    )
+    if not app.get_setting("enable_registry_index"):
+        click.secho(
+            "Please enable it with `pio settings set enable_registry_index Yes`",
+            fg="yellow",
+        )
@@ -243,6 +243,15 @@ def _install_project_env_libraries(project_env, options):
 
     _uninstall_project_unused_libdeps(env_lm, lib_deps)
 
+    if not options.get("force"):
+        env_lm.prefetch_packages(
+            [
+                (spec, None)
+                for spec in (PackageSpec(library) for library in lib_deps)
+                if spec.owner
+            ]
+        )
+
     for library in lib_deps:
         spec = PackageSpec(library)
         # skip built-in dependencies
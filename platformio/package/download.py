@@ -12,12 +12,18 @@
 # See the License for the specific language governing permissions and
 # limitations under the License.
 
+import hashlib
 import io
+import os
+import threading
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
 from email.utils import parsedate
 from os.path import getsize, join
 from time import mktime
 
 import click
+import requests
 
 from platformio import fs
 from platformio.compat import is_terminal
@@ -25,10 +31,50 @@ from platformio.http import HTTPSession
 from platformio.package.exception import PackageException
 
 
-class FileDownloader:
+class DownloadStream(io.RawIOBase):
+    """A readable file object over the downloaded chunks"""
+
+    def __init__(self, chunks):
+        super().__init__()
+        self._chunks = chunks
+        self._pending = b""
+
+    def readable(self):
+        return True
+
+    def readinto(self, b):  # pylint: disable=arguments-renamed
+        while not self._pending:
+            self._pending = next(self._chunks, None)
+            if self._pending is None:
+                self._pending = b""
+                return 0
+        size = min(len(b), len(self._pending))
+        b[:size] = self._pending[:size]
+        self._pending = self._pending[size:]
+        return size
+
+    def drain(self):
+        """Reads the remaining data, so the checksum covers the whole file"""
+        while self.read(io.DEFAULT_BUFFER_SIZE * 8):
+            pass
+
+
+class FileDownloader:  # pylint: disable=too-many-instance-attributes
+    STREAMABLE_EXTENSIONS = (".tar", ".tar.gz", ".tgz", ".tar.bz2", ".tar.xz")
+    CHUNK_SIZE = io.DEFAULT_BUFFER_SIZE * 8
+    MAX_RESUME_ATTEMPTS = 5
+    # ranged requests of the large files in the multiple connections
+    MAX_CONNECTIONS = 4
+    SEGMENT_SIZE = 4 * 1024 * 1024
+    PARALLEL_MIN_SIZE = 16 * 1024 * 1024
+
     def __init__(self, url, dest_dir=None):
+        self._url = url
         self._http_session = HTTPSession()
         self._http_response = None
+        self._hasher = None
+        self._downloaded_size = 0
+        self._thread_data = threading.local()
         # make connection
         self._http_response = self._http_session.get(
             url,
@@ -61,6 +107,9 @@ class FileDownloader:
     def get_filepath(self):
         return self._destination
 
+    def get_part_filepath(self):
+        return self._destination + ".part"
+
     def get_lmtime(self):
         return self._http_response.headers.get("last-modified")
 
@@ -69,47 +118,39 @@ class FileDownloader:
             return -1
         return int(self._http_response.headers["content-length"])
 
-    def start(self, with_progress=True, silent=False):
-        label = "Downloading"
-        file_size = self.get_size()
-        itercontent = self._http_response.iter_content(
-            chunk_size=io.DEFAULT_BUFFER_SIZE
+    def is_streamable(self):
+        return self._fname.lower().endswith(self.STREAMABLE_EXTENSIONS)
+
+    def is_resumable(self):
+        headers = self._http_response.headers
+        return (
+            self.get_size() != -1
+            and headers.get("accept-ranges", "").lower() == "bytes"
+            and headers.get("content-encoding", "identity").lower() == "identity"
         )
+
+    def start(self, with_progress=True, silent=False, checksum=None):
+        """Downloads to the ".part" file and moves it to the destination when
+        the file is complete and verified. The ".part" file which is left by
+        the interrupted download is resumed if the `checksum` is known"""
+        part_path = self.get_part_filepath()
+        resume = bool(checksum and self.is_resumable() and os.path.isfile(part_path))
         try:
-            with open(self._destination, "wb") as fp:
-                if file_size == -1 or not with_progress or silent:
-                    if not silent:
-                        click.echo(f"{label}...")
-                    for chunk in itercontent:
-                        fp.write(chunk)
-
-                elif not is_terminal():
-                    click.echo(f"{label} 0%", nl=False)
-                    print_percent_step = 10
-                    printed_percents = 0
-                    downloaded_size = 0
-                    for chunk in itercontent:
-                        fp.write(chunk)
-                        downloaded_size += len(chunk)
-                        if (downloaded_size / file_size * 100) >= (
-                            printed_percents + print_percent_step
-                        ):
-                            printed_percents += print_percent_step
-                            click.echo(f" {printed_percents}%", nl=False)
-                    click.echo("")
-
-                else:
-                    with click.progressbar(
-                        length=file_size,
-                        iterable=itercontent,
-                        label=label,
-                        update_min_steps=min(
-                            256 * 1024, file_size / 100
-                        ),  # every 256Kb or less
-                    ) as pb:
-                        for chunk in pb:
-                            pb.update(len(chunk))
-                            fp.write(chunk)
+            with open(part_path, "ab" if resume else "wb") as fp:
+                for chunk in self.iter_content(
+                    with_progress,
+                    silent,
+                    checksum,
+                    resume_from=part_path if resume else None,
+                ):
+                    fp.write(chunk)
+            if checksum:
+                try:
+                    self.verify(checksum)
+                except PackageException:
+                    os.remove(part_path)
+                    raise
+            os.replace(part_path, self._destination)
         finally:
             self._http_response.close()
             self._http_session.close()
@@ -119,8 +160,224 @@ class FileDownloader:
 
         return True
 
+    def open_stream(  # pylint: disable=too-many-arguments,too-many-positional-arguments
+        self,
+        with_progress=True,
+        silent=False,
+        checksum=None,
+        label="Downloading",
+        save_to_destination=False,
+    ):
+        """Returns a buffered file object which reads the remote file while
+        it is being hashed (see `verify`) and, optionally, saved to
+        the destination"""
+        chunks = self.iter_content(
+            with_progress, silent, checksum, label=label, sequential=True
+        )
+        if save_to_destination:
+            chunks = self._tee_to_destination(chunks)
+        return io.BufferedReader(DownloadStream(chunks), io.DEFAULT_BUFFER_SIZE * 8)
+
+    def _tee_to_destination(self, chunks):
+        with open(self._destination, "wb") as fp:
+            for chunk in chunks:
+                fp.write(chunk)
+                yield chunk
+        if self.get_lmtime():
+            self._preserve_filemtime(self.get_lmtime())
+
+    def iter_content(  # pylint: disable=too-many-arguments,too-many-positional-arguments,too-many-branches
+        self,
+        with_progress=True,
+        silent=False,
+        checksum=None,
+        resume_from=None,
+        label="Downloading",
+        sequential=False,
+    ):
+        file_size = self.get_size()
+        self._hasher = (
+            hashlib.new(self.get_checksum_algorithm(checksum)) if checksum else None
+        )
+        self._downloaded_size = 0
+        if resume_from:
+            with open(resume_from, "rb") as fp:
+                for chunk in iter(lambda: fp.read(self.CHUNK_SIZE), b""):
+                    self._track_chunk(chunk)
+        itercontent = self._iter_remote_chunks(self._downloaded_size, sequential)
+
+        try:
+            if file_size == -1 or not with_progress or silent:
+                if not silent:
+                    click.echo(f"{label}...")
+                for chunk in itercontent:
+                    yield self._track_chunk(chunk)
+
+            elif not is_terminal():
+                click.echo(f"{label} 0%", nl=False)
+                print_percent_step = 10
+                printed_percents = 0
+                for chunk in itercontent:
+                    yield self._track_chunk(chunk)
+                    if (self._downloaded_size / file_size * 100) >= (
+                        printed_percents + print_percent_step
+                    ):
+                        printed_percents += print_percent_step
+                        click.echo(f" {printed_percents}%", nl=False)
+                click.echo("")
+
+            else:
+                with click.progressbar(
+                    length=file_size,
+                    iterable=itercontent,
+                    label=label,
+                    update_min_steps=min(
+                        256 * 1024, file_size / 100
+                    ),  # every 256Kb or less
+                ) as pb:
+                    pb.update(self._downloaded_size)
+                    for chunk in pb:
+                        pb.update(len(chunk))
+                        yield self._track_chunk(chunk)
+        finally:
+            self._http_response.close()
+            self._http_session.close()
+
+    def _track_chunk(self, chunk):
+        self._downloaded_size += len(chunk)
+        if self._hasher:
+            self._hasher.update(chunk)
+        return chunk
+
+    def _iter_remote_chunks(self, offset=0, sequential=False):
+        """Yields the remote file data in order starting from the `offset`"""
+        if (
+            not sequential
+            and self.MAX_CONNECTIONS > 1
+            and self.is_resumable()
+            and self.get_size() - offset >= self.PARALLEL_MIN_SIZE
+        ):
+            self._http_response.close()
+            yield from self._iter_segments(offset)
+            return
+        end = self.get_size() - 1 if self.get_size() != -1 else None
+        response = self._http_response
+        if offset:
+            response.close()
+            response = self._request_range(self._http_session, offset, end)
+        yield from self._iter_response_chunks(self._http_session, response, offset, end)
+
+    def _iter_response_chunks(self, session, response, start, end=None):
+        """Yields the data of the `start`-`end` range, a broken connection is
+        resumed with the ranged requests when the server supports them"""
+        offset = start
+        attempts = 0
+        while True:
+            try:
+                try:
+                    for chunk in response.iter_content(chunk_size=self.CHUNK_SIZE):
+                        if end is not None:
+                            chunk = chunk[: end + 1 - offset]
+                        offset += len(chunk)
+                        yield chunk
+                        if end is not None and offset > end:
+                            return
+                finally:
+                    response.close()
+                if end is None or offset > end:
+                    return
+                raise requests.exceptions.ChunkedEncodingError(
+                    "Connection closed after %d of %d bytes" % (offset, end + 1)
+                )
+            except requests.exceptions.RequestException:
+                attempts += 1
+                if not self.is_resumable() or attempts > self.MAX_RESUME_ATTEMPTS:
+                    raise
+                response = self._request_range(session, offset, end)
+
+    def _request_range(self, session, start, end=None):
+        headers = {"Range": "bytes=%d-%s" % (start, "" if end is None else end)}
+        validator = self._http_response.headers.get(
+            "etag"
+        ) or self._http_response.headers.get("last-modified")
+        if validator:
+            headers["If-Range"] = validator
+        response = session.get(self._url, stream=True, headers=headers)
+        if response.status_code != 206 or not response.headers.get(
+            "content-range", ""
+        ).startswith("bytes %d-" % start):
+            response.close()
+            raise PackageException(
+                "Could not resume the download of {0}, the remote file has "
+                "been changed or the server does not support ranges "
+                "(status code '{1}')".format(self._url, response.status_code)
+            )
+        return response
+
+    def _iter_segments(self, offset):
+        file_size = self.get_size()
+        segments = iter(
+            (start, min(start + self.SEGMENT_SIZE, file_size) - 1)
+            for start in range(offset, file_size, self.SEGMENT_SIZE)
+        )
+        sessions = []
+        pending = deque()
+        with ThreadPoolExecutor(
+            max_workers=self.MAX_CONNECTIONS, thread_name_prefix="pio-download"
+        ) as executor:
+            try:
+                # keep the connections busy while the data is consumed in order
+                for segment in segments:
+                    pending.append(
+                        executor.submit(self._fetch_segment, sessions, *segment)
+                    )
+                    if len(pending) >= self.MAX_CONNECTIONS * 2:
+                        break
+                while pending:
+                    data = pending.popleft().result()
+                    segment = next(segments, None)
+                    if segment:
+                        pending.append(
+                            executor.submit(self._fetch_segment, sessions, *segment)
+                        )
+                    for pos in range(0, len(data), self.CHUNK_SIZE):
+                        yield data[pos : pos + self.CHUNK_SIZE]
+            finally:
+                for future in pending:
+                    future.cancel()
+                executor.shutdown(wait=True)
+                for session in sessions:
+                    session.close()
+
+    def _fetch_segment(self, sessions, start, end):
+        session = getattr(self._thread_data, "session", None)
+        if not session:
+            session = HTTPSession()
+            self._thread_data.session = session
+            sessions.append(session)
+        data = b"".join(
+            self._iter_response_chunks(
+                session, self._request_range(session, start, end), start, end
+            )
+        )
+        if len(data) != end - start + 1:
+            raise PackageException(
+                "Got {0:d} bytes instead of {1:d} for the range {2:d}-{3:d} "
+                "of {4}".format(len(data), end - start + 1, start, end, self._url)
+            )
+        return data
+
+    @staticmethod
+    def get_checksum_algorithm(checksum):
+        algorithms = {32: "md5", 40: "sha1", 64: "sha256"}
+        if len(checksum) not in algorithms:
+            raise PackageException(
+                "Could not determine checksum algorithm by %s" % checksum
+            )
+        return algorithms[len(checksum)]
+
     def verify(self, checksum=None):
-        _dlsize = getsize(self._destination)
+        _dlsize = self._downloaded_size or getsize(self._destination)
         if self.get_size() != -1 and _dlsize != self.get_size():
             raise PackageException(
                 (
@@ -131,21 +388,11 @@ class FileDownloader:
         if not checksum:
             return True
 
-        checksum_len = len(checksum)
-        hash_algo = None
-        if checksum_len == 32:
-            hash_algo = "md5"
-        elif checksum_len == 40:
-            hash_algo = "sha1"
-        elif checksum_len == 64:
-            hash_algo = "sha256"
-
-        if not hash_algo:
-            raise PackageException(
-                "Could not determine checksum algorithm by %s" % checksum
-            )
-
-        dl_checksum = fs.calculate_file_hashsum(hash_algo, self._destination)
+        hash_algo = self.get_checksum_algorithm(checksum)
+        if self._hasher and self._hasher.name == hash_algo:
+            dl_checksum = self._hasher.hexdigest()
+        else:
+            dl_checksum = fs.calculate_file_hashsum(hash_algo, self._destination)
         if checksum.lower() != dl_checksum.lower():
             raise PackageException(
                 "The checksum '{0}' of the downloaded file '{1}' "
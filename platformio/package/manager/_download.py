@@ -12,21 +12,26 @@
 # See the License for the specific language governing permissions and
 # limitations under the License.
 
+import contextlib
 import hashlib
 import logging
 import os
+import tarfile
 import tempfile
+import threading
 import time
 
 import click
 
-from platformio import app, compat, util
+from platformio import app, compat, fs, util
 from platformio.package.download import FileDownloader
 from platformio.package.lockfile import LockFile
+from platformio.package.unpack import FileUnpacker
 
 
 class PackageManagerDownloadMixin:
     DOWNLOAD_CACHE_EXPIRE = 86400 * 30  # keep package in a local cache for 1 month
+    _DOWNLOAD_USAGEDB_LOCK = threading.Lock()  # file locks do not guard threads
 
     def compute_download_path(self, *args):
         request_hash = hashlib.new("sha1")
@@ -39,8 +44,9 @@ class PackageManagerDownloadMixin:
         return os.path.join(self.get_download_dir(), "usage.db")
 
     def set_download_utime(self, path, utime=None):
-        with app.State(self.get_download_usagedb_path(), lock=True) as state:
-            state[os.path.basename(path)] = int(time.time() if not utime else utime)
+        with self._DOWNLOAD_USAGEDB_LOCK:
+            with app.State(self.get_download_usagedb_path(), lock=True) as state:
+                state[os.path.basename(path)] = int(time.time() if not utime else utime)
 
     @util.memoized(DOWNLOAD_CACHE_EXPIRE)
     def cleanup_expired_downloads(self, _=None):
@@ -54,47 +60,102 @@ class PackageManagerDownloadMixin:
                 if os.path.isfile(dl_path):
                     os.remove(dl_path)
 
-    def download(self, url, checksum=None):
-        silent = not self.log.isEnabledFor(logging.INFO)
+    def download(self, url, checksum=None, silent=None, downloader=None):
+        """The `downloader` is the already opened `FileDownloader` of the `url`"""
+        if silent is None:
+            silent = not self.log.isEnabledFor(logging.INFO)
         dl_path = self.compute_download_path(url, checksum or "")
         if os.path.isfile(dl_path):
             self.set_download_utime(dl_path)
             return dl_path
 
+        # an interrupted download is resumed from the "dl_path.part" file
         with_progress = not app.is_disabled_progressbar()
-        tmp_fd, tmp_path = tempfile.mkstemp(dir=self.get_download_dir())
-        try:
-            with LockFile(dl_path):
-                try:
-                    fd = FileDownloader(url)
-                    fd.set_destination(tmp_path)
-                    fd.start(with_progress=with_progress, silent=silent)
-                except IOError as exc:
-                    raise_error = not silent
-                    if with_progress:
-                        try:
-                            fd = FileDownloader(url)
-                            fd.set_destination(tmp_path)
-                            fd.start(with_progress=False, silent=silent)
-                        except IOError:
-                            raise_error = True
-                    if raise_error:
-                        self.log.error(
-                            click.style(
-                                "Error: Please read https://bit.ly/package-manager-ioerror",
-                                fg="red",
-                            )
+        with LockFile(dl_path):
+            if os.path.isfile(dl_path):  # downloaded by another process
+                self.set_download_utime(dl_path)
+                return dl_path
+            try:
+                fd = downloader or FileDownloader(url)
+                fd.set_destination(dl_path)
+                fd.start(with_progress=with_progress, silent=silent, checksum=checksum)
+            except IOError as exc:
+                raise_error = not silent
+                if with_progress:
+                    try:
+                        fd = FileDownloader(url)
+                        fd.set_destination(dl_path)
+                        fd.start(with_progress=False, silent=silent, checksum=checksum)
+                    except IOError:
+                        raise_error = True
+                if raise_error:
+                    self.log.error(
+                        click.style(
+                            "Error: Please read https://bit.ly/package-manager-ioerror",
+                            fg="red",
                         )
-                        raise exc
-            if checksum:
-                fd.verify(checksum)
-            os.close(tmp_fd)
-            os.rename(tmp_path, dl_path)
-        finally:
-            if os.path.isfile(tmp_path):
-                os.close(tmp_fd)
-                os.remove(tmp_path)
+                    )
+                    raise exc
 
         assert os.path.isfile(dl_path)
         self.set_download_utime(dl_path)
         return dl_path
+
+    def download_and_unpack(self, url, dst_dir, checksum=None):
+        """TAR archives are unpacked while they are being downloaded and hashed,
+        the others are downloaded to the local cache first"""
+        dl_path = self.compute_download_path(url, checksum or "")
+        fd = None
+        if not os.path.isfile(dl_path):
+            try:
+                # the response is reused by the regular download of other archives
+                fd = FileDownloader(url)
+                if fd.is_streamable() and self._stream_and_unpack(
+                    fd, dl_path, dst_dir, checksum
+                ):
+                    return True
+            except (IOError, tarfile.TarError) as exc:
+                fd = None
+                self.log.debug("Could not unpack a stream of %s: %s" % (url, exc))
+                fs.rmtree(dst_dir)
+                os.makedirs(dst_dir)
+        keep_download = os.path.isfile(dl_path) or app.get_setting(
+            "enable_download_cache"
+        )
+        dl_path = self.download(url, checksum, downloader=fd)
+        try:
+            return self.unpack(dl_path, dst_dir)
+        finally:
+            if not keep_download:
+                os.remove(dl_path)
+
+    def _stream_and_unpack(self, fd, dl_path, dst_dir, checksum=None):
+        keep_download = app.get_setting("enable_download_cache")
+        with LockFile(dl_path) if keep_download else contextlib.nullcontext():
+            if os.path.isfile(dl_path):  # downloaded by another process
+                return False
+            tmp_path = None
+            if keep_download:
+                tmp_fd, tmp_path = tempfile.mkstemp(dir=self.get_download_dir())
+                os.close(tmp_fd)
+                fd.set_destination(tmp_path)
+            try:
+                with fd.open_stream(
+                    with_progress=not app.is_disabled_progressbar(),
+                    silent=not self.log.isEnabledFor(logging.INFO),
+                    checksum=checksum,
+                    label="Downloading & Unpacking",
+                    save_to_destination=keep_download,
+                ) as stream:
+                    with FileUnpacker(fileobj=stream) as fu:
+                        fu.unpack(dst_dir)
+                    stream.raw.drain()
+                fd.verify(checksum)
+                if keep_download:
+                    os.replace(tmp_path, dl_path)
+            finally:
+                if tmp_path and os.path.isfile(tmp_path):
+                    os.remove(tmp_path)
+        if keep_download:
+            self.set_download_utime(dl_path)
+        return True
@@ -0,0 +1,113 @@
+# Copyright (c) 2014-present PlatformIO <contact@platformio.org>
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import hashlib
+import json
+import os
+import time
+
+from platformio import util
+from platformio.compat import hashlib_encode_data
+from platformio.package.meta import PackageItem, PackageMetadata, PackageSpec
+from platformio.project.config import ProjectConfig
+
+
+class PackageManagerIndexMixin:
+    """A persistent index of the installed packages per storage directory.
+
+    The package directory entries are validated by their modification
+    times, so the metadata and the manifests are loaded again only for
+    the added or changed packages. The modification times which are too
+    close to the indexing time are not trusted, because the next change
+    within the same file system tick would not be noticed.
+    """
+
+    INSTALLED_INDEX_VERSION = 1
+    INSTALLED_INDEX_RACY_DELAY = 2  # seconds
+
+    def get_installed_index_path(self):
+        return os.path.join(
+            ProjectConfig.get_instance().get("platformio", "cache_dir"),
+            "pkgindex",
+            "%s.json"
+            % hashlib.sha1(
+                hashlib_encode_data(os.path.realpath(self.package_dir))
+            ).hexdigest(),
+        )
+
+    def load_installed_index(self):
+        try:
+            with open(self.get_installed_index_path(), encoding="utf8") as fp:
+                data = json.load(fp)
+        except (OSError, ValueError):
+            return None
+        if (
+            data.get("version") != self.INSTALLED_INDEX_VERSION
+            or data.get("systype") != util.get_systype()
+        ):
+            return None
+        return data
+
+    def save_installed_index(self, dir_stamp, entries):
+        index_path = self.get_installed_index_path()
+        tmp_path = "%s.%d.tmp" % (index_path, os.getpid())
+        try:
+            self.ensure_dir_exists(os.path.dirname(index_path))
+            with open(tmp_path, mode="w", encoding="utf8") as fp:
+                json.dump(
+                    dict(
+                        version=self.INSTALLED_INDEX_VERSION,
+                        systype=util.get_systype(),
+                        package_dir=self.package_dir,
+                        stamp=dir_stamp,
+                        entries=entries,
+                    ),
+                    fp,
+                )
+            os.replace(tmp_path, index_path)
+        except OSError:
+            if os.path.isfile(tmp_path):
+                os.remove(tmp_path)
+
+    def get_installed_index_stamp(self, *paths):
+        """Returns the modification times of the paths or `None` if they are
+        missing or too recent to be trusted"""
+        result = []
+        threshold = (time.time() - self.INSTALLED_INDEX_RACY_DELAY) * 1e9
+        for path in paths:
+            try:
+                mtime = os.stat(path).st_mtime_ns if path else 0
+            except OSError:
+                return None
+            if mtime > threshold:
+                return None
+            result.append(mtime)
+        return result
+
+    @staticmethod
+    def find_package_metafile(pkg):
+        for location in pkg.get_metafile_locations():
+            path = os.path.join(location, PackageItem.METAFILE_NAME)
+            if os.path.isfile(path):
+                return path
+        return None
+
+    @staticmethod
+    def index_entry_to_package(entry):
+        if not entry["metadata"]:
+            return None
+        data = dict(entry["metadata"])
+        if data["spec"]:
+            data["spec"] = PackageSpec(**data["spec"])
+        return PackageItem(entry["path"], PackageMetadata(**data))
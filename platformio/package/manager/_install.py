@@ -16,11 +16,13 @@ import hashlib
 import os
 import shutil
 import tempfile
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
 
 import click
 
 from platformio import app, compat, fs, util
 from platformio.package.exception import PackageException, UnknownPackageError
+from platformio.package.manifest.parser import ManifestParserFactory
 from platformio.package.meta import PackageCompatibility, PackageItem
 from platformio.package.unpack import FileUnpacker
 from platformio.package.vcsclient import VCSClientFactory
@@ -28,6 +30,7 @@ from platformio.package.vcsclient import VCSClientFactory
 
 class PackageManagerInstallMixin:
     _INSTALL_HISTORY = None  # avoid circle dependencies
+    FETCH_WORKERS = 4
 
     @staticmethod
     def unpack(src, dst):
@@ -97,14 +100,7 @@ class PackageManagerInstallMixin:
             pkg = self.install_from_uri(spec.uri, spec)
         else:
             pkg = self.install_from_registry(
-                spec,
-                search_qualifiers=(
-                    compatibility.to_search_qualifiers(
-                        ["platforms", "frameworks", "authors"]
-                    )
-                    if compatibility
-                    else None
-                ),
+                spec, search_qualifiers=self._get_search_qualifiers(compatibility)
             )
 
         if not pkg or not pkg.metadata:
@@ -138,6 +134,7 @@ class PackageManagerInstallMixin:
             return
         if print_header:
             self.log.info("Resolving dependencies...")
+        self.prefetch_packages(self._get_prefetch_items(dependencies))
         for dependency in dependencies:
             try:
                 self.install_dependency(dependency)
@@ -169,6 +166,83 @@ class PackageManagerInstallMixin:
             compatibility=dependency_compatibility,
         )
 
+    @staticmethod
+    def _get_search_qualifiers(compatibility):
+        if not compatibility:
+            return None
+        return compatibility.to_search_qualifiers(
+            ["platforms", "frameworks", "authors"]
+        )
+
+    def _get_prefetch_items(self, dependencies):
+        items = []
+        for dependency in dependencies or []:
+            dependency_compatibility = PackageCompatibility.from_dependency(dependency)
+            if not self.compatibility or dependency_compatibility.is_compatible(
+                self.compatibility
+            ):
+                items.append(
+                    (
+                        self.dependency_to_spec(dependency),
+                        self._get_search_qualifiers(dependency_compatibility),
+                    )
+                )
+        return items
+
+    def _get_pending_prefetch_items(self, items):
+        pending = {}
+        for spec, search_qualifiers in items:
+            spec = self.ensure_spec(spec)
+            key = (spec, str(search_qualifiers))
+            if (
+                spec.external
+                or key in self._prefetched_specs
+                or (self._INSTALL_HISTORY and spec in self._INSTALL_HISTORY)
+                or self.get_package(spec)
+            ):
+                continue
+            self._prefetched_specs.add(key)
+            pending[key] = (spec, search_qualifiers)
+        return list(pending.values())
+
+    def prefetch_packages(self, items):
+        """Resolve and download registry packages and their dependencies
+        concurrently, so the next installations reuse the resolved packages
+        and unpack them from the local cache.
+        The `items` is a list of `(spec, search_qualifiers)`."""
+        if not app.get_setting("enable_download_cache"):
+            return
+        items = self._get_pending_prefetch_items(items)
+        if not items:
+            return
+        with ThreadPoolExecutor(
+            max_workers=self.FETCH_WORKERS, thread_name_prefix="pio-pkg-fetch"
+        ) as executor:
+            futures = set(
+                executor.submit(self._prefetch_package, *item) for item in items
+            )
+            # the dependencies are discovered from the downloaded archives
+            while futures:
+                done, futures = wait(futures, return_when=FIRST_COMPLETED)
+                for future in done:
+                    for item in self._get_pending_prefetch_items(future.result()):
+                        futures.add(executor.submit(self._prefetch_package, *item))
+
+    def _prefetch_package(self, spec, search_qualifiers):
+        """Returns the dependencies of the downloaded package"""
+        try:
+            dl_path = self.fetch_from_registry(spec, search_qualifiers)
+            if dl_path:
+                return self._get_prefetch_items(
+                    ManifestParserFactory.new_from_archive(dl_path)
+                    .as_dict()
+                    .get("dependencies")
+                )
+        except Exception as exc:  # pylint: disable=broad-except
+            # will be reported by the installation
+            self.log.debug("Could not prefetch %s: %s" % (spec.humanize(), exc))
+        return []
+
     def install_from_uri(self, uri, spec, checksum=None):
         spec = self.ensure_spec(spec)
 
@@ -186,9 +260,7 @@ class PackageManagerInstallMixin:
                     fs.rmtree(tmp_dir)
                     shutil.copytree(_uri, tmp_dir, symlinks=True)
             elif uri.startswith(("http://", "https://")):
-                dl_path = self.download(uri, checksum)
-                assert os.path.isfile(dl_path)
-                self.unpack(dl_path, tmp_dir)
+                self.download_and_unpack(uri, tmp_dir, checksum)
             else:
                 vcs = VCSClientFactory.new(tmp_dir, uri)
                 assert vcs.export()
@@ -253,6 +325,13 @@ class PackageManagerInstallMixin:
             if os.path.isdir(path):
                 fs.rmtree(path)
 
+        def _move_dir(src, dst):
+            try:
+                os.replace(src, dst)
+            except OSError:
+                # across devices
+                shutil.copytree(src, dst, symlinks=True)
+
         if action == "detach-existing":
             target_dirname = "%s@%s" % (
                 tmp_pkg.get_safe_dirname(),
@@ -268,10 +347,10 @@ class PackageManagerInstallMixin:
             # move existing into the new place
             pkg_dir = os.path.join(self.package_dir, target_dirname)
             _cleanup_dir(pkg_dir)
-            shutil.copytree(dst_pkg.path, pkg_dir, symlinks=True)
+            _move_dir(dst_pkg.path, pkg_dir)
             # move new source to the destination location
             _cleanup_dir(dst_pkg.path)
-            shutil.copytree(tmp_pkg.path, dst_pkg.path, symlinks=True)
+            _move_dir(tmp_pkg.path, dst_pkg.path)
             return PackageItem(dst_pkg.path)
 
         if action == "detach-new":
@@ -288,10 +367,10 @@ class PackageManagerInstallMixin:
                 )
             pkg_dir = os.path.join(self.package_dir, target_dirname)
             _cleanup_dir(pkg_dir)
-            shutil.copytree(tmp_pkg.path, pkg_dir, symlinks=True)
+            _move_dir(tmp_pkg.path, pkg_dir)
             return PackageItem(pkg_dir)
 
         # otherwise, overwrite existing
         _cleanup_dir(dst_pkg.path)
-        shutil.copytree(tmp_pkg.path, dst_pkg.path, symlinks=True)
+        _move_dir(tmp_pkg.path, dst_pkg.path)
         return PackageItem(dst_pkg.path)
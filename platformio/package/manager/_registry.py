@@ -16,17 +16,73 @@ import time
 
 import click
 
-from platformio import util
+from platformio import app, util
 from platformio.package.exception import IncompatiblePackageError, UnknownPackageError
 from platformio.package.meta import PackageSpec, PackageType
 from platformio.package.version import cast_version_to_semver
 from platformio.registry.client import RegistryClient
+from platformio.registry.index import RegistryIndex
 from platformio.registry.mirror import RegistryFileMirrorIterator
 
 
 class PackageManagerRegistryMixin:
     def install_from_registry(self, spec, search_qualifiers=None):
-        package = version = None
+        package, version, pkgfile = self.resolve_registry_package(
+            spec, search_qualifiers
+        )
+        spec = PackageSpec(
+            owner=package["owner"]["username"],
+            id=package["id"],
+            name=package["name"],
+        )
+        for url, checksum in RegistryFileMirrorIterator(pkgfile["download_url"]):
+            checksum = checksum or pkgfile["checksum"]["sha256"]
+            try:
+                if self.is_store_enabled() and url.startswith(("http://", "https://")):
+                    return self.install_from_store(url, spec, version["name"], checksum)
+                return self.install_from_uri(url, spec, checksum)
+            except Exception as exc:  # pylint: disable=broad-except
+                self.log.warning(
+                    click.style("Warning! Package Mirror: %s" % exc, fg="yellow")
+                )
+                self.log.warning(
+                    click.style("Looking for another mirror...", fg="yellow")
+                )
+
+        return None
+
+    def fetch_from_registry(self, spec, search_qualifiers=None):
+        """Download a package archive to the local cache without installing,
+        returns a path to the archive"""
+        _, _, pkgfile = self.resolve_registry_package(
+            spec, search_qualifiers, silent=True
+        )
+        for url, checksum in RegistryFileMirrorIterator(pkgfile["download_url"]):
+            if not url.startswith(("http://", "https://")):
+                return None
+            try:
+                return self.download(
+                    url, checksum or pkgfile["checksum"]["sha256"], silent=True
+                )
+            except Exception:  # pylint: disable=broad-except
+                pass
+        return None
+
+    def resolve_registry_package(self, spec, search_qualifiers=None, silent=False):
+        """Returns a registry package, the best version and its compatible file.
+        The result is reused by the next calls with the same arguments."""
+        key = (spec, str(search_qualifiers))
+        if key not in self._registry_resolutions:
+            self._registry_resolutions[key] = self._resolve_registry_package(
+                spec, search_qualifiers
+            )
+        package, version, pkgfile, candidates = self._registry_resolutions[key]
+        if candidates and not silent:
+            self.print_multi_package_issue(self.log.warning, candidates, spec)
+        return package, version, pkgfile
+
+    def _resolve_registry_package(self, spec, search_qualifiers=None):
+        package = version = candidates = None
         if spec.owner and spec.name and not search_qualifiers:
             package = self.fetch_registry_package(spec)
             if not package:
@@ -37,7 +93,7 @@ class PackageManagerRegistryMixin:
             if not packages:
                 raise UnknownPackageError(spec.humanize())
             if len(packages) > 1:
-                self.print_multi_package_issue(self.log.warning, packages, spec)
+                candidates = packages
             package, version = self.find_best_registry_version(packages, spec)
 
         if not package or not version:
@@ -49,32 +105,21 @@ class PackageManagerRegistryMixin:
                 raise IncompatiblePackageError(spec.humanize(), util.get_systype())
             raise UnknownPackageError(spec.humanize())
 
-        for url, checksum in RegistryFileMirrorIterator(pkgfile["download_url"]):
-            try:
-                return self.install_from_uri(
-                    url,
-                    PackageSpec(
-                        owner=package["owner"]["username"],
-                        id=package["id"],
-                        name=package["name"],
-                    ),
-                    checksum or pkgfile["checksum"]["sha256"],
-                )
-            except Exception as exc:  # pylint: disable=broad-except
-                self.log.warning(
-                    click.style("Warning! Package Mirror: %s" % exc, fg="yellow")
-                )
-                self.log.warning(
-                    click.style("Looking for another mirror...", fg="yellow")
-                )
-
-        return None
+        return package, version, pkgfile, candidates
 
     def get_registry_client_instance(self):
         if not self._registry_client:
             self._registry_client = RegistryClient()
         return self._registry_client
 
+    @staticmethod
+    def get_registry_index_instance():
+        """Returns the local registry snapshot if the resolver should use it"""
+        if not app.get_setting("enable_registry_index"):
+            return None
+        index = RegistryIndex.get_instance()
+        return index if index.exists() else None
+
     def search_registry_packages(self, spec, qualifiers=None):
         assert isinstance(spec, PackageSpec)
         qualifiers = qualifiers or {}
@@ -85,12 +130,24 @@ class PackageManagerRegistryMixin:
             qualifiers["names"] = spec.name.lower()
             if spec.owner:
                 qualifiers["owners"] = spec.owner.lower()
+        index = self.get_registry_index_instance()
+        if index:
+            result = index.search(qualifiers)
+            if result:
+                return result
         return self.get_registry_client_instance().list_packages(qualifiers=qualifiers)[
             "items"
         ]
 
     def fetch_registry_package(self, spec):
         assert isinstance(spec, PackageSpec)
+        index = self.get_registry_index_instance()
+        if index:
+            result = index.get_package(
+                self.pkg_type, owner=spec.owner, name=spec.name, id_=spec.id
+            )
+            if result:
+                return result
         result = None
         regclient = self.get_registry_client_instance()
         if spec.owner and spec.name:
@@ -163,7 +220,8 @@ class PackageManagerRegistryMixin:
             )
             if version:
                 return (package, version)
-            time.sleep(1)
+            if not self.get_registry_index_instance():
+                time.sleep(1)
         return (None, None)
 
     def get_compatible_registry_versions(self, versions, spec=None, custom_system=None):
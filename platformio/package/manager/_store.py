@@ -0,0 +1,153 @@
+# Copyright (c) 2014-present PlatformIO <contact@platformio.org>
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import os
+import re
+import shutil
+import sys
+import tempfile
+
+from platformio import app, fs
+from platformio.package.lockfile import LockFile
+from platformio.package.meta import PackageItem, PackageType
+from platformio.project.config import ProjectConfig
+
+try:
+    import fcntl
+except ImportError:
+    fcntl = None
+
+
+class PackageManagerStoreMixin:
+    """A content-addressed store of the registry libraries shared between
+    the projects and environments. The packages are materialized from the
+    store with reflinks (copies on the other file systems), or with hard links
+    when `enable_library_store_hardlinks` is set. The hard linked files are
+    shared between all projects, so they are read-only by convention"""
+
+    STORE_MARKER_NAME = ".piostore"
+    FICLONE = 0x40049409  # Linux ioctl, clones a file on the CoW file systems
+
+    @staticmethod
+    def get_store_dir():
+        return os.path.join(
+            ProjectConfig.get_instance().get("platformio", "core_dir"), "libstore"
+        )
+
+    def is_store_enabled(self):
+        return self.pkg_type == PackageType.LIBRARY and app.get_setting(
+            "enable_library_store"
+        )
+
+    def get_store_entry_dir(self, spec, version, checksum):
+        return os.path.join(
+            self.get_store_dir(),
+            "%s@%s-%s"
+            % (
+                re.sub(r"[^\da-z\_\-\. ]", "_", spec.name, flags=re.I),
+                version,
+                checksum[:16].lower(),
+            ),
+        )
+
+    @classmethod
+    def get_store_refcount(cls, pkg):
+        """Returns a number of the packages which are linked to the store entry"""
+        return os.stat(os.path.join(pkg.path, cls.STORE_MARKER_NAME)).st_nlink - 1
+
+    def install_from_store(self, uri, spec, version, checksum):
+        entry_dir = self.get_store_entry_dir(spec, version, checksum)
+        self.ensure_dir_exists(self.get_store_dir())
+        with LockFile(entry_dir):
+            if not os.path.isdir(entry_dir):
+                self._add_to_store(uri, spec, checksum, entry_dir)
+        tmp_dir = tempfile.mkdtemp(prefix="pkg-installing-", dir=self.get_tmp_dir())
+        try:
+            pkg_dir = os.path.join(tmp_dir, "pkg")
+            self.link_store_tree(entry_dir, pkg_dir)
+            return self._install_tmp_pkg(PackageItem(pkg_dir))
+        finally:
+            if os.path.isdir(tmp_dir):
+                fs.rmtree(tmp_dir)
+
+    def _add_to_store(self, uri, spec, checksum, entry_dir):
+        tmp_dir = tempfile.mkdtemp(
+            prefix="pkg-storing-",
+            dir=self.ensure_dir_exists(os.path.join(self.get_store_dir(), ".tmp")),
+        )
+        try:
+            self.download_and_unpack(uri, tmp_dir, checksum)
+            root_dir = self.find_pkg_root(tmp_dir, spec)
+            pkg = PackageItem(root_dir, self.build_metadata(root_dir, spec))
+            pkg.dump_meta()
+            with open(
+                os.path.join(root_dir, self.STORE_MARKER_NAME), "w", encoding="utf8"
+            ) as fp:
+                fp.write(checksum)
+            os.replace(root_dir, entry_dir)
+        finally:
+            if os.path.isdir(tmp_dir):
+                fs.rmtree(tmp_dir)
+
+    def link_store_tree(self, src, dst):
+        # the package metadata is per installation, do not share it
+        private_names = (PackageItem.METAFILE_NAME,)
+        link_funcs = [self._reflink_file, shutil.copy2]
+        if app.get_setting("enable_library_store_hardlinks"):
+            link_funcs.insert(0, os.link)
+        for root, dirs, files in os.walk(src):
+            dst_root = os.path.join(dst, os.path.relpath(root, src))
+            os.makedirs(dst_root, exist_ok=True)
+            for name in dirs + files:
+                src_path = os.path.join(root, name)
+                dst_path = os.path.join(dst_root, name)
+                if os.path.islink(src_path):
+                    os.symlink(os.readlink(src_path), dst_path)
+                elif name in files:
+                    if name in private_names:
+                        shutil.copy2(src_path, dst_path)
+                        continue
+                    if name == self.STORE_MARKER_NAME:
+                        self._link_store_marker(src_path, dst_path)
+                        continue
+                    while True:
+                        try:
+                            link_funcs[0](src_path, dst_path)
+                            break
+                        except OSError:
+                            if len(link_funcs) == 1:
+                                raise
+                            link_funcs.pop(0)  # do not try it for the next files
+
+    @staticmethod
+    def _link_store_marker(src, dst):
+        # the hard links of the marker are the references to the store entry
+        try:
+            os.link(src, dst)
+        except OSError:
+            # a copy across devices does not depend on the store entry
+            shutil.copy2(src, dst)
+
+    @classmethod
+    def _reflink_file(cls, src, dst):
+        if not fcntl or not sys.platform.startswith("linux"):
+            raise OSError("Reflinks are not supported")
+        with open(src, "rb") as src_fp, open(dst, "wb") as dst_fp:
+            try:
+                fcntl.ioctl(dst_fp.fileno(), cls.FICLONE, src_fp.fileno())
+            except OSError:
+                dst_fp.close()
+                os.remove(dst)
+                raise
+        shutil.copystat(src, dst)
@@ -26,9 +26,11 @@ from platformio.compat import ci_strings_are_equal
 from platformio.package.exception import ManifestException, MissingPackageManifestError
 from platformio.package.lockfile import LockFile
 from platformio.package.manager._download import PackageManagerDownloadMixin
+from platformio.package.manager._index import PackageManagerIndexMixin
 from platformio.package.manager._install import PackageManagerInstallMixin
 from platformio.package.manager._legacy import PackageManagerLegacyMixin
 from platformio.package.manager._registry import PackageManagerRegistryMixin
+from platformio.package.manager._store import PackageManagerStoreMixin
 from platformio.package.manager._symlink import PackageManagerSymlinkMixin
 from platformio.package.manager._uninstall import PackageManagerUninstallMixin
 from platformio.package.manager._update import PackageManagerUpdateMixin
@@ -48,9 +50,11 @@ class ClickLoggingHandler(logging.Handler):
         click.echo(self.format(record))
 
 
-class BasePackageManager(  # pylint: disable=too-many-public-methods,too-many-instance-attributes
+class BasePackageManager(  # pylint: disable=too-many-public-methods,too-many-instance-attributes,too-many-ancestors
     PackageManagerDownloadMixin,
+    PackageManagerIndexMixin,
     PackageManagerRegistryMixin,
+    PackageManagerStoreMixin,
     PackageManagerSymlinkMixin,
     PackageManagerInstallMixin,
     PackageManagerUninstallMixin,
@@ -70,6 +74,8 @@ class BasePackageManager(  # pylint: disable=too-many-public-methods,too-many-in
         self._download_dir = None
         self._tmp_dir = None
         self._registry_client = None
+        self._registry_resolutions = {}
+        self._prefetched_specs = set()
 
     def __repr__(self):
         return (
@@ -216,7 +222,7 @@ class BasePackageManager(  # pylint: disable=too-many-public-methods,too-many-in
             metadata.version = self.generate_rand_version()
         return metadata
 
-    def get_installed(self):  # pylint: disable=too-many-branches
+    def get_installed(self):
         if not os.path.isdir(self.package_dir):
             return []
 
@@ -224,39 +230,70 @@ class BasePackageManager(  # pylint: disable=too-many-public-methods,too-many-in
         if self.memcache_get(cache_key):
             return self.memcache_get(cache_key)
 
+        # the package directory is listed only if its entries have changed
+        index = self.load_installed_index() or {}
+        index_entries = {entry["name"]: entry for entry in index.get("entries", [])}
+        dir_stamp = self.get_installed_index_stamp(self.package_dir)
+        if dir_stamp and dir_stamp == index.get("stamp"):
+            names = list(index_entries)
+        else:
+            names = sorted(os.listdir(self.package_dir))
+
         result = []
-        for name in sorted(os.listdir(self.package_dir)):
+        entries = []
+        for name in names:
             if name.startswith("_tmp_installing"):  # legacy tmp folder
                 continue
-            pkg = None
             path = os.path.join(self.package_dir, name)
-            if os.path.isdir(path):
-                pkg = PackageItem(path)
-            elif self.is_symlink(path):
+            entry = index_entries.get(name)
+            if self.is_symlink(path):
+                # the linked packages are resolved on each call
+                entry = dict(name=name, link=True)
                 pkg = self.get_symlinked_package(path)
-            if not pkg:
-                continue
-            if not pkg.metadata:
-                try:
-                    spec = self.build_legacy_spec(pkg.path)
-                    pkg.metadata = self.build_metadata(pkg.path, spec)
-                except MissingPackageManifestError:
-                    pass
-            if not pkg.metadata:
+            elif (
+                entry
+                and entry.get("stamp")
+                and entry["stamp"]
+                == (self.get_installed_index_stamp(path, entry["metafile"]))
+            ):
+                pkg = self.index_entry_to_package(entry)
+            elif os.path.isdir(path):
+                pkg, entry = self._load_installed_package(name, path)
+            else:
                 continue
-            if self.pkg_type == PackageType.TOOL:
-                try:
-                    if not self.is_system_compatible(
-                        self.load_manifest(pkg).get("system")
-                    ):
-                        continue
-                except MissingPackageManifestError:
-                    pass
-            result.append(pkg)
+            entries.append(entry)
+            if pkg and pkg.metadata:
+                result.append(pkg)
 
+        if dir_stamp != index.get("stamp") or entries != index.get("entries"):
+            self.save_installed_index(dir_stamp, entries)
         self.memcache_set(cache_key, result)
         return result
 
+    def _load_installed_package(self, name, path):
+        pkg = PackageItem(path)
+        metafile = self.find_package_metafile(pkg)
+        if not pkg.metadata:
+            try:
+                spec = self.build_legacy_spec(pkg.path)
+                pkg.metadata = self.build_metadata(pkg.path, spec)
+            except MissingPackageManifestError:
+                pass
+        if pkg.metadata and self.pkg_type == PackageType.TOOL:
+            try:
+                if not self.is_system_compatible(self.load_manifest(pkg).get("system")):
+                    pkg.metadata = None
+            except MissingPackageManifestError:
+                pass
+        entry = dict(
+            name=name,
+            path=path,
+            metafile=metafile,
+            stamp=self.get_installed_index_stamp(path, metafile),
+            metadata=pkg.metadata.as_dict() if pkg.metadata else None,
+        )
+        return pkg, entry
+
     def get_package(self, spec):
         if isinstance(spec, PackageItem):
             return spec
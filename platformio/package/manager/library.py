@@ -15,7 +15,7 @@
 import json
 import os
 
-from platformio import util
+from platformio import fs, util
 from platformio.package.exception import MissingPackageManifestError
 from platformio.package.manager.base import BasePackageManager
 from platformio.package.meta import PackageSpec, PackageType
@@ -122,3 +122,24 @@ class LibraryPackageManager(BasePackageManager):  # pylint: disable=too-many-anc
                 if lib.get("name") == name:
                     return True
         return False
+
+
+def remove_unnecessary_library_store_packages(dry_run=False):
+    candidates = []
+    lm = LibraryPackageManager(LibraryPackageManager.get_store_dir())
+    for pkg in lm.get_installed():
+        try:
+            if lm.get_store_refcount(pkg) > 0:
+                continue
+        except OSError:  # not a store entry
+            continue
+        candidates.append(pkg)
+
+    if dry_run:
+        return candidates
+
+    # the entries are not managed as the regular packages
+    for pkg in candidates:
+        fs.rmtree(pkg.path)
+
+    return candidates
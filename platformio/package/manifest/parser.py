@@ -112,7 +112,6 @@ class ManifestParserFactory:
 
     @staticmethod
     def new_from_archive(path):
-        assert path.endswith("tar.gz")
         with tarfile.open(path, mode="r:gz") as tf:
             for t in sorted(ManifestFileType.items().values()):
                 for member in (t, "./" + t):
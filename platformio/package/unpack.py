@@ -14,6 +14,10 @@
 
 import os
 import sys
+import tarfile
+import threading
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
 from tarfile import open as tarfile_open
 from time import mktime
 from zipfile import ZipFile
@@ -33,8 +37,15 @@ class ExtractArchiveItemError(PackageException):
 
 
 class BaseArchiver:
+    # extracting is bound by the file system latency rather than by CPU,
+    # though the threads only add overhead on a single core
+    MAX_WORKERS = min(16, os.cpu_count() * 2) if (os.cpu_count() or 1) > 1 else 1
+    PARALLEL_MIN_ITEMS = 64
+    BATCH_ITEMS = 32  # per a task of the worker
+
     def __init__(self, arhfileobj):
         self._afo = arhfileobj
+        self.extracted_items = set()
 
     def get_items(self):
         raise NotImplementedError()
@@ -48,19 +59,47 @@ class BaseArchiver:
     def extract_item(self, item, dest_dir):
         self._afo.extract(item, dest_dir)
         self.after_extract(item, dest_dir)
+        self.extracted_items.add(self.get_item_filename(item))
 
     def after_extract(self, item, dest_dir):
         pass
 
+    def extract_items(self, items, dest_dir):
+        """Extracts the items and yields them in order of completion"""
+        for item in items:
+            self.extract_item(item, dest_dir)
+            yield item
+
+    def is_parallel_applicable(self, items):
+        try:
+            return self.MAX_WORKERS > 1 and len(items) >= self.PARALLEL_MIN_ITEMS
+        except TypeError:  # unknown length of a stream
+            return self.MAX_WORKERS > 1
+
     def close(self):
         self._afo.close()
 
 
 class TARArchiver(BaseArchiver):
-    def __init__(self, archpath):
-        super().__init__(tarfile_open(archpath))  # pylint: disable=consider-using-with
+    MAX_BUFFERED_SIZE = 64 * 1024 * 1024  # data read ahead of the writers
+    MAX_BUFFERED_ITEM_SIZE = 4 * 1024 * 1024
+
+    def __init__(self, archpath=None, fileobj=None):
+        # a file object is read sequentially, without seeking
+        self.streaming = fileobj is not None
+        super().__init__(
+            tarfile_open(  # pylint: disable=consider-using-with
+                archpath,
+                mode="r|*" if self.streaming else "r",
+                fileobj=fileobj,
+            )
+        )
+        self._realdirs = {}
 
     def get_items(self):
+        if self.streaming:
+            # members are read while they are being extracted
+            return iter(self._afo)
         return self._afo.getmembers()
 
     def get_item_filename(self, item):
@@ -74,8 +113,19 @@ class TARArchiver(BaseArchiver):
     def resolve_path(path):
         return os.path.realpath(os.path.abspath(path))
 
+    def resolve_dir(self, path):
+        # the resolved directories are reset by the extracted links
+        path = os.path.abspath(path)
+        if path not in self._realdirs:
+            self._realdirs[path] = self.resolve_path(path)
+        return self._realdirs[path]
+
+    def resolve_item_path(self, path):
+        parent, name = os.path.split(os.path.abspath(path))
+        return os.path.normpath(os.path.join(self.resolve_dir(parent), name))
+
     def is_bad_path(self, path, base):
-        return not self.resolve_path(os.path.join(base, path)).startswith(base)
+        return not self.resolve_item_path(os.path.join(base, path)).startswith(base)
 
     def is_bad_link(self, item, base):
         return not self.resolve_path(
@@ -83,28 +133,138 @@ class TARArchiver(BaseArchiver):
         ).startswith(base)
 
     def extract_item(self, item, dest_dir):
+        if self.is_link(item):
+            self._realdirs.clear()
         if sys.version_info >= (3, 12):
             self._afo.extract(item, dest_dir, filter="data")
+            self.extracted_items.add(item.name)
             return self.after_extract(item, dest_dir)
 
         # apply custom security logic
-        dest_dir = self.resolve_path(dest_dir)
+        dest_dir = self.resolve_dir(dest_dir)
+        if self.is_blocked_item(item, dest_dir):
+            return None
+        return super().extract_item(item, dest_dir)
+
+    def is_blocked_item(self, item, dest_dir):
         bad_conds = [
             self.is_bad_path(item.name, dest_dir),
             self.is_link(item) and self.is_bad_link(item, dest_dir),
         ]
         if any(bad_conds):
-            return click.secho(
+            click.secho(
                 "Blocked insecure item `%s` from TAR archive" % item.name,
                 fg="red",
                 err=True,
             )
-        return super().extract_item(item, dest_dir)
+            return True
+        return False
+
+    def filter_item(self, item, dest_dir):
+        """Returns a safe item which is extracted to the `dest_dir`
+        or None if the item is blocked"""
+        if sys.version_info >= (3, 12):
+            return tarfile.data_filter(item, dest_dir)
+        return None if self.is_blocked_item(item, dest_dir) else item
+
+    def extract_items(self, items, dest_dir):
+        """Regular files are read sequentially and written by a pool of threads,
+        other items are extracted in order after the pending files"""
+        if not self.is_parallel_applicable(items):
+            yield from super().extract_items(items, dest_dir)
+            return
+        dest_dir = self.resolve_dir(dest_dir)
+        pending = deque()
+        batch = []
+        buffered_size = 0
+        deferred_attrs = []
+        known_dirs = set()
+
+        def _complete(limit):
+            nonlocal buffered_size
+            while pending and (buffered_size > limit or pending[0][0].done()):
+                future, batch_items = pending.popleft()
+                future.result()
+                for item in batch_items:
+                    buffered_size -= item.size
+                    self.extracted_items.add(item.name)
+                    yield item
+
+        def _submit_batch():
+            pending.append(
+                (
+                    executor.submit(self._write_files, list(batch)),
+                    [item for _, _, _, item in batch],
+                )
+            )
+            batch.clear()
+
+        with ThreadPoolExecutor(max_workers=self.MAX_WORKERS) as executor:
+            for item in items:
+                if (
+                    item.type not in (tarfile.REGTYPE, tarfile.AREGTYPE)
+                    and not item.isdir()
+                ) or item.size > self.MAX_BUFFERED_ITEM_SIZE:
+                    if batch:
+                        _submit_batch()
+                    yield from _complete(0)
+                    self.extract_item(item, dest_dir)
+                    yield item
+                    continue
+                safe_item = self.filter_item(item, dest_dir)
+                if not safe_item:
+                    continue
+                path = os.path.join(dest_dir, safe_item.name.rstrip("/"))
+                if item.isdir():
+                    os.makedirs(path, exist_ok=True)
+                    known_dirs.add(path)
+                    deferred_attrs.append((path, safe_item))
+                    self.extracted_items.add(item.name)
+                    yield item
+                    continue
+                parent = os.path.dirname(path)
+                if parent not in known_dirs:
+                    os.makedirs(parent, exist_ok=True)
+                    known_dirs.add(parent)
+                batch.append(
+                    (path, self._afo.extractfile(item).read(), safe_item, item)
+                )
+                buffered_size += item.size
+                if len(batch) >= self.BATCH_ITEMS:
+                    _submit_batch()
+                    yield from _complete(self.MAX_BUFFERED_SIZE)
+            if batch:
+                _submit_batch()
+            yield from _complete(0)
+            # directories are the last, so their files are not affected
+            list(
+                executor.map(
+                    lambda args: self._set_attrs(*args), reversed(deferred_attrs)
+                )
+            )
+
+    @classmethod
+    def _write_files(cls, batch):
+        for path, data, safe_item, _ in batch:
+            with open(path, "wb") as fp:
+                fp.write(data)
+            cls._set_attrs(path, safe_item)
+
+    @staticmethod
+    def _set_attrs(path, item):
+        if item.mode is not None:
+            os.chmod(path, item.mode)
+        if item.mtime is not None:
+            os.utime(path, (item.mtime, item.mtime))
 
 
 class ZIPArchiver(BaseArchiver):
     def __init__(self, archpath):
         super().__init__(ZipFile(archpath))  # pylint: disable=consider-using-with
+        self._archpath = archpath
+        # a ZipFile object is not safe for reading from the multiple threads
+        self._thread_data = threading.local()
+        self._thread_afos = []
 
     @staticmethod
     def preserve_permissions(item, dest_dir):
@@ -133,14 +293,64 @@ class ZIPArchiver(BaseArchiver):
         self.preserve_permissions(item, dest_dir)
         self.preserve_mtime(item, dest_dir)
 
+    def extract_items(self, items, dest_dir):
+        """Members are extracted concurrently, the permissions and modification
+        time are applied when all members are written"""
+        if not self.is_parallel_applicable(items):
+            yield from super().extract_items(items, dest_dir)
+            return
+        with ThreadPoolExecutor(max_workers=self.MAX_WORKERS) as executor:
+            for batch in executor.map(
+                lambda batch: self._extract_members(batch, dest_dir),
+                [
+                    items[i : i + self.BATCH_ITEMS]
+                    for i in range(0, len(items), self.BATCH_ITEMS)
+                ],
+            ):
+                for item in batch:
+                    self.extracted_items.add(item.filename)
+                    yield item
+            # directories are the last, so their files are not affected
+            list(
+                executor.map(
+                    lambda item: self.after_extract(item, dest_dir),
+                    sorted(items, key=lambda item: item.is_dir()),
+                )
+            )
+
+    def _extract_members(self, items, dest_dir):
+        afo = getattr(self._thread_data, "afo", None)
+        if not afo:
+            afo = ZipFile(self._archpath)  # pylint: disable=consider-using-with
+            self._thread_data.afo = afo
+            self._thread_afos.append(afo)
+        for item in items:
+            try:
+                afo.extract(item, dest_dir)
+            except FileExistsError:
+                # a parent directory is created by the other thread
+                afo.extract(item, dest_dir)
+        return items
+
+    def close(self):
+        for afo in self._thread_afos:
+            afo.close()
+        super().close()
+
 
 class FileUnpacker:
-    def __init__(self, path):
+    def __init__(self, path=None, fileobj=None):
+        assert path or fileobj
         self.path = path
+        self.fileobj = fileobj
         self._archiver = None
 
     def __enter__(self):
-        self._archiver = self.new_archiver(self.path)
+        self._archiver = (
+            TARArchiver(fileobj=self.fileobj)
+            if self.fileobj
+            else self.new_archiver(self.path)
+        )
         return self
 
     def __exit__(self, *args):
@@ -172,18 +382,21 @@ class FileUnpacker:
         if not dest_dir:
             dest_dir = os.getcwd()
 
-        if not with_progress or silent:
+        if getattr(self._archiver, "streaming", False):
+            # the progress is reported by a reader of the stream
+            for _ in self._archiver.extract_items(items, dest_dir):
+                pass
+        elif not with_progress or silent:
             if not silent:
                 click.echo(f"{label}...")
-            for item in items:
-                self._archiver.extract_item(item, dest_dir)
+            for _ in self._archiver.extract_items(items, dest_dir):
+                pass
         elif not is_terminal():
             click.echo(f"{label} 0%", nl=False)
             print_percent_step = 10
             printed_percents = 0
             unpacked_nums = 0
-            for item in items:
-                self._archiver.extract_item(item, dest_dir)
+            for _ in self._archiver.extract_items(items, dest_dir):
                 unpacked_nums += 1
                 if (unpacked_nums / len(items) * 100) >= (
                     printed_percents + print_percent_step
@@ -193,22 +406,24 @@ class FileUnpacker:
             click.echo("")
         else:
             with click.progressbar(
-                items,
+                length=len(items),
                 label=label,
                 update_min_steps=min(50, len(items) / 100),  # every 50 files or less
             ) as pb:
-                for item in pb:
-                    self._archiver.extract_item(item, dest_dir)
+                for _ in self._archiver.extract_items(items, dest_dir):
+                    pb.update(1)
 
         if not check_unpacked:
             return True
 
-        # check on disk
+        # check the recorded items instead of the file system
         for item in self._archiver.get_items():
             filename = self._archiver.get_item_filename(item)
-            item_path = os.path.join(dest_dir, filename)
             try:
-                if not self._archiver.is_link(item) and not os.path.exists(item_path):
+                if (
+                    not self._archiver.is_link(item)
+                    and filename not in self._archiver.extracted_items
+                ):
                     raise ExtractArchiveItemError(filename, dest_dir)
             except NotImplementedError:
                 pass
@@ -0,0 +1,177 @@
+# Copyright (c) 2014-present PlatformIO <contact@platformio.org>
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import hashlib
+import json
+import os
+import time
+
+from platformio.compat import hashlib_encode_data
+from platformio.platform.board import PlatformBoardConfig
+from platformio.platform.exception import UnknownBoard
+
+
+class PlatformBoardsMixin:
+    """The boards of the platform are listed from a persistent index with
+    the brief data and the common options, the board manifests are loaded
+    lazily. The index is invalidated by the modification times of the boards
+    directories, and of the board manifests in the user directories."""
+
+    BOARDS_INDEX_VERSION = 1
+    BOARDS_INDEX_RACY_DELAY = 2  # seconds
+
+    def get_boards_dirs(self):
+        return [
+            self.config.get("platformio", "boards_dir"),
+            os.path.join(self.config.get("platformio", "core_dir"), "boards"),
+            os.path.join(self.get_dir(), "boards"),
+        ]
+
+    def get_boards(self, id_=None):
+        if id_ is None:
+            if not self._boards_loaded:
+                for board_id, data in self._load_boards_index(build=True).items():
+                    if board_id not in self._BOARDS_CACHE:
+                        self._BOARDS_CACHE[board_id] = PlatformBoardConfig(
+                            data["path"], data
+                        )
+                self._boards_loaded = True
+            return self._BOARDS_CACHE
+        if id_ not in self._BOARDS_CACHE:
+            index = self._load_boards_index(build=False)
+            if index is not None:
+                if id_ in index:
+                    self._BOARDS_CACHE[id_] = PlatformBoardConfig(
+                        index[id_]["path"], index[id_]
+                    )
+            else:
+                for boards_dir in self.get_boards_dirs():
+                    if not os.path.isdir(boards_dir):
+                        continue
+                    manifest_path = os.path.join(boards_dir, "%s.json" % id_)
+                    if os.path.isfile(manifest_path):
+                        self._append_board(id_, manifest_path)
+                        break
+        if id_ not in self._BOARDS_CACHE:
+            raise UnknownBoard(id_)
+        return self._BOARDS_CACHE[id_]
+
+    def board_config(self, id_):
+        assert id_
+        return self.get_boards(id_)
+
+    def _append_board(self, board_id, manifest_path, boards=None):
+        config = PlatformBoardConfig(manifest_path)
+        if "platform" in config and config.get("platform") != self.name:
+            return None
+        if "platforms" in config and self.name not in config.get("platforms"):
+            return None
+        config.manifest["platform"] = self.name
+        (self._BOARDS_CACHE if boards is None else boards)[board_id] = config
+        return config
+
+    def get_boards_index_path(self):
+        return os.path.join(
+            self.config.get("platformio", "cache_dir"),
+            "boardindex",
+            "%s.json"
+            % hashlib.sha1(
+                hashlib_encode_data(
+                    json.dumps([self.name, self.get_dir()] + self.get_boards_dirs())
+                )
+            ).hexdigest(),
+        )
+
+    def _get_boards_index_stamp(self):
+        """Returns the modification times of the boards directories and of
+        the board manifests in the user directories, or `None` if they are
+        too recent to be trusted or are being changed"""
+        result = []
+        threshold = (time.time() - self.BOARDS_INDEX_RACY_DELAY) * 1e9
+        platform_boards_dir = os.path.join(self.get_dir(), "boards")
+        for boards_dir in self.get_boards_dirs():
+            if not os.path.isdir(boards_dir):
+                result.append([boards_dir, None])
+                continue
+            paths = [boards_dir]
+            try:
+                # the boards of the installed platform are not edited in place
+                if boards_dir != platform_boards_dir:
+                    paths.extend(
+                        os.path.join(boards_dir, name)
+                        for name in sorted(os.listdir(boards_dir))
+                        if name.endswith(".json")
+                    )
+                for path in paths:
+                    mtime = os.stat(path).st_mtime_ns
+                    if mtime > threshold:
+                        return None
+                    result.append([path, mtime])
+            except OSError:  # removed in the meantime
+                return None
+        return result
+
+    def _load_boards_index(self, build=False):
+        """Returns the indexed boards, the index is (re)built only if `build`
+        is set, otherwise `None` is returned for the outdated index"""
+        index_path = self.get_boards_index_path()
+        stamp = self._get_boards_index_stamp()
+        try:
+            with open(index_path, encoding="utf8") as fp:
+                data = json.load(fp)
+            if (
+                stamp
+                and data["version"] == self.BOARDS_INDEX_VERSION
+                and data["stamp"] == stamp
+            ):
+                return data["boards"]
+        except (OSError, ValueError, KeyError):
+            pass
+        if not build:
+            return None
+
+        boards = {}
+        for boards_dir in self.get_boards_dirs():
+            if not os.path.isdir(boards_dir):
+                continue
+            for item in sorted(os.listdir(boards_dir)):
+                board_id = item[:-5]
+                if not item.endswith(".json") or board_id in boards:
+                    continue
+                self._append_board(board_id, os.path.join(boards_dir, item), boards)
+        # the loaded manifests are reused by this instance
+        for board_id, config in boards.items():
+            self._BOARDS_CACHE.setdefault(board_id, config)
+        result = {
+            board_id: dict(path=config.manifest_path, **config.get_index_data())
+            for board_id, config in boards.items()
+        }
+        if stamp:
+            self._save_boards_index(index_path, stamp, result)
+        return result
+
+    def _save_boards_index(self, index_path, stamp, boards):
+        tmp_path = "%s.%d.tmp" % (index_path, os.getpid())
+        try:
+            if not os.path.isdir(os.path.dirname(index_path)):
+                os.makedirs(os.path.dirname(index_path))
+            with open(tmp_path, mode="w", encoding="utf8") as fp:
+                json.dump(
+                    dict(version=self.BOARDS_INDEX_VERSION, stamp=stamp, boards=boards),
+                    fp,
+                )
+            os.replace(tmp_path, index_path)
+        except OSError:
+            if os.path.isfile(tmp_path):
+                os.remove(tmp_path)
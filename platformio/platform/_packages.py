@@ -70,6 +70,14 @@ class PlatformPackagesMixin:
         return self.pm.install(spec or self.get_package_spec(name), force=force)
 
     def install_required_packages(self, force=False):
+        if not force:
+            self.pm.prefetch_packages(
+                [
+                    (self.get_package_spec(name), None)
+                    for name, options in self.packages.items()
+                    if not options.get("optional")
+                ]
+            )
         for name, options in self.packages.items():
             if options.get("optional"):
                 continue
@@ -17,14 +17,17 @@ import json
 import os
 import re
 import sys
+import tempfile
 from urllib.parse import quote
 
 import click
 
-from platformio import app, fs, proc
+from platformio import app, fs, proc, tracing
 from platformio.compat import hashlib_encode_data
 from platformio.package.manager.core import get_core_package_dir
+from platformio.platform import daemon
 from platformio.platform.exception import BuildScriptNotFound
+from platformio.project.config import ProjectConfig
 from platformio.run.helpers import KNOWN_CLEAN_TARGETS, KNOWN_FULLCLEAN_TARGETS
 
 
@@ -60,12 +63,29 @@ class PlatformRunMixin:
         if not os.path.isfile(variables["build_script"]):
             raise BuildScriptNotFound(variables["build_script"])
 
-        result = self._run_scons(variables, targets, jobs)
+        if not tracing.is_enabled():
+            result = self._run_scons(variables, targets, jobs)
+        else:
+            result = self._run_scons_with_trace(variables, targets, jobs)
 
         assert "returncode" in result
 
         return result
 
+    def _run_scons_with_trace(self, variables, targets, jobs):
+        tracer = tracing.get_tracer()
+        fd, trace_path = tempfile.mkstemp(prefix="pio-trace-", suffix=".json")
+        os.close(fd)
+        start = tracer.now()
+        with tracer.span("SCons", cat="scons", targets=targets):
+            result = self._run_scons(
+                dict(variables, trace_file=trace_path), targets, jobs
+            )
+        timestamps = [e["ts"] for e in tracer.merge(trace_path) if "ts" in e]
+        if timestamps:
+            tracer.add_span("SCons startup", start, min(timestamps), cat="scons")
+        return result
+
     def _run_scons(self, variables, targets, jobs):
         scons_dir = get_core_package_dir("tool-scons")
         args = [
@@ -102,6 +122,15 @@ class PlatformRunMixin:
                 args, stdout=sys.stdout, stderr=sys.stderr, stdin=sys.stdin
             )
 
+        if daemon.is_supported() and app.get_setting("enable_build_daemon"):
+            result = self._run_scons_in_daemon(scons_dir, args[2:], variables)
+            if result:
+                return result
+
+        return proc.exec_command(args, **self._get_scons_pipes())
+
+    def _get_scons_pipes(self):
+        # pylint: disable=protected-access
         if click._compat.isatty(sys.stdout):
 
             def _write_and_flush(stream, data):
@@ -111,8 +140,7 @@ class PlatformRunMixin:
                 except IOError:
                     pass
 
-            return proc.exec_command(
-                args,
+            return dict(
                 stdout=proc.BuildAsyncPipe(
                     line_callback=self._on_stdout_line,
                     data_callback=lambda data: (
@@ -125,12 +153,32 @@ class PlatformRunMixin:
                 ),
             )
 
-        return proc.exec_command(
-            args,
+        return dict(
             stdout=proc.LineBufferedAsyncPipe(line_callback=self._on_stdout_line),
             stderr=proc.LineBufferedAsyncPipe(line_callback=self._on_stderr_line),
         )
 
+    def _run_scons_in_daemon(self, scons_dir, args, variables):
+        config = ProjectConfig.get_instance()
+        client = daemon.BuildDaemonClient(
+            daemon.get_socket_path(
+                os.getcwd(),
+                variables.get("pioenv"),
+                config.get("platformio", "core_dir"),
+            ),
+            scons_dir,
+            daemon.compute_checksum(scons_dir, config.to_json()),
+        )
+        try:
+            sock = client.connect()
+        except daemon.BuildDaemonBusy:
+            return None
+        except daemon.BuildDaemonError:
+            # not started yet or outdated, the next build will use a new one
+            client.spawn()
+            return None
+        return client.exec_command(sock, args, **self._get_scons_pipes())
+
     def _on_stdout_line(self, line):
         if "`buildprog' is up to date." in line:
             return
@@ -19,15 +19,15 @@ import semantic_version
 from platformio import __version__, fs
 from platformio.package.manager.tool import ToolPackageManager
 from platformio.package.version import pepver_to_semver
+from platformio.platform._boards import PlatformBoardsMixin
 from platformio.platform._packages import PlatformPackagesMixin
 from platformio.platform._run import PlatformRunMixin
-from platformio.platform.board import PlatformBoardConfig
-from platformio.platform.exception import IncompatiblePlatform, UnknownBoard
+from platformio.platform.exception import IncompatiblePlatform
 from platformio.project.config import ProjectConfig
 
 
 class PlatformBase(  # pylint: disable=too-many-instance-attributes,too-many-public-methods
-    PlatformPackagesMixin, PlatformRunMixin
+    PlatformBoardsMixin, PlatformPackagesMixin, PlatformRunMixin
 ):
     CORE_SEMVER = pepver_to_semver(__version__)
     _BOARDS_CACHE = {}
@@ -40,6 +40,7 @@ class PlatformBase(  # pylint: disable=too-many-instance-attributes,too-many-pub
 
         self._manifest = fs.load_json(manifest_path)
         self._BOARDS_CACHE = {}
+        self._boards_loaded = False
         self._custom_packages = None
 
         self.config = ProjectConfig.get_instance()
@@ -130,48 +131,6 @@ class PlatformBase(  # pylint: disable=too-many-instance-attributes,too-many-pub
                 return True
         return False
 
-    def get_boards(self, id_=None):
-        def _append_board(board_id, manifest_path):
-            config = PlatformBoardConfig(manifest_path)
-            if "platform" in config and config.get("platform") != self.name:
-                return
-            if "platforms" in config and self.name not in config.get("platforms"):
-                return
-            config.manifest["platform"] = self.name
-            self._BOARDS_CACHE[board_id] = config
-
-        bdirs = [
-            self.config.get("platformio", "boards_dir"),
-            os.path.join(self.config.get("platformio", "core_dir"), "boards"),
-            os.path.join(self.get_dir(), "boards"),
-        ]
-
-        if id_ is None:
-            for boards_dir in bdirs:
-                if not os.path.isdir(boards_dir):
-                    continue
-                for item in sorted(os.listdir(boards_dir)):
-                    _id = item[:-5]
-                    if not item.endswith(".json") or _id in self._BOARDS_CACHE:
-                        continue
-                    _append_board(_id, os.path.join(boards_dir, item))
-        else:
-            if id_ not in self._BOARDS_CACHE:
-                for boards_dir in bdirs:
-                    if not os.path.isdir(boards_dir):
-                        continue
-                    manifest_path = os.path.join(boards_dir, "%s.json" % id_)
-                    if os.path.isfile(manifest_path):
-                        _append_board(id_, manifest_path)
-                        break
-            if id_ not in self._BOARDS_CACHE:
-                raise UnknownBoard(id_)
-        return self._BOARDS_CACHE[id_] if id_ else self._BOARDS_CACHE
-
-    def board_config(self, id_):
-        assert id_
-        return self.get_boards(id_)
-
     def get_package_type(self, name):
         return self.packages[name].get("type")
 
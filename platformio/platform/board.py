@@ -22,22 +22,53 @@ from platformio.platform.exception import InvalidBoardManifest
 
 
 class PlatformBoardConfig:
-    def __init__(self, manifest_path):
+    # the options which are answered by the board index without loading
+    # the manifest, see `PlatformBoardsMixin`
+    INDEXED_OPTIONS = (
+        "name",
+        "url",
+        "vendor",
+        "frameworks",
+        "platform",
+        "platforms",
+        "build.mcu",
+        "build.hwids",
+    )
+
+    def __init__(self, manifest_path, index_data=None):
         self._id = os.path.basename(manifest_path)[:-5]
-        assert os.path.isfile(manifest_path)
         self.manifest_path = manifest_path
+        self._index_data = index_data
+        self._manifest = None
+        if not index_data:
+            self._load_manifest()
+
+    def _load_manifest(self):
+        if self._manifest is not None:
+            return self._manifest
+        assert os.path.isfile(self.manifest_path)
         try:
-            self._manifest = fs.load_json(manifest_path)
+            manifest = fs.load_json(self.manifest_path)
         except InvalidJSONFile as exc:
-            raise InvalidBoardManifest(manifest_path) from exc
-        if not set(["name", "url", "vendor"]) <= set(self._manifest):
+            raise InvalidBoardManifest(self.manifest_path) from exc
+        if not set(["name", "url", "vendor"]) <= set(manifest):
             raise UserSideException(
-                "Please specify name, url and vendor fields for " + manifest_path
+                "Please specify name, url and vendor fields for " + self.manifest_path
             )
+        if self._index_data and "platform" in self._index_data["options"]:
+            manifest["platform"] = self._index_data["options"]["platform"]
+        self._manifest = manifest
+        return manifest
 
     def get(self, path, default=MISSING):
+        if self._manifest is None and path in self.INDEXED_OPTIONS:
+            if path in self._index_data["options"]:
+                return self._index_data["options"][path]
+            if default != MISSING:
+                return default
+            raise KeyError("Invalid board option '%s'" % path)
         try:
-            value = self._manifest
+            value = self.manifest
             for k in path.split("."):
                 value = value[k]
             return value
@@ -46,6 +77,14 @@ class PlatformBoardConfig:
                 return default
         raise KeyError("Invalid board option '%s'" % path)
 
+    def get_index_data(self):
+        """Returns the brief data and the indexed options of the board"""
+        options = {}
+        for path in self.INDEXED_OPTIONS:
+            if path in self:
+                options[path] = self.get(path)
+        return {"brief": self.get_brief_data(), "options": options}
+
     def update(self, path, value):
         newdict = None
         for key in path.split(".")[::-1]:
@@ -53,7 +92,7 @@ class PlatformBoardConfig:
                 newdict = {key: value}
             else:
                 newdict = {key: newdict}
-        util.merge_dicts(self._manifest, newdict)
+        util.merge_dicts(self.manifest, newdict)
 
     def __contains__(self, key):
         try:
@@ -72,9 +111,11 @@ class PlatformBoardConfig:
 
     @property
     def manifest(self):
-        return self._manifest
+        return self._load_manifest()
 
     def get_brief_data(self):
+        if self._manifest is None:
+            return dict(self._index_data["brief"])
         result = {
             "id": self.id,
             "name": self._manifest["name"],
@@ -103,10 +144,10 @@ class PlatformBoardConfig:
         return result
 
     def get_debug_data(self):
-        if not self._manifest.get("debug", {}).get("tools"):
+        if not self.manifest.get("debug", {}).get("tools"):
             return None
         tools = {}
-        for name, options in self._manifest["debug"]["tools"].items():
+        for name, options in self.manifest["debug"]["tools"].items():
             tools[name] = {}
             for key, value in options.items():
                 if key in ("default", "onboard") and value:
@@ -114,12 +155,12 @@ class PlatformBoardConfig:
         return {"tools": tools}
 
     def get_debug_tool_name(self, custom=None):
-        debug_tools = self._manifest.get("debug", {}).get("tools")
+        debug_tools = self.manifest.get("debug", {}).get("tools")
         tool_name = custom
         if tool_name == "custom":
             return tool_name
         if not debug_tools:
-            raise DebugSupportError(self._manifest["name"])
+            raise DebugSupportError(self.manifest["name"])
         if tool_name:
             if tool_name in debug_tools:
                 return tool_name
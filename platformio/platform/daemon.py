@@ -0,0 +1,434 @@
+# Copyright (c) 2014-present PlatformIO <contact@platformio.org>
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""
+A long-lived build server which keeps a warm interpreter with SCons and
+PlatformIO modules already imported.
+
+The server is keyed by a project directory and an environment. Each build
+request is handled in a forked child, so the global state of SCons is always
+clean, while the interpreter startup and module imports are paid only once.
+The standard streams of a client are passed to the child via `SCM_RIGHTS`.
+
+The socket is created in a private (0700) directory of the user, and both
+sides check that the peer process belongs to the same user, because the
+environment variables and the streams of a build are sent over it.
+
+Only the startup is saved: the SConscript files, the platform and the
+construction environments are still processed from scratch by every build.
+"""
+
+import argparse
+import atexit
+import glob
+import hashlib
+import importlib
+import json
+import os
+import select
+import signal
+import socket
+import stat
+import struct
+import subprocess
+import sys
+import tempfile
+
+from platformio import __version__
+from platformio.compat import IS_WINDOWS, hashlib_encode_data
+
+IDLE_TIMEOUT = 1800  # seconds
+CONNECT_TIMEOUT = 5  # seconds
+MAX_MESSAGE_SIZE = 1024 * 1024
+
+PRELOAD_MODULES = (
+    "SCons.Script",
+    "SCons.Script.Main",
+    "SCons.Environment",
+    "SCons.Defaults",
+    "SCons.Builder",
+    "SCons.Scanner.C",
+    "SCons.Tool",
+    "SCons.dblite",
+    "click",
+    "semantic_version",
+    "platformio.package.manager.library",
+    "platformio.package.manager.tool",
+    "platformio.package.manifest.parser",
+    "platformio.platform.factory",
+    "platformio.project.config",
+    "platformio.project.helpers",
+)
+
+
+class BuildDaemonError(Exception):
+    pass
+
+
+class BuildDaemonBusy(BuildDaemonError):
+    pass
+
+
+def is_supported():
+    return not IS_WINDOWS and hasattr(socket, "send_fds") and hasattr(os, "fork")
+
+
+def compute_checksum(scons_dir, config_json):
+    data = [
+        __version__,
+        sys.executable,
+        scons_dir,
+        config_json,
+        json.dumps(
+            sorted(
+                (key, value)
+                for key, value in os.environ.items()
+                if key.startswith(("PLATFORMIO_", "PYTHON"))
+            )
+        ),
+    ]
+    return hashlib.sha1(hashlib_encode_data("\n".join(data))).hexdigest()
+
+
+def get_socket_path(project_dir, env, core_dir):
+    key = hashlib.sha1(
+        hashlib_encode_data("%s:%s:%s" % (core_dir, project_dir, env))
+    ).hexdigest()[:16]
+    # the length of a socket path is limited, so it is not kept in `core_dir`
+    return os.path.join(
+        os.environ.get("XDG_RUNTIME_DIR") or tempfile.gettempdir(),
+        "pio-sconsd-%d" % os.getuid(),
+        "%s.sock" % key,
+    )
+
+
+def ensure_socket_dir(socket_path):
+    """Creates the private directory of the socket and checks that it is not
+    accessible to the other users"""
+    socket_dir = os.path.dirname(socket_path)
+    try:
+        os.mkdir(socket_dir, 0o700)
+    except FileExistsError:
+        pass
+    except OSError as exc:
+        raise BuildDaemonError(str(exc)) from exc
+    info = os.lstat(socket_dir)
+    if (
+        not stat.S_ISDIR(info.st_mode)
+        or info.st_uid != os.getuid()
+        or info.st_mode & 0o077
+    ):
+        raise BuildDaemonError("Insecure socket directory %s" % socket_dir)
+
+
+def get_peer_uid(sock):
+    """Returns the user ID of the peer process, or None when the platform
+    does not support `SO_PEERCRED`"""
+    if not hasattr(socket, "SO_PEERCRED"):
+        return None
+    creds = sock.getsockopt(
+        socket.SOL_SOCKET, socket.SO_PEERCRED, struct.calcsize("3i")
+    )
+    return struct.unpack("3i", creds)[1]
+
+
+def _send_message(sock, data, fds=None):
+    payload = json.dumps(data).encode() + b"\n"
+    if fds:
+        socket.send_fds(sock, [payload], fds)
+    else:
+        sock.sendall(payload)
+
+
+def _recv_message(sock, with_fds=False):
+    payload = b""
+    fds = []
+    while not payload.endswith(b"\n"):
+        if with_fds and not fds:
+            chunk, fds, _, _ = socket.recv_fds(sock, MAX_MESSAGE_SIZE, 3)
+        else:
+            chunk = sock.recv(MAX_MESSAGE_SIZE)
+        if not chunk:
+            raise BuildDaemonError("Connection closed")
+        payload += chunk
+    data = json.loads(payload.decode())
+    return (data, fds) if with_fds else data
+
+
+def shutdown(socket_path):
+    """Asks a daemon listening on `socket_path` to exit"""
+    sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    sock.settimeout(CONNECT_TIMEOUT)
+    try:
+        sock.connect(socket_path)
+        _send_message(sock, {"cmd": "shutdown"})
+    except OSError:
+        return False
+    finally:
+        sock.close()
+    return True
+
+
+class BuildDaemonClient:
+    def __init__(self, socket_path, scons_dir, checksum):
+        self.socket_path = socket_path
+        self.scons_dir = scons_dir
+        self.checksum = checksum
+
+    def connect(self):
+        ensure_socket_dir(self.socket_path)
+        sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        sock.settimeout(CONNECT_TIMEOUT)
+        try:
+            sock.connect(self.socket_path)
+            if not self._is_trusted_server(sock):
+                raise BuildDaemonError("The server belongs to another user")
+            _send_message(sock, {"cmd": "hello", "checksum": self.checksum})
+            response = _recv_message(sock)
+        except socket.timeout as exc:
+            sock.close()
+            raise BuildDaemonBusy(str(exc)) from exc
+        except (OSError, ValueError, BuildDaemonError) as exc:
+            sock.close()
+            raise BuildDaemonError(str(exc)) from exc
+        if response.get("status") != "ok":
+            sock.close()
+            raise BuildDaemonError(response.get("status"))
+        sock.settimeout(None)
+        return sock
+
+    def _is_trusted_server(self, sock):
+        # the environment and the streams are not sent to another user
+        return os.stat(self.socket_path).st_uid == os.getuid() and (
+            get_peer_uid(sock) in (None, os.getuid())
+        )
+
+    def spawn(self):
+        try:
+            ensure_socket_dir(self.socket_path)
+        except BuildDaemonError:
+            return False
+        if os.path.exists(self.socket_path):
+            try:
+                os.remove(self.socket_path)
+            except OSError:
+                return False
+        with open(os.devnull, "r+b") as devnull:
+            # the launcher forks a server and exits immediately
+            subprocess.call(
+                [
+                    sys.executable,
+                    "-m",
+                    "platformio.platform.daemon",
+                    "--socket",
+                    self.socket_path,
+                    "--scons-dir",
+                    self.scons_dir,
+                    "--checksum",
+                    self.checksum,
+                ],
+                stdin=devnull,
+                stdout=devnull,
+                stderr=devnull,
+                start_new_session=True,
+                close_fds=True,
+            )
+        return True
+
+    @staticmethod
+    def exec_command(sock, args, stdout, stderr):
+        """Run SCons with `args` using a connection from `connect()`"""
+        stdin_fd = sys.stdin.fileno() if sys.stdin and sys.stdin.isatty() else None
+        with open(os.devnull, "rb") as devnull:
+            try:
+                _send_message(
+                    sock,
+                    {
+                        "cmd": "build",
+                        "args": args,
+                        "cwd": os.getcwd(),
+                        "env": dict(os.environ),
+                    },
+                    fds=[
+                        devnull.fileno() if stdin_fd is None else stdin_fd,
+                        stdout.fileno(),
+                        stderr.fileno(),
+                    ],
+                )
+                response = _recv_message(sock)
+            finally:
+                sock.close()
+                stdout.close()
+                stderr.close()
+        return {
+            "out": stdout.get_buffer().strip() or None,
+            "err": stderr.get_buffer().strip() or None,
+            "returncode": response.get("returncode"),
+        }
+
+
+class BuildDaemonServer:
+    def __init__(self, socket_path, scons_dir, checksum):
+        self.socket_path = socket_path
+        self.scons_dir = scons_dir
+        self.checksum = checksum
+        self._sock = None
+        self._sock_ino = None
+
+    def preload(self):
+        for path in [self.scons_dir] + glob.glob(
+            os.path.join(self.scons_dir, "scons-local-*")
+        ):
+            if os.path.isfile(os.path.join(path, "SCons", "__init__.py")):
+                sys.path.insert(0, path)
+                break
+        for name in PRELOAD_MODULES:
+            try:
+                importlib.import_module(name)
+            except Exception:  # pylint: disable=broad-except
+                pass
+
+    def bind(self):
+        self._sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        old_umask = os.umask(0o077)
+        try:
+            self._sock.bind(self.socket_path)
+        except OSError:
+            # another daemon has already taken this socket
+            self._sock.close()
+            return False
+        finally:
+            os.umask(old_umask)
+        self._sock_ino = os.stat(self.socket_path).st_ino
+        self._sock.listen(4)
+        return True
+
+    def serve_forever(self):
+        self.preload()
+        try:
+            while True:
+                readable, _, _ = select.select([self._sock], [], [], IDLE_TIMEOUT)
+                if not readable:
+                    break
+                conn, _ = self._sock.accept()
+                with conn:
+                    if not self.handle(conn):
+                        break
+        finally:
+            self.close()
+
+    def close(self):
+        self._sock.close()
+        try:
+            # a new daemon may already listen on this path
+            if os.stat(self.socket_path).st_ino == self._sock_ino:
+                os.remove(self.socket_path)
+        except OSError:
+            pass
+
+    def handle(self, conn):
+        """Returns `False` when the server should shut down"""
+        try:
+            # the requests of the other users are ignored, even `shutdown`
+            request = (
+                _recv_message(conn) if get_peer_uid(conn) in (None, os.getuid()) else {}
+            )
+            if request.get("cmd") == "shutdown":
+                return False
+            if request.get("cmd") != "hello":
+                return True
+            if request.get("checksum") != self.checksum:
+                _send_message(conn, {"status": "outdated"})
+                return False
+            _send_message(conn, {"status": "ok"})
+            request, fds = _recv_message(conn, with_fds=True)
+            if request.get("cmd") != "build" or len(fds) != 3:
+                return True
+        except (OSError, ValueError, BuildDaemonError):
+            return True
+
+        try:
+            pid = os.fork()
+            if pid == 0:
+                self._sock.close()
+                conn.close()
+                self._run_scons(request, fds)  # never returns
+            returncode = self._wait_child(pid, conn)
+        finally:
+            for fd in fds:
+                os.close(fd)
+        try:
+            _send_message(conn, {"returncode": returncode})
+        except OSError:
+            pass
+        return True
+
+    @staticmethod
+    def _wait_child(pid, conn):
+        while True:
+            readable, _, _ = select.select([conn], [], [], 0.1)
+            if readable and not conn.recv(1):
+                # client has gone away (e.g. Ctrl+C), stop the build
+                os.kill(pid, signal.SIGINT)
+            wpid, status = os.waitpid(pid, 0 if readable else os.WNOHANG)
+            if wpid == pid:
+                return os.waitstatus_to_exitcode(status)
+
+    @staticmethod
+    def _run_scons(request, fds):
+        exitcode = 1
+        try:
+            os.setsid()
+            for fd, target in zip(fds, (0, 1, 2)):
+                os.dup2(fd, target)
+                os.close(fd)
+            os.environ.clear()
+            os.environ.update(request["env"])
+            os.chdir(request["cwd"])
+            sys.argv = ["scons.py"] + request["args"]
+            signal.signal(signal.SIGINT, signal.default_int_handler)
+            try:
+                importlib.import_module("SCons.Script").main()
+                exitcode = 0
+            except SystemExit as exc:
+                exitcode = (
+                    exc.code if isinstance(exc.code, int) else int(bool(exc.code))
+                )
+            atexit._run_exitfuncs()  # pylint: disable=protected-access
+        except KeyboardInterrupt:
+            exitcode = 2
+        finally:
+            try:
+                sys.stdout.flush()
+                sys.stderr.flush()
+            finally:
+                os._exit(exitcode)  # pylint: disable=protected-access
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--socket", required=True)
+    parser.add_argument("--scons-dir", required=True)
+    parser.add_argument("--checksum", required=True)
+    args = parser.parse_args()
+    server = BuildDaemonServer(args.socket, args.scons_dir, args.checksum)
+    if not server.bind():
+        return
+    if os.fork() == 0:
+        server.serve_forever()
+    os._exit(0)  # pylint: disable=protected-access
+
+
+if __name__ == "__main__":
+    main()
@@ -12,7 +12,11 @@
 # See the License for the specific language governing permissions and
 # limitations under the License.
 
+import codecs
+import contextvars
+import io
 import os
+import re
 import subprocess
 import sys
 from contextlib import contextmanager
@@ -33,12 +37,13 @@ class AsyncPipeBase:
         self._pipe_reader = os.fdopen(
             self._fd_read, encoding="utf-8", errors="backslashreplace"
         )
-        self._buffer = ""
-        self._thread = Thread(target=self.run)
+        self._buffer = []
+        # propagate context (e.g. output routing of `pio run --parallel-envs`)
+        self._thread = Thread(target=contextvars.copy_context().run, args=(self.run,))
         self._thread.start()
 
     def get_buffer(self):
-        return self._buffer
+        return "".join(self._buffer)
 
     def fileno(self):
         return self._fd_write
@@ -53,43 +58,75 @@ class AsyncPipeBase:
         raise NotImplementedError()
 
     def close(self):
-        self._buffer = ""
+        self._buffer = []
         os.close(self._fd_write)
         self._thread.join()
 
 
 class BuildAsyncPipe(AsyncPipeBase):
+    READ_CHUNK_SIZE = 64 * 1024
+    # a progress bar, such as "....", which should be printed immediately
+    PROGRESS_RE = re.compile(r"(.)\1\1\1")
+
     def __init__(self, line_callback, data_callback):
         self.line_callback = line_callback
         self.data_callback = data_callback
+        self._line = []
+        self._line_tail = ""
+        self._print_immediately = False
         super().__init__()
 
     def do_reading(self):
-        line = ""
-        print_immediately = False
-
-        for char in iter(lambda: self._pipe_reader.read(1), ""):
-            # self._buffer += char
-
-            if line and char.strip() and line[-3:] == (char * 3):
-                print_immediately = True
+        decoder = io.IncrementalNewlineDecoder(
+            codecs.getincrementaldecoder("utf-8")(errors="backslashreplace"),
+            translate=True,
+        )
+        while True:
+            chunk = os.read(self._fd_read, self.READ_CHUNK_SIZE)
+            self._feed(decoder.decode(chunk, final=not chunk))
+            if not chunk:
+                break
+        self._pipe_reader.close()
 
-            if print_immediately:
+    def _has_progress(self, text):
+        pos = 0
+        while True:
+            match = self.PROGRESS_RE.search(text, pos)
+            if not match:
+                return False
+            if not match.group(1).isspace():
+                return True
+            pos = match.start() + 1
+
+    def _feed(self, data):
+        pos = 0
+        while pos < len(data):
+            eol = data.find("\n", pos)
+            end = len(data) if eol == -1 else eol + 1
+            segment = data[pos:end]
+            pos = end
+
+            if not self._print_immediately and self._has_progress(
+                self._line_tail + segment
+            ):
+                self._print_immediately = True
                 # leftover bytes
-                if line:
-                    self.data_callback(line)
-                    line = ""
-                self.data_callback(char)
-                if char == "\n":
-                    print_immediately = False
+                segment = "".join(self._line) + segment
+                self._line = []
+                self._line_tail = ""
+
+            if self._print_immediately:
+                self.data_callback(segment)
+                if eol != -1:
+                    self._print_immediately = False
+            elif eol == -1:
+                self._line.append(segment)
+                self._line_tail = (self._line_tail + segment)[-3:]
             else:
-                line += char
-                if char != "\n":
-                    continue
-                self.line_callback(line)
-                line = ""
-
-        self._pipe_reader.close()
+                self._line.append(segment)
+                self.line_callback("".join(self._line))
+                self._line = []
+                self._line_tail = ""
 
 
 class LineBufferedAsyncPipe(AsyncPipeBase):
@@ -99,7 +136,7 @@ class LineBufferedAsyncPipe(AsyncPipeBase):
 
     def do_reading(self):
         for line in iter(self._pipe_reader.readline, ""):
-            self._buffer += line
+            self._buffer.append(line)
             self.line_callback(line)
         self._pipe_reader.close()
 
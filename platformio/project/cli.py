@@ -14,18 +14,17 @@
 
 import click
 
-from platformio.project.commands.config import project_config_cmd
-from platformio.project.commands.init import project_init_cmd
-from platformio.project.commands.metadata import project_metadata_cmd
+from platformio.cli import LazyCommandGroup
 
 
 @click.group(
     "project",
-    commands=[
-        project_config_cmd,
-        project_init_cmd,
-        project_metadata_cmd,
-    ],
+    cls=LazyCommandGroup,
+    lazy_commands=dict(
+        config="platformio.project.commands.config:project_config_cmd",
+        init="platformio.project.commands.init:project_init_cmd",
+        metadata="platformio.project.commands.metadata:project_metadata_cmd",
+    ),
     short_help="Project Manager",
 )
 def cli():
@@ -15,7 +15,6 @@
 import os
 
 import click
-from tabulate import tabulate
 
 from platformio import fs
 from platformio.project.config import ProjectConfig
@@ -45,6 +44,8 @@ def print_configuration(json_output=False):
     config = ProjectConfig.get_instance()
     if json_output:
         return click.echo(config.to_json())
+    from tabulate import tabulate  # pylint: disable=import-outside-toplevel
+
     click.echo(
         "Computed project configuration for %s" % click.style(os.getcwd(), fg="cyan")
     )
@@ -75,6 +76,8 @@ def lint_configuration(json_output=False):
             'The "platformio.ini" configuration file is free from linting errors.',
             fg="green",
         )
+    from tabulate import tabulate  # pylint: disable=import-outside-toplevel
+
     if errors:
         click.echo(
             tabulate(
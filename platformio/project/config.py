@@ -18,6 +18,7 @@ import hashlib
 import json
 import os
 import re
+import threading
 import time
 
 import click
@@ -55,13 +56,35 @@ class ProjectConfigBase:
         "UNIX_TIME": lambda: str(int(time.time())),
     }
 
+    # the built-in variables which are not cached
+    VOLATILE_BUILTIN_VARS = ("UNIX_TIME",)
+
     CUSTOM_OPTION_PREFIXES = ("custom_", "board_")
 
+    # the parsed configuration files are cached in this directory if it is set
+    PARSED_CACHE_DIR_ENVVAR = "PLATFORMIO_CONF_CACHE_DIR"
+    PARSED_CACHE_VERSION = 1
+    PARSED_CACHE_RACY_DELAY = 2  # seconds
+
+    # the methods of the parser which modify the configuration
+    PARSER_MUTATORS = (
+        "add_section",
+        "clear",
+        "read_dict",
+        "read_file",
+        "read_string",
+        "remove_option",
+        "remove_section",
+    )
+
     expand_interpolations = True
     warnings = []
 
     _parser = None
     _parsed = []
+    _cache = {}
+    _local = None
+    _options_index = None
 
     @staticmethod
     def parse_multi_values(items):
@@ -94,6 +117,8 @@ class ProjectConfigBase:
         self.expand_interpolations = expand_interpolations
         self.warnings = []
         self._parsed = []
+        self._cache = {}
+        self._local = threading.local()
         self._parser = configparser.ConfigParser(inline_comment_prefixes=("#", ";"))
         if path and os.path.isfile(path):
             self.read(path, parse_extra)
@@ -101,14 +126,17 @@ class ProjectConfigBase:
         self._maintain_renamed_options()
 
     def __getattr__(self, name):
+        if name in self.PARSER_MUTATORS:
+            self._cache.clear()
         return getattr(self._parser, name)
 
     def read(self, path, parse_extra=True):
         if path in self._parsed:
             return
         self._parsed.append(path)
+        self._cache.clear()
         try:
-            self._parser.read(path, "utf-8")
+            self._read_file(path)
         except configparser.Error as exc:
             raise exception.InvalidProjectConfError(path, str(exc)) from exc
 
@@ -122,6 +150,82 @@ class ProjectConfigBase:
             for item in glob.glob(pattern, recursive=True):
                 self.read(item)
 
+    def _read_file(self, path):
+        # pylint: disable=protected-access
+        cache_dir = os.getenv(self.PARSED_CACHE_DIR_ENVVAR)
+        try:
+            stat = os.stat(path) if cache_dir else None
+        except OSError:
+            stat = None
+        if not stat:
+            self._parser.read(path, "utf-8")
+            return
+        stamp = [stat.st_mtime_ns, stat.st_size]
+        cache_path = os.path.join(
+            cache_dir,
+            "%s.json"
+            % hashlib.sha1(hashlib_encode_data(os.path.realpath(path))).hexdigest(),
+        )
+        data = self._load_parsed_cache(cache_path, stamp)
+        if data is None:
+            parser = configparser.ConfigParser(inline_comment_prefixes=("#", ";"))
+            parser.read(path, "utf-8")
+            data = dict(
+                version=self.PARSED_CACHE_VERSION,
+                path=path,
+                stamp=stamp,
+                defaults=dict(parser._defaults),
+                sections={s: dict(parser._sections[s]) for s in parser.sections()},
+            )
+            # the modification time within the same tick can not be trusted
+            if stamp[0] < (time.time() - self.PARSED_CACHE_RACY_DELAY) * 1e9:
+                self._save_parsed_cache(cache_path, data)
+        # merge the same way as the parser does for the next file
+        for section, options in data["sections"].items():
+            if not self._parser.has_section(section):
+                self._parser.add_section(section)
+            self._parser._sections[section].update(options)
+        self._parser._defaults.update(data["defaults"])
+
+    def _load_parsed_cache(self, cache_path, stamp):
+        try:
+            with open(cache_path, encoding="utf8") as fp:
+                data = json.load(fp)
+            if data["version"] == self.PARSED_CACHE_VERSION and data["stamp"] == stamp:
+                return data
+        except (OSError, ValueError, KeyError, TypeError):
+            pass
+        return None
+
+    @staticmethod
+    def _save_parsed_cache(cache_path, data):
+        tmp_path = "%s.%d.tmp" % (cache_path, os.getpid())
+        try:
+            if not os.path.isdir(os.path.dirname(cache_path)):
+                os.makedirs(os.path.dirname(cache_path))
+            with open(tmp_path, mode="w", encoding="utf8") as fp:
+                json.dump(data, fp)
+            os.replace(tmp_path, cache_path)
+        except OSError:
+            if os.path.isfile(tmp_path):
+                os.remove(tmp_path)
+
+    @classmethod
+    def _get_options_index(cls):
+        """Maps the scope and the name (or the old name) of the option
+        to its metadata"""
+        if cls._options_index is None:
+            index = dict(options={}, renamed={}, sysenv={})
+            for option_meta in ProjectOptions.values():
+                scope = option_meta.scope
+                index["options"][(scope, option_meta.name)] = option_meta
+                for oldname in option_meta.oldnames or []:
+                    index["renamed"].setdefault((scope, oldname), option_meta)
+                if option_meta.sysenvvar:
+                    index["sysenv"].setdefault(scope, []).append(option_meta)
+            ProjectConfigBase._options_index = index
+        return cls._options_index
+
     def _maintain_renamed_options(self):
         renamed_options = {}
         for option in ProjectOptions.values():
@@ -199,10 +303,10 @@ class ProjectConfigBase:
 
         # handle system environment variables
         scope = self.get_section_scope(section)
-        for option_meta in ProjectOptions.values():
-            if option_meta.scope != scope or option_meta.name in result:
+        for option_meta in self._get_options_index()["sysenv"].get(scope, []):
+            if option_meta.name in result:
                 continue
-            if option_meta.sysenvvar and option_meta.sysenvvar in os.environ:
+            if option_meta.sysenvvar in os.environ:
                 result.append(option_meta.name)
 
         return result
@@ -234,32 +338,24 @@ class ProjectConfigBase:
         # start multi-line value from a new line
         if "\n" in value and not value.startswith("\n"):
             value = "\n" + value
+        self._cache.clear()
         self._parser.set(section, option, value)
 
     def resolve_renamed_option(self, section, old_name):
         scope = self.get_section_scope(section)
         if scope not in ("platformio", "env"):
             return None
-        for option_meta in ProjectOptions.values():
-            if (
-                option_meta.oldnames
-                and option_meta.scope == scope
-                and old_name in option_meta.oldnames
-            ):
-                return option_meta.name
-        return None
+        option_meta = self._get_options_index()["renamed"].get((scope, old_name))
+        return option_meta.name if option_meta else None
 
     def find_option_meta(self, section, option):
         scope = self.get_section_scope(section)
         if scope not in ("platformio", "env"):
             return None
-        option_meta = ProjectOptions.get("%s.%s" % (scope, option))
-        if option_meta:
-            return option_meta
-        for option_meta in ProjectOptions.values():
-            if option_meta.scope == scope and option in (option_meta.oldnames or []):
-                return option_meta
-        return None
+        index = self._get_options_index()
+        return index["options"].get((scope, option)) or index["renamed"].get(
+            (scope, option)
+        )
 
     def _traverse_for_value(self, section, option, option_meta=None):
         for _section, _option in self.walk_options(section):
@@ -290,10 +386,10 @@ class ProjectConfigBase:
             return self._expand_interpolations(section, option, value)
 
         if option_meta.sysenvvar:
-            envvar_value = os.getenv(option_meta.sysenvvar)
+            envvar_value = self._getenv(option_meta.sysenvvar)
             if not envvar_value and option_meta.oldnames:
                 for oldoption in option_meta.oldnames:
-                    envvar_value = os.getenv("PLATFORMIO_" + oldoption.upper())
+                    envvar_value = self._getenv("PLATFORMIO_" + oldoption.upper())
                     if envvar_value:
                         break
             if envvar_value and option_meta.multiple:
@@ -306,6 +402,8 @@ class ProjectConfigBase:
         if value == MISSING:
             value = default if default != MISSING else option_meta.default
         if callable(value):
+            self._add_dependency("cwd")
+            self._add_dependency("home")
             value = value()
         if value == MISSING:
             return None
@@ -346,13 +444,16 @@ class ProjectConfigBase:
         # handle built-in variables
         if section is None:
             if option in self.BUILTIN_VARS:
+                self._add_dependency(
+                    "volatile" if option in self.VOLATILE_BUILTIN_VARS else "cwd"
+                )
                 return self.BUILTIN_VARS[option]()
             # SCons variables
             return f"${{{option}}}"
 
         # handle system environment variables
         if section == "sysenv":
-            return os.getenv(option)
+            return self._getenv(option)
 
         # handle ${this.*}
         if section == "this":
@@ -378,7 +479,61 @@ class ProjectConfigBase:
             return "\n".join(value)
         return str(value)
 
+    @property
+    def _dependencies(self):
+        # a stack of the values being resolved by the current thread, the
+        # environments are processed in parallel with the shared configuration
+        if not hasattr(self._local, "stack"):
+            self._local.stack = []
+        return self._local.stack
+
+    def _add_dependency(self, kind, name=None):
+        """Records the state of the process which the value being resolved
+        depends on, see `get`"""
+        if self._dependencies:
+            self._dependencies[-1][(kind, name)] = self._get_dependency_state(
+                kind, name
+            )
+
+    @staticmethod
+    def _get_dependency_state(kind, name=None):
+        if kind == "env":
+            return os.environ.get(name)
+        if kind == "cwd":
+            return os.getcwd()
+        if kind == "home":
+            return fs.expanduser("~")
+        return MISSING
+
+    def _getenv(self, name):
+        self._add_dependency("env", name)
+        return os.environ.get(name)
+
     def get(self, section, option, default=MISSING):
+        """The resolved values are cached until the configuration is modified.
+        The cached value is reused while the system environment variables and
+        the working directory which it depends on are not changed"""
+        cache_key = (self.expand_interpolations, section, option, repr(default))
+        cached = self._cache.get(cache_key)
+        if cached and all(
+            self._get_dependency_state(kind, name) == state
+            for (kind, name), state in cached[1].items()
+        ):
+            value, dependencies = cached
+        else:
+            self._dependencies.append({})
+            try:
+                value = self._get(section, option, default)
+            finally:
+                dependencies = self._dependencies.pop()
+            if ("volatile", None) not in dependencies:
+                self._cache[cache_key] = (value, dependencies)
+        # the nested value is a dependency of the value which refers to it
+        if self._dependencies:
+            self._dependencies[-1].update(dependencies)
+        return list(value) if isinstance(value, list) else value
+
+    def _get(self, section, option, default=MISSING):
         value = None
         try:
             value = self.getraw(section, option, default)
@@ -390,6 +545,8 @@ class ProjectConfigBase:
             return value
 
         if option_meta.validate:
+            self._add_dependency("cwd")
+            self._add_dependency("home")
             value = option_meta.validate(value)
         if option_meta.multiple:
             value = self.parse_multi_values(value or [])
@@ -536,6 +693,7 @@ class ProjectConfig(ProjectConfigBase, ProjectConfigLintMixin, ProjectConfigDirs
 
     def update(self, data, clear=False):
         assert isinstance(data, list)
+        self._cache.clear()
         if clear:
             self._parser = configparser.ConfigParser()
         for section, options in data:
@@ -15,14 +15,15 @@
 import os
 import re
 import subprocess
+import time
 from hashlib import sha1
 
-from click.testing import CliRunner
-
 from platformio import __version__, exception, fs
 from platformio.compat import IS_MACOS, IS_WINDOWS, hashlib_encode_data
 from platformio.project.config import ProjectConfig
 
+MANIFEST_MTIME_SAFE_DELTA = 2 * 10**9  # nanoseconds
+
 
 def get_project_dir():
     """Get the current project directory.
@@ -129,12 +130,15 @@ def get_default_projects_dir():
     return os.path.join(docs_dir, "PlatformIO", "Projects")
 
 
-def compute_project_checksum(config):
+def compute_project_checksum(config, manifest=None):
     """Compute project checksum based on configuration and file structure.
 
     Args:
         config (ProjectConfig): Project configuration instance
-        
+        manifest (dict, optional): Directory manifest from the previous run.
+            Directories with an unchanged modification time are not re-listed.
+            The dictionary is updated in place with the actual state.
+
     Returns:
         str: Hexadecimal checksum string
     """
@@ -154,6 +158,9 @@ def compute_project_checksum(config):
     checksum.update(hashlib_encode_data(config_data))
 
     # project file structure
+    prev_manifest = dict(manifest or {})
+    if manifest is not None:
+        manifest.clear()
     check_suffixes = (".c", ".cc", ".cpp", ".h", ".hpp", ".s", ".S")
     for d in (
         config.get("platformio", "include_dir"),
@@ -162,12 +169,7 @@ def compute_project_checksum(config):
     ):
         if not os.path.isdir(d):
             continue
-        chunks = []
-        for root, _, files in os.walk(d):
-            for f in files:
-                path = os.path.join(root, f)
-                if path.endswith(check_suffixes):
-                    chunks.append(path)
+        chunks = _collect_project_files(d, check_suffixes, prev_manifest, manifest)
         if not chunks:
             continue
         chunks_to_str = ",".join(sorted(chunks))
@@ -178,6 +180,49 @@ def compute_project_checksum(config):
     return checksum.hexdigest()
 
 
+def _collect_project_files(root, suffixes, prev_manifest, manifest=None):
+    """Walk a directory tree like `os.walk` and collect files with suffixes.
+
+    A directory is re-listed only when its modification time differs from
+    the previous manifest. Entries modified in the last seconds before the
+    previous scan are not trusted (the timestamp resolution is limited).
+
+    Returns:
+        list: Paths of the matched files
+    """
+    result = []
+    stack = [root]
+    while stack:
+        path = stack.pop()
+        try:
+            mtime = os.stat(path).st_mtime_ns
+        except OSError:
+            continue
+        entry = prev_manifest.get(path)
+        if (
+            not entry
+            or entry["mtime"] != mtime
+            or entry["scanned"] - mtime < MANIFEST_MTIME_SAFE_DELTA
+        ):
+            entry = {"mtime": mtime, "scanned": time.time_ns(), "files": [], "dirs": []}
+            try:
+                with os.scandir(path) as items:
+                    for item in items:
+                        if item.is_dir():
+                            # do not follow symlinks, the same as `os.walk`
+                            if not item.is_symlink():
+                                entry["dirs"].append(item.path)
+                        elif item.name.endswith(suffixes):
+                            entry["files"].append(item.path)
+            except OSError:
+                continue
+        if manifest is not None:
+            manifest[path] = entry
+        result.extend(entry["files"])
+        stack.extend(entry["dirs"])
+    return result
+
+
 def load_build_metadata(project_dir, env_or_envs, cache=False, build_type=None):
     """Load build metadata for specified environments.
     
@@ -235,6 +280,8 @@ def _load_build_metadata(project_dir, env_names, build_type=None):
         exception.UserSideException: If build metadata generation fails
     """
     # pylint: disable=import-outside-toplevel
+    from click.testing import CliRunner
+
     from platformio.run.cli import cli as cmd_run
 
     args = ["--project-dir", project_dir, "--target", "__idedata"]
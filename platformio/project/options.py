@@ -205,6 +205,49 @@ ProjectOptions = OrderedDict(
                 sysenvvar="PLATFORMIO_BUILD_CACHE_DIR",
                 validate=validate_dir,
             ),
+            ConfigPlatformioOption(
+                group="generic",
+                name="build_cache_mode",
+                description=(
+                    "A mode of the build cache, the SCons build signatures "
+                    "(`scons`) or the content-addressed object files (`content`) "
+                    "which are shared between different project locations"
+                ),
+                type=click.Choice(["scons", "content"]),
+                sysenvvar="PLATFORMIO_BUILD_CACHE_MODE",
+                default="scons",
+            ),
+            ConfigPlatformioOption(
+                group="generic",
+                name="build_cache_url",
+                description=(
+                    "A URL of the remote HTTP storage of the content-addressed "
+                    "object files (`GET` and `PUT` requests)"
+                ),
+                sysenvvar="PLATFORMIO_BUILD_CACHE_URL",
+            ),
+            ConfigPlatformioOption(
+                group="generic",
+                name="build_cache_size",
+                description=(
+                    "A maximum size of the content-addressed object files in the "
+                    "local build cache, the least recently used files are evicted"
+                ),
+                sysenvvar="PLATFORMIO_BUILD_CACHE_SIZE",
+                default="5GB",
+            ),
+            ConfigPlatformioOption(
+                group="directory",
+                name="build_archive_cache_dir",
+                description=(
+                    "A location where PlatformIO Core keeps the static libraries "
+                    "of frameworks and libraries and reuses them between build "
+                    "environments and projects with the same toolchain, flags "
+                    "and source files"
+                ),
+                sysenvvar="PLATFORMIO_BUILD_ARCHIVE_CACHE_DIR",
+                validate=validate_dir,
+            ),
             ConfigPlatformioOption(
                 group="directory",
                 name="workspace_dir",
@@ -435,6 +478,25 @@ ProjectOptions = OrderedDict(
                 description="A custom list of targets for PlatformIO Build System",
                 multiple=True,
             ),
+            ConfigEnvOption(
+                group="build",
+                name="sizediff_baseline",
+                description=(
+                    "A path to the size snapshot which `sizediff` target compares "
+                    "the firmware with (the previous snapshot by default)"
+                ),
+                sysenvvar="PLATFORMIO_SIZEDIFF_BASELINE",
+            ),
+            ConfigEnvOption(
+                group="build",
+                name="sizediff_thresholds",
+                description=(
+                    "The maximum growth of the sections or of the total `ram` and "
+                    "`flash` sizes in bytes or percents, e.g. `.text = 1024`"
+                ),
+                multiple=True,
+                sysenvvar="PLATFORMIO_SIZEDIFF_THRESHOLDS",
+            ),
             # Upload
             ConfigEnvOption(
                 group="upload",
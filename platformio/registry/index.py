@@ -0,0 +1,264 @@
+# Copyright (c) 2014-present PlatformIO <contact@platformio.org>
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import gzip
+import json
+import os
+import sqlite3
+import tempfile
+import threading
+from time import time
+
+from platformio.exception import UserSideException
+from platformio.http import HTTPSession
+from platformio.project.config import ProjectConfig
+
+
+class RegistryIndexError(UserSideException):
+    MESSAGE = "Could not load the registry index from {0}: {1}"
+
+
+class RegistryIndex:
+    """A local snapshot of the registry packages, their versions, files,
+    system tags and checksums stored in an indexed SQLite database.
+
+    The snapshot is imported from a JSON document (optionally compressed
+    with GZip) in the `{"packages": [<registry package>, ...]}` format,
+    where a package has the same structure as the registry API returns.
+    """
+
+    DB_NAME = "registryindex.sqlite"
+    # the qualifiers of the package lists, "*" matches any value
+    LIST_QUALIFIERS = ("authors", "frameworks", "platforms")
+    _instances = {}
+
+    def __init__(self, db_path=None):
+        self.db_path = db_path or self.get_default_path()
+        self._conn = None
+        self._db_stat = None
+        self._lock = threading.Lock()
+
+    @classmethod
+    def get_instance(cls, db_path=None):
+        db_path = db_path or cls.get_default_path()
+        if db_path not in cls._instances:
+            cls._instances[db_path] = cls(db_path)
+        return cls._instances[db_path]
+
+    @classmethod
+    def get_default_path(cls):
+        return os.path.join(
+            ProjectConfig.get_instance().get("platformio", "core_dir"), cls.DB_NAME
+        )
+
+    def exists(self):
+        return os.path.isfile(self.db_path)
+
+    def _connect(self):
+        # the database is replaced atomically by `update`
+        st = os.stat(self.db_path)
+        if self._conn and self._db_stat == (st.st_ino, st.st_mtime_ns):
+            return self._conn
+        self.close()
+        self._conn = sqlite3.connect(
+            "file:%s?mode=ro" % self.db_path, uri=True, check_same_thread=False
+        )
+        self._db_stat = (st.st_ino, st.st_mtime_ns)
+        return self._conn
+
+    def close(self):
+        if self._conn:
+            self._conn.close()
+            self._conn = None
+
+    def _query(self, sql, params=()):
+        with self._lock:
+            return self._connect().execute(sql, params).fetchall()
+
+    def get_meta(self, name, default=None):
+        if not self.exists():
+            return default
+        rows = self._query("SELECT value FROM meta WHERE name = ?", (name,))
+        return rows[0][0] if rows else default
+
+    def get_package(self, typex, owner=None, name=None, id_=None):
+        if not id_ and not name:
+            return None
+        if id_:
+            rows = self._query("SELECT data FROM packages WHERE id = ?", (int(id_),))
+        elif owner:
+            rows = self._query(
+                "SELECT data FROM packages WHERE type = ? AND owner = ? AND name = ?",
+                (typex, owner.lower(), name.lower()),
+            )
+        else:
+            rows = self._query(
+                "SELECT data FROM packages WHERE type = ? AND name = ?",
+                (typex, name.lower()),
+            )
+        return json.loads(rows[0][0]) if len(rows) == 1 else None
+
+    def search(self, qualifiers):
+        """Returns the packages in the format of the registry search items,
+        or `None` if the qualifiers can not be answered by the index"""
+        qualifiers = dict(qualifiers)
+        conditions = []
+        params = []
+        for key, column in (("ids", "id"), ("types", "type"), ("names", "name")):
+            if key not in qualifiers:
+                continue
+            values = self._normalize_values(qualifiers.pop(key))
+            conditions.append("%s IN (%s)" % (column, ", ".join("?" for _ in values)))
+            params.extend(int(v) if key == "ids" else v for v in values)
+        if "owners" in qualifiers:
+            values = self._normalize_values(qualifiers.pop("owners"))
+            conditions.append("owner IN (%s)" % ", ".join("?" for _ in values))
+            params.extend(values)
+        if not conditions or set(qualifiers) - set(self.LIST_QUALIFIERS):
+            return None
+        result = []
+        for (data,) in self._query(
+            "SELECT data FROM packages WHERE %s ORDER BY id" % " AND ".join(conditions),
+            params,
+        ):
+            package = json.loads(data)
+            if not all(
+                self._match_list(package.get(key), values)
+                for key, values in qualifiers.items()
+            ):
+                continue
+            package["version"] = package["versions"][0]
+            del package["versions"]
+            result.append(package)
+        return result
+
+    @staticmethod
+    def _normalize_values(values):
+        if not isinstance(values, (list, tuple, set)):
+            values = [values]
+        return [
+            str(v["name"] if isinstance(v, dict) else v).lower() for v in values if v
+        ]
+
+    @classmethod
+    def _match_list(cls, package_values, values):
+        package_values = cls._normalize_values(package_values or [])
+        values = cls._normalize_values(values)
+        if not package_values or not values or "*" in package_values:
+            return True
+        return bool(set(package_values) & set(values))
+
+    def update(self, source):
+        """Imports a snapshot from the local file or HTTP(S) URL,
+        returns the number of the packages"""
+        try:
+            packages = json.loads(self._load_source(source))["packages"]
+        except (OSError, ValueError, KeyError, TypeError) as exc:
+            raise RegistryIndexError(source, exc) from exc
+        db_dir = os.path.dirname(self.db_path)
+        if not os.path.isdir(db_dir):
+            os.makedirs(db_dir)
+        tmp_fd, tmp_path = tempfile.mkstemp(dir=db_dir, suffix=".tmp")
+        os.close(tmp_fd)
+        try:
+            conn = sqlite3.connect(tmp_path)
+            try:
+                self._create_database(conn, packages, source)
+            finally:
+                conn.close()
+            with self._lock:
+                self.close()
+                os.replace(tmp_path, self.db_path)
+        finally:
+            if os.path.isfile(tmp_path):
+                os.remove(tmp_path)
+        return len(packages)
+
+    @staticmethod
+    def _load_source(source):
+        if source.startswith(("http://", "https://")):
+            with HTTPSession() as session:
+                response = session.get(source)
+                response.raise_for_status()
+                data = response.content
+        else:
+            with open(source, "rb") as fp:
+                data = fp.read()
+        if data[:2] == b"\x1f\x8b":
+            data = gzip.decompress(data)
+        return data.decode("utf-8")
+
+    @classmethod
+    def _create_database(cls, conn, packages, source):
+        with conn:
+            conn.execute(
+                "CREATE TABLE packages (id INTEGER PRIMARY KEY, type TEXT NOT NULL, "
+                "owner TEXT NOT NULL, name TEXT NOT NULL, data TEXT NOT NULL)"
+            )
+            conn.execute("CREATE INDEX packages_name ON packages (type, name)")
+            conn.execute(
+                "CREATE INDEX packages_owner_name ON packages (type, owner, name)"
+            )
+            conn.execute("CREATE TABLE meta (name TEXT PRIMARY KEY, value TEXT)")
+            conn.executemany(
+                "INSERT OR REPLACE INTO packages VALUES (?, ?, ?, ?, ?)",
+                (
+                    (
+                        package["id"],
+                        package["type"],
+                        package["owner"]["username"].lower(),
+                        package["name"].lower(),
+                        json.dumps(package, separators=(",", ":")),
+                    )
+                    for package in (cls.compact_package(p) for p in packages)
+                ),
+            )
+            conn.executemany(
+                "INSERT INTO meta VALUES (?, ?)",
+                (("source", source), ("updated", str(int(time())))),
+            )
+
+    @classmethod
+    def compact_package(cls, package):
+        """Keeps only the data which is needed to resolve and install
+        the package, the versions are ordered from the latest"""
+        versions = package.get("versions") or [package["version"]]
+        result = {
+            "id": package["id"],
+            "type": package["type"],
+            "name": package["name"],
+            "owner": {"username": package["owner"]["username"]},
+            "description": package.get("description"),
+            "versions": [
+                {
+                    "name": version["name"],
+                    "released_at": version.get("released_at"),
+                    "files": [
+                        {
+                            key: item[key]
+                            for key in ("name", "system", "download_url", "checksum")
+                            if key in item
+                        }
+                        for item in version["files"]
+                    ],
+                }
+                for version in sorted(
+                    versions, key=lambda v: v.get("released_at") or "", reverse=True
+                )
+            ],
+        }
+        for key in cls.LIST_QUALIFIERS:
+            if package.get(key):
+                result[key] = cls._normalize_values(package[key])
+        return result
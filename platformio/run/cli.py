@@ -15,19 +15,19 @@
 import operator
 import os
 import shutil
+from fnmatch import fnmatch
 from multiprocessing import cpu_count
 from time import time
 
 import click
-from tabulate import tabulate
 
-from platformio import app, exception, fs, util
-from platformio.device.monitor.command import device_monitor_cmd
+from platformio import app, exception, fs, tracing, util
 from platformio.project.config import ProjectConfig
 from platformio.project.exception import ProjectError
 from platformio.project.helpers import find_project_dir_above, load_build_metadata
 from platformio.run.helpers import clean_build_dir
 from platformio.run.processor import EnvironmentProcessor
+from platformio.run.scheduler import EnvironmentScheduler
 from platformio.test.runners.base import CTX_META_TEST_IS_RUNNING
 
 # pylint: disable=too-many-arguments,too-many-locals,too-many-branches
@@ -38,6 +38,10 @@ except NotImplementedError:
     SYSTEM_CPU_COUNT = 1
 
 DEFAULT_JOB_NUMS = int(os.getenv("PLATFORMIO_RUN_JOBS", SYSTEM_CPU_COUNT))
+DEFAULT_PARALLEL_ENVS = int(os.getenv("PLATFORMIO_RUN_PARALLEL_ENVS", "1"))
+# the targets which use a terminal or a device, the environments are processed
+# one by one (the auto-detected upload port is shared, "press reset" prompts)
+SERIAL_TARGETS = ("monitor", "menuconfig", "program", "erase", "upload*")
 
 
 @click.command("run", short_help="Run project targets (build, upload, clean, etc.)")
@@ -66,6 +70,15 @@ DEFAULT_JOB_NUMS = int(os.getenv("PLATFORMIO_RUN_JOBS", SYSTEM_CPU_COUNT))
         "Default is a number of CPUs in a system (N=%d)" % DEFAULT_JOB_NUMS
     ),
 )
+@click.option(
+    "--parallel-envs",
+    type=click.IntRange(min=1),
+    default=DEFAULT_PARALLEL_ENVS,
+    help=(
+        "Process N environments at once. The jobs (-j, --jobs) are split "
+        "between them. Default is %d" % DEFAULT_PARALLEL_ENVS
+    ),
+)
 @click.option(
     "-a",
     "--program-arg",
@@ -75,6 +88,12 @@ DEFAULT_JOB_NUMS = int(os.getenv("PLATFORMIO_RUN_JOBS", SYSTEM_CPU_COUNT))
 )
 @click.option("--disable-auto-clean", is_flag=True)
 @click.option("--list-targets", is_flag=True)
+@click.option(
+    "--trace",
+    "trace_path",
+    type=click.Path(dir_okay=False, writable=True, resolve_path=True),
+    help="Save the build trace in Chrome trace-event format (Perfetto UI)",
+)
 @click.option("-s", "--silent", is_flag=True)
 @click.option("-v", "--verbose", is_flag=True)
 @click.pass_context
@@ -87,12 +106,17 @@ def cli(  # pylint: disable=too-many-positional-arguments
     project_dir,
     project_conf,
     jobs,
+    parallel_envs,
     program_args,
     disable_auto_clean,
     list_targets,
+    trace_path,
     silent,
     verbose,
 ):
+    if trace_path:
+        tracing.start(trace_path, "pio run")
+        ctx.call_on_close(lambda: _save_trace(silent))
     app.set_session_var("custom_project_conf", project_conf)
 
     # find project directory on upper level
@@ -116,7 +140,7 @@ def cli(  # pylint: disable=too-many-positional-arguments
         if not only_monitor and not disable_auto_clean:
             build_dir = config.get("platformio", "build_dir")
             try:
-                clean_build_dir(build_dir, config)
+                clean_build_dir(build_dir, config, verbose)
             except ProjectError as exc:
                 raise exc
             except:  # pylint: disable=bare-except
@@ -135,29 +159,48 @@ def cli(  # pylint: disable=too-many-positional-arguments
                     not environment and default_envs and env not in default_envs,
                 ]
             )
-            if skipenv:
-                results.append({"env": env})
-                continue
+            results.append({"env": env, "skipped": skipenv})
 
-            # print empty line between multi environment project
-            if not silent and any(r.get("succeeded") is not None for r in results):
-                click.echo()
-
-            results.append(
-                process_env(
-                    ctx,
-                    env,
-                    config,
-                    targets,
-                    upload_port,
-                    monitor_port,
-                    jobs,
-                    program_args,
-                    is_test_running,
-                    silent,
-                    verbose,
-                )
+        envs_to_process = [r["env"] for r in results if not r.pop("skipped")]
+        if parallel_envs > 1 and can_process_in_parallel(
+            envs_to_process, config, targets, is_test_running
+        ):
+            processed = process_envs_in_parallel(
+                ctx,
+                envs_to_process,
+                config,
+                targets,
+                upload_port,
+                jobs,
+                parallel_envs,
+                program_args,
+                silent,
+                verbose,
             )
+        else:
+            processed = []
+            for env in envs_to_process:
+                # print empty line between multi environment project
+                if not silent and processed:
+                    click.echo()
+                processed.append(
+                    process_env(
+                        ctx,
+                        env,
+                        config,
+                        targets,
+                        upload_port,
+                        monitor_port,
+                        jobs,
+                        program_args,
+                        is_test_running,
+                        silent,
+                        verbose,
+                    )
+                )
+        processed = {r["env"]: r for r in processed}
+        results = [processed.get(r["env"], r) for r in results]
+
         command_failed = any(r.get("succeeded") is False for r in results)
         if (
             not is_test_running
@@ -176,6 +219,12 @@ def cli(  # pylint: disable=too-many-positional-arguments
     return True
 
 
+def _save_trace(silent):
+    trace_path = tracing.stop()
+    if trace_path and not silent:
+        click.secho("Saved build trace to %s" % trace_path, dim=True)
+
+
 def process_env(  # pylint: disable=too-many-positional-arguments
     ctx,
     name,
@@ -197,19 +246,23 @@ def process_env(  # pylint: disable=too-many-positional-arguments
     result = {"env": name, "duration": time(), "succeeded": True}
 
     if not only_monitor:
-        result["succeeded"] = EnvironmentProcessor(
-            ctx,
-            name,
-            config,
-            [t for t in targets if t != "monitor"],
-            upload_port,
-            jobs,
-            program_args,
-            silent,
-            verbose,
-        ).process()
+        with tracing.span(name, cat="env", targets=targets):
+            result["succeeded"] = EnvironmentProcessor(
+                ctx,
+                name,
+                config,
+                [t for t in targets if t != "monitor"],
+                upload_port,
+                jobs,
+                program_args,
+                silent,
+                verbose,
+            ).process()
 
     if result["succeeded"] and "monitor" in targets and "nobuild" not in targets:
+        # pylint: disable=import-outside-toplevel
+        from platformio.device.monitor.command import device_monitor_cmd
+
         ctx.invoke(
             device_monitor_cmd,
             port=monitor_port,
@@ -229,6 +282,68 @@ def process_env(  # pylint: disable=too-many-positional-arguments
     return result
 
 
+def can_process_in_parallel(envs, config, targets, is_test_running):
+    if len(envs) < 2 or is_test_running:
+        return False
+    for env in envs:
+        env_targets = targets or config.get(f"env:{env}", "targets", [])
+        if any(
+            fnmatch(target, pattern)
+            for target in env_targets
+            for pattern in SERIAL_TARGETS
+        ):
+            return False
+    return True
+
+
+def process_envs_in_parallel(  # pylint: disable=too-many-positional-arguments
+    ctx,
+    envs,
+    config,
+    targets,
+    upload_port,
+    jobs,
+    parallel_envs,
+    program_args,
+    silent,
+    verbose,
+):
+    scheduler = EnvironmentScheduler(parallel_envs, jobs)
+    if not silent:
+        click.secho(
+            "Processing %d environments, %d at once with %d job(s) each"
+            % (
+                len(envs),
+                min(parallel_envs, len(envs)),
+                scheduler.get_env_jobs(len(envs)),
+            ),
+            dim=True,
+        )
+
+    def _on_replay(env):
+        # print empty line between multi environment project
+        if not silent and env != envs[0]:
+            click.echo()
+
+    return scheduler.run(
+        envs,
+        lambda env, env_jobs: process_env(
+            ctx,
+            env,
+            config,
+            targets,
+            upload_port,
+            None,
+            env_jobs,
+            program_args,
+            False,
+            silent,
+            verbose,
+        ),
+        on_replay=_on_replay,
+    )
+
+
 def print_processing_header(env, config, verbose=False):
     env_dump = []
     for k, v in config.items(env=env):
@@ -259,6 +374,8 @@ def print_processing_footer(result):
 
 
 def print_processing_summary(results, verbose=False):
+    from tabulate import tabulate  # pylint: disable=import-outside-toplevel
+
     tabular_data = []
     succeeded_nums = 0
     failed_nums = 0
@@ -309,6 +426,8 @@ def print_processing_summary(results, verbose=False):
 
 
 def print_target_list(envs):
+    from tabulate import tabulate  # pylint: disable=import-outside-toplevel
+
     tabular_data = []
     for env, data in load_build_metadata(os.getcwd(), envs).items():
         tabular_data.extend(
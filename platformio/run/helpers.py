@@ -12,10 +12,14 @@
 # See the License for the specific language governing permissions and
 # limitations under the License.
 
+import json
 from os import makedirs
 from os.path import isdir, isfile, join
+from time import time
 
-from platformio import fs
+import click
+
+from platformio import exception, fs, tracing
 from platformio.project.helpers import compute_project_checksum, get_project_dir
 
 KNOWN_CLEAN_TARGETS = ("clean",)
@@ -23,23 +27,50 @@ KNOWN_FULLCLEAN_TARGETS = ("cleanall", "fullclean")
 KNOWN_ALLCLEAN_TARGETS = KNOWN_CLEAN_TARGETS + KNOWN_FULLCLEAN_TARGETS
 
 
-def clean_build_dir(build_dir, config):
+def clean_build_dir(build_dir, config, verbose=False):
     # remove legacy ".pioenvs" folder
     legacy_build_dir = join(get_project_dir(), ".pioenvs")
     if isdir(legacy_build_dir) and legacy_build_dir != build_dir:
         fs.rmtree(legacy_build_dir)
 
     checksum_file = join(build_dir, "project.checksum")
-    checksum = compute_project_checksum(config)
+    manifest_file = join(build_dir, "project.manifest.json")
+    manifest = {}
+    if isfile(manifest_file):
+        try:
+            manifest = fs.load_json(manifest_file)
+        except (IOError, exception.InvalidJSONFile):
+            pass
+    prev_manifest = dict(manifest)
+    start_time = time()
+    with tracing.span("compute_project_checksum"):
+        checksum = compute_project_checksum(config, manifest)
+    if verbose:
+        click.secho(
+            "Computed project checksum in %.3f seconds (%d directories)"
+            % (time() - start_time, len(manifest)),
+            dim=True,
+        )
 
     if isdir(build_dir):
         # check project structure
         if isfile(checksum_file):
             with open(checksum_file, encoding="utf8") as fp:
                 if fp.read() == checksum:
+                    if manifest != prev_manifest:
+                        _save_manifest(manifest_file, manifest)
                     return
         fs.rmtree(build_dir)
 
     makedirs(build_dir)
     with open(checksum_file, mode="w", encoding="utf8") as fp:
         fp.write(checksum)
+    _save_manifest(manifest_file, manifest)
+
+
+def _save_manifest(path, manifest):
+    try:
+        with open(path, mode="w", encoding="utf8") as fp:
+            json.dump(manifest, fp)
+    except IOError:
+        pass
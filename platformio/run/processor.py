@@ -12,6 +12,9 @@
 # See the License for the specific language governing permissions and
 # limitations under the License.
 
+import threading
+
+from platformio import tracing
 from platformio.package.commands.install import install_project_env_dependencies
 from platformio.platform.factory import PlatformFactory
 from platformio.project.exception import UndefinedEnvPlatformError
@@ -20,6 +23,10 @@ from platformio.test.runners.base import CTX_META_TEST_RUNNING_NAME
 
 # pylint: disable=too-many-instance-attributes
 
+# environments may be processed in parallel (`pio run --parallel-envs`),
+# serialize installation of the shared packages between them
+_DEPENDENCIES_LOCK = threading.RLock()
+
 
 class EnvironmentProcessor:
     def __init__(  # pylint: disable=too-many-arguments,too-many-positional-arguments
@@ -72,20 +79,28 @@ class EnvironmentProcessor:
 
         # pre-clean
         if is_clean:
-            result = PlatformFactory.from_env(
-                self.name, targets=self.targets, autoinstall=True
-            ).run(build_vars, self.targets, self.silent, self.verbose, self.jobs)
+            with _DEPENDENCIES_LOCK, tracing.span("PlatformFactory.from_env"):
+                p = PlatformFactory.from_env(
+                    self.name, targets=self.targets, autoinstall=True
+                )
+            result = p.run(
+                build_vars, self.targets, self.silent, self.verbose, self.jobs
+            )
             if not build_targets:
                 return result["returncode"] == 0
 
-        install_project_env_dependencies(
-            self.name,
-            {
-                "project_targets": self.targets,
-                "piotest_running_name": build_vars.get("piotest_running_name"),
-            },
-        )
-        result = PlatformFactory.from_env(
-            self.name, targets=build_targets, autoinstall=True
-        ).run(build_vars, build_targets, self.silent, self.verbose, self.jobs)
+        with _DEPENDENCIES_LOCK:
+            with tracing.span("install_project_env_dependencies"):
+                install_project_env_dependencies(
+                    self.name,
+                    {
+                        "project_targets": self.targets,
+                        "piotest_running_name": build_vars.get("piotest_running_name"),
+                    },
+                )
+            with tracing.span("PlatformFactory.from_env"):
+                p = PlatformFactory.from_env(
+                    self.name, targets=build_targets, autoinstall=True
+                )
+        result = p.run(build_vars, build_targets, self.silent, self.verbose, self.jobs)
         return result["returncode"] == 0
@@ -0,0 +1,135 @@
+# Copyright (c) 2014-present PlatformIO <contact@platformio.org>
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import sys
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+_CURRENT_ENV_OUTPUT = ContextVar("pio_run_env_output", default=None)
+
+
+class EnvOutputBuffer:
+    """Collects everything an environment writes to stdout/stderr"""
+
+    def __init__(self):
+        self._chunks = []
+        self._lock = threading.Lock()
+
+    def write(self, data, err=False):
+        with self._lock:
+            if self._chunks and self._chunks[-1][0] == err:
+                self._chunks[-1][1].append(data)
+            else:
+                self._chunks.append((err, [data]))
+
+    def replay(self, stdout, stderr):
+        with self._lock:
+            chunks, self._chunks = self._chunks, []
+        for err, items in chunks:
+            stream = stderr if err else stdout
+            stream.write("".join(items))
+            stream.flush()
+
+
+class EnvOutputRouter:
+    """A stream proxy which redirects writes of the running environment
+    to its own buffer. The active buffer is stored in a context variable,
+    so reader threads of the build pipes inherit it too."""
+
+    def __init__(self, stream, err=False):
+        self._stream = stream
+        self._err = err
+
+    def write(self, data):
+        output = _CURRENT_ENV_OUTPUT.get()
+        if output is None:
+            return self._stream.write(data)
+        if not isinstance(data, str):
+            raise TypeError("write() argument must be str, not %s" % type(data))
+        output.write(data, self._err)
+        return len(data)
+
+    def flush(self):
+        if _CURRENT_ENV_OUTPUT.get() is None:
+            self._stream.flush()
+
+    def __getattr__(self, name):
+        return getattr(self._stream, name)
+
+
+@contextmanager
+def route_std_streams():
+    _stdout = sys.stdout
+    _stderr = sys.stderr
+    sys.stdout = EnvOutputRouter(_stdout)
+    sys.stderr = EnvOutputRouter(_stderr, err=True)
+    try:
+        yield (_stdout, _stderr)
+    finally:
+        sys.stdout = _stdout
+        sys.stderr = _stderr
+
+
+class EnvironmentScheduler:
+    """Processes environments concurrently while sharing one job budget.
+
+    Each environment runs in a worker thread with buffered output, which is
+    replayed in the original order of environments once it is finished.
+    """
+
+    def __init__(self, parallel_envs, jobs):
+        self.parallel_envs = max(1, parallel_envs)
+        self.jobs = max(1, jobs)
+
+    def get_env_jobs(self, env_nums):
+        workers = max(1, min(self.parallel_envs, env_nums))
+        return max(1, self.jobs // workers)
+
+    @staticmethod
+    def _process(output, func, *args, **kwargs):
+        token = _CURRENT_ENV_OUTPUT.set(output)
+        try:
+            return func(*args, **kwargs)
+        finally:
+            _CURRENT_ENV_OUTPUT.reset(token)
+
+    def run(self, envs, func, on_replay=None):
+        """Call `func(env, jobs)` for each environment and return results
+        in the same order as `envs`"""
+        env_jobs = self.get_env_jobs(len(envs))
+        results = []
+        with route_std_streams() as (stdout, stderr):
+            with ThreadPoolExecutor(
+                max_workers=min(self.parallel_envs, len(envs)) or 1,
+                thread_name_prefix="pio-env",
+            ) as executor:
+                tasks = []
+                for env in envs:
+                    output = EnvOutputBuffer()
+                    future = executor.submit(self._process, output, func, env, env_jobs)
+                    tasks.append((env, output, future))
+                try:
+                    for env, output, future in tasks:
+                        if on_replay:
+                            on_replay(env)
+                        try:
+                            results.append(future.result())
+                        finally:
+                            output.replay(stdout, stderr)
+                except BaseException:
+                    executor.shutdown(wait=True, cancel_futures=True)
+                    raise
+        return results
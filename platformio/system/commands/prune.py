@@ -18,6 +18,7 @@ from platformio import fs
 from platformio.system.prune import (
     prune_cached_data,
     prune_core_packages,
+    prune_library_store,
     prune_platform_packages,
 )
 
@@ -36,7 +37,14 @@ from platformio.system.prune import (
     is_flag=True,
     help="Prune only unnecessary development platform packages",
 )
-def system_prune_cmd(force, dry_run, cache, core_packages, platform_packages):
+@click.option(
+    "--library-store",
+    is_flag=True,
+    help="Prune only unused libraries from the library store",
+)
+def system_prune_cmd(  # pylint: disable=too-many-arguments,too-many-positional-arguments
+    force, dry_run, cache, core_packages, platform_packages, library_store
+):
     if dry_run:
         click.secho(
             "Dry run mode (do not prune, only show data that will be removed)",
@@ -47,7 +55,8 @@ def system_prune_cmd(force, dry_run, cache, core_packages, platform_packages):
     reclaimed_cache = 0
     reclaimed_core_packages = 0
     reclaimed_platform_packages = 0
-    prune_all = not any([cache, core_packages, platform_packages])
+    reclaimed_library_store = 0
+    prune_all = not any([cache, core_packages, platform_packages, library_store])
 
     if cache or prune_all:
         reclaimed_cache = prune_cached_data(force, dry_run)
@@ -61,10 +70,17 @@ def system_prune_cmd(force, dry_run, cache, core_packages, platform_packages):
         reclaimed_platform_packages = prune_platform_packages(force, dry_run)
         click.echo()
 
+    if library_store or prune_all:
+        reclaimed_library_store = prune_library_store(force, dry_run)
+        click.echo()
+
     click.secho(
         "Total reclaimed space: %s"
         % fs.humanize_file_size(
-            reclaimed_cache + reclaimed_core_packages + reclaimed_platform_packages
+            reclaimed_cache
+            + reclaimed_core_packages
+            + reclaimed_platform_packages
+            + reclaimed_library_store
         ),
         fg="green",
     )
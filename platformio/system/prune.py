@@ -20,6 +20,9 @@ from tabulate import tabulate
 
 from platformio import fs
 from platformio.package.manager.core import remove_unnecessary_core_packages
+from platformio.package.manager.library import (
+    remove_unnecessary_library_store_packages,
+)
 from platformio.package.manager.platform import remove_unnecessary_platform_packages
 from platformio.project.helpers import get_project_cache_dir
 
@@ -55,6 +58,14 @@ def prune_platform_packages(force=False, dry_run=False, silent=False):
     return _prune_packages(force, dry_run, silent, remove_unnecessary_platform_packages)
 
 
+def prune_library_store(force=False, dry_run=False, silent=False):
+    if not silent:
+        click.secho("Prune unused libraries from the library store:", bold=True)
+    return _prune_packages(
+        force, dry_run, silent, remove_unnecessary_library_store_packages
+    )
+
+
 def _prune_packages(force, dry_run, silent, handler):
     if not silent:
         click.echo("Calculating...")
@@ -95,4 +106,5 @@ def calculate_unnecessary_system_data():
         prune_cached_data(force=True, dry_run=True, silent=True)
         + prune_core_packages(force=True, dry_run=True, silent=True)
         + prune_platform_packages(force=True, dry_run=True, silent=True)
+        + prune_library_store(force=True, dry_run=True, silent=True)
     )
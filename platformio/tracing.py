@@ -0,0 +1,180 @@
+# Copyright (c) 2014-present PlatformIO <contact@platformio.org>
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""
+An opt-in tracing of the build pipeline (`pio run --trace`).
+
+The spans are saved in the Chrome trace-event format, so a trace can be
+loaded into Perfetto UI or `chrome://tracing`. The timestamps are taken from
+the wall clock, so a child process (SCons) writes the spans to its own trace
+file and the parent process merges them into a single timeline.
+"""
+
+import functools
+import json
+import os
+import threading
+import time
+from contextlib import contextmanager, nullcontext
+
+_tracer = None
+
+
+class Tracer:
+    def __init__(self, path, process_name=None):
+        self.path = path
+        self._events = []
+        self._threads = {}
+        self._open_spans = []
+        self._lock = threading.Lock()
+        if process_name:
+            self._events.append(
+                dict(
+                    name="process_name",
+                    ph="M",
+                    pid=os.getpid(),
+                    args=dict(name=process_name),
+                )
+            )
+
+    @staticmethod
+    def now():
+        return time.time_ns() // 1000
+
+    def _get_tid(self):
+        thread = threading.current_thread()
+        if thread.ident not in self._threads:
+            self._threads[thread.ident] = len(self._threads) + 1
+            self._events.append(
+                dict(
+                    name="thread_name",
+                    ph="M",
+                    pid=os.getpid(),
+                    tid=self._threads[thread.ident],
+                    args=dict(name=thread.name),
+                )
+            )
+        return self._threads[thread.ident]
+
+    def add_span(self, name, begin_ts, end_ts, cat="run", args=None):
+        with self._lock:
+            event = dict(
+                name=name,
+                cat=cat,
+                ph="X",
+                ts=begin_ts,
+                dur=max(end_ts - begin_ts, 0),
+                pid=os.getpid(),
+                tid=self._get_tid(),
+            )
+            if args:
+                event["args"] = args
+            self._events.append(event)
+
+    @contextmanager
+    def span(self, name, cat="run", **args):
+        begin_ts = self.now()
+        try:
+            yield
+        finally:
+            self.add_span(name, begin_ts, self.now(), cat, args)
+
+    def begin(self, name, cat="run", **args):
+        """Opens the span which is closed by `end` or on `save`"""
+        self._open_spans.append((name, self.now(), cat, args))
+
+    def end(self, name):
+        for item in reversed(self._open_spans):
+            if item[0] == name:
+                self._open_spans.remove(item)
+                self.add_span(name, item[1], self.now(), item[2], item[3])
+                return
+
+    def merge(self, path):
+        """Moves the events of the child trace file and returns them"""
+        events = []
+        try:
+            with open(path, encoding="utf8") as fp:
+                events = json.load(fp)["traceEvents"]
+        except (OSError, ValueError, KeyError):
+            pass
+        if os.path.isfile(path):
+            os.remove(path)
+        with self._lock:
+            self._events.extend(events)
+        return events
+
+    def save(self):
+        while self._open_spans:
+            name, begin_ts, cat, args = self._open_spans.pop()
+            self.add_span(name, begin_ts, self.now(), cat, args)
+        with self._lock:
+            data = dict(traceEvents=self._events, displayTimeUnit="ms")
+        with open(self.path, mode="w", encoding="utf8") as fp:
+            json.dump(data, fp)
+
+
+def start(path, process_name=None):
+    global _tracer  # pylint: disable=global-statement
+    _tracer = Tracer(path, process_name)
+    return _tracer
+
+
+def stop():
+    global _tracer  # pylint: disable=global-statement
+    if not _tracer:
+        return None
+    tracer, _tracer = _tracer, None
+    tracer.save()
+    return tracer.path
+
+
+def get_tracer():
+    return _tracer
+
+
+def is_enabled():
+    return _tracer is not None
+
+
+def span(name, cat="run", **args):
+    if not _tracer:
+        return nullcontext()
+    return _tracer.span(name, cat, **args)
+
+
+def begin(name, cat="run", **args):
+    if _tracer:
+        _tracer.begin(name, cat, **args)
+
+
+def end(name):
+    if _tracer:
+        _tracer.end(name)
+
+
+def traced(cat="run"):
+    """Decorates a function whose calls are traced as the spans"""
+
+    def decorator(func):
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            if not _tracer:
+                return func(*args, **kwargs)
+            with _tracer.span(func.__name__, cat):
+                return func(*args, **kwargs)
+
+        return wrapper
+
+    return decorator
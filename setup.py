@@ -12,7 +12,10 @@
 # See the License for the specific language governing permissions and
 # limitations under the License.
 
+import os
+
 from setuptools import find_packages, setup
+from setuptools.command.build_py import build_py
 
 from platformio import (
     __author__,
@@ -23,8 +26,17 @@ from platformio import (
     __url__,
     __version__,
 )
+from platformio.cliindex import build_index
 from platformio.dependencies import get_pip_dependencies
 
+
+class BuildPyCommand(build_py):
+    def run(self):
+        super().run()
+        # generate the index of the CLI commands
+        build_index(os.path.join(self.build_lib, "platformio"))
+
+
 setup(
     name=__title__,
     version=__version__,
@@ -47,6 +59,7 @@ setup(
             "project/integration/tpls/*/*/*/*.tpl",  # NetBeans
         ]
     },
+    cmdclass={"build_py": BuildPyCommand},
     entry_points={
         "console_scripts": [
             "platformio = platformio.__main__:main",
@@ -12,8 +12,18 @@
 # See the License for the specific language governing permissions and
 # limitations under the License.
 
+import os
+import socket
+import stat
+import time
+from contextlib import contextmanager
 from pathlib import Path
 
+import pytest
+
+from platformio.platform import daemon
+from platformio.project.config import ProjectConfig
+from platformio.run.cli import can_process_in_parallel
 from platformio.run.cli import cli as cmd_run
 
 
@@ -302,3 +312,251 @@ platform = native
     )
     result = clirunner.invoke(cmd_run, ["--project-dir", str(project_dir)])
     validate_cliresult(result)
+
+
+def test_parallel_envs(clirunner, validate_cliresult, tmp_path: Path):
+    project_dir = tmp_path / "project"
+    src_dir = project_dir / "src"
+    src_dir.mkdir(parents=True)
+    (src_dir / "main.c").write_text(
+        """
+int main() {
+}
+"""
+    )
+    (project_dir / "platformio.ini").write_text(
+        """
+[env]
+platform = native
+
+[env:first]
+[env:second]
+[env:third]
+build_flags = -DUNKNOWN_MACRO=
+    """
+    )
+    result = clirunner.invoke(
+        cmd_run,
+        ["--project-dir", str(project_dir), "--parallel-envs", "3", "--jobs", "6"],
+    )
+    validate_cliresult(result)
+    assert "3 at once with 2 job(s) each" in result.output
+    # output is replayed in the order of environments
+    positions = [
+        result.output.index("Processing %s" % env)
+        for env in ("first", "second", "third")
+    ]
+    assert positions == sorted(positions)
+    assert "3 succeeded" in result.output
+
+    # the uploads and the interactive targets are processed one by one
+    config = ProjectConfig(str(project_dir / "platformio.ini"))
+    envs = config.envs()
+    assert can_process_in_parallel(envs, config, ["buildfs"], False)
+    for target in ("upload", "uploadfs", "program", "erase", "monitor"):
+        assert not can_process_in_parallel(envs, config, [target], False)
+    config.set("env:second", "targets", "upload")
+    assert not can_process_in_parallel(envs, config, [], False)
+
+
+def _wait_for(predicate, timeout=10):
+    deadline = time.time() + timeout
+    while not predicate():
+        assert time.time() < deadline
+        time.sleep(0.1)
+
+
+def test_build_daemon(clirunner, validate_cliresult, tmp_path: Path, monkeypatch):
+    project_dir = tmp_path / "project"
+    src_dir = project_dir / "src"
+    src_dir.mkdir(parents=True)
+    (src_dir / "main.c").write_text(
+        """
+int main() {
+}
+"""
+    )
+    (project_dir / "platformio.ini").write_text(
+        """
+[env:native]
+platform = native
+    """
+    )
+    monkeypatch.setenv("PLATFORMIO_SETTING_ENABLE_BUILD_DAEMON", "yes")
+    socket_path = daemon.get_socket_path(
+        os.path.realpath(str(project_dir)),
+        "native",
+        ProjectConfig(str(project_dir / "platformio.ini")).get(
+            "platformio", "core_dir"
+        ),
+    )
+    try:
+        # the first build spawns a daemon, the next ones are served by it
+        for _ in range(3):
+            result = clirunner.invoke(cmd_run, ["--project-dir", str(project_dir)])
+            validate_cliresult(result)
+            assert os.path.exists(socket_path)
+        assert "is up to date" in result.output
+        (src_dir / "main.c").write_text("broken")
+        result = clirunner.invoke(cmd_run, ["--project-dir", str(project_dir)])
+        assert result.exit_code != 0
+        assert "error" in result.output
+    finally:
+        if daemon.shutdown(socket_path):
+            _wait_for(lambda: not os.path.exists(socket_path))
+
+
+@contextmanager
+def _socketpair_with_request(request):
+    conn, peer = socket.socketpair()
+    with conn, peer:
+        daemon._send_message(peer, request)  # pylint: disable=protected-access
+        yield conn
+
+
+def test_build_daemon_peers(tmp_path: Path, monkeypatch):
+    monkeypatch.setenv("XDG_RUNTIME_DIR", str(tmp_path))
+    socket_path = daemon.get_socket_path("/project", "native", "/core")
+    socket_dir = tmp_path / ("pio-sconsd-%d" % os.getuid())
+    assert os.path.dirname(socket_path) == str(socket_dir)
+    client = daemon.BuildDaemonClient(socket_path, "", "checksum")
+    server = daemon.BuildDaemonServer(socket_path, "", "checksum")
+    daemon.ensure_socket_dir(socket_path)
+    assert stat.S_IMODE(socket_dir.stat().st_mode) == 0o700
+    assert server.bind()
+
+    # nothing is sent to a server of another user
+    with monkeypatch.context() as m:
+        m.setattr(daemon, "get_peer_uid", lambda _: os.getuid() + 1)
+        with pytest.raises(daemon.BuildDaemonError, match="another user"):
+            client.connect()
+        # and its requests are ignored
+        with _socketpair_with_request({"cmd": "shutdown"}) as conn:
+            assert server.handle(conn)
+    with _socketpair_with_request({"cmd": "shutdown"}) as conn:
+        assert not server.handle(conn)
+
+    # the socket directory is accessible to the other users
+    socket_dir.chmod(0o755)
+    with pytest.raises(daemon.BuildDaemonError, match="Insecure"):
+        client.connect()
+    assert not client.spawn()
+    server.close()
+
+
+def test_ldf_cache(clirunner, validate_cliresult, tmp_path: Path):
+    project_dir = tmp_path / "project"
+    lib_dir = project_dir / "lib"
+    for name in ("a", "b", "c", "d"):
+        (lib_dir / name).mkdir(parents=True)
+        (lib_dir / name / ("%s.h" % name)).write_text("")
+    (lib_dir / "a" / "a.h").write_text("#include <b.h>\n")
+    src_dir = project_dir / "src"
+    (src_dir / "utils").mkdir(parents=True)
+    (src_dir / "utils" / "utils.c").write_text("int utils;\n")
+    (src_dir / "main.c").write_text(
+        """
+#include <a.h>
+
+int main() {
+}
+"""
+    )
+    (project_dir / "platformio.ini").write_text(
+        """
+[env:native]
+platform = native
+lib_ldf_mode = deep+
+    """
+    )
+    build_dir = project_dir / ".pio" / "build" / "native"
+
+    def _run():
+        result = clirunner.invoke(
+            cmd_run, ["--project-dir", str(project_dir), "--verbose"]
+        )
+        validate_cliresult(result)
+        return result.output[
+            result.output.index("Dependency Graph") : result.output.index("Building in")
+        ]
+
+    graph = _run()
+    assert (build_dir / "ldfcache.json").is_file()
+    assert "|-- b" in graph and "|-- c" not in graph
+    assert _run() == graph
+
+    # the cache is invalidated when a scanned file is changed
+    (lib_dir / "a" / "a.h").write_text("#include <b.h>\n#include <c.h>\n")
+    graph = _run()
+    assert "|-- c" in graph
+    (build_dir / "ldfcache.json").unlink()
+    assert _run() == graph
+
+    # a new source file in the nested directory
+    (src_dir / "utils" / "extra.c").write_text("#include <d.h>\n")
+    graph = _run()
+    assert "|-- d" in graph
+    (build_dir / "ldfcache.json").unlink()
+    assert _run() == graph
+
+
+def test_ldf_parallel_scan(clirunner, validate_cliresult, tmp_path: Path):
+    project_dir = tmp_path / "project"
+    lib_dir = project_dir / "lib"
+    for name in ("core", "x", "y", "z"):
+        (lib_dir / name / "src").mkdir(parents=True)
+        (lib_dir / name / "src" / ("%s.h" % name)).write_text("")
+    (lib_dir / "core" / "src" / "core.h").write_text(
+        "#ifdef USE_Y\n#include <y.h>\n#else\n#include <z.h>\n#endif\n"
+    )
+    for i in range(40):
+        (lib_dir / "core" / "src" / ("unit%d.c" % i)).write_text(
+            '#include "core.h"\n#include "unit%d.h"\n' % ((i + 1) % 40)
+        )
+        (lib_dir / "core" / "src" / ("unit%d.h" % i)).write_text(
+            "#if %d > 30\n#include <x.h>\n#endif\n" % i
+        )
+    src_dir = project_dir / "src"
+    src_dir.mkdir(parents=True)
+    (src_dir / "main.c").write_text(
+        """
+#include <core.h>
+
+int main() {
+}
+"""
+    )
+    (project_dir / "platformio.ini").write_text(
+        """
+[env]
+platform = native
+lib_ldf_mode = deep+
+build_flags = -D USE_Y
+
+[env:serial]
+
+[env:parallel]
+    """
+    )
+
+    def _run(env, jobs):
+        result = clirunner.invoke(
+            cmd_run,
+            [
+                "--project-dir",
+                str(project_dir),
+                "--environment",
+                env,
+                "--jobs",
+                str(jobs),
+                "--verbose",
+            ],
+        )
+        validate_cliresult(result)
+        return result.output[
+            result.output.index("Dependency Graph") : result.output.index("Building in")
+        ]
+
+    graph = _run("serial", 1)
+    assert "|-- x" in graph and "|-- y" in graph and "|-- z" not in graph
+    assert _run("parallel", 4) == graph
@@ -16,7 +16,9 @@ import email
 import functools
 import imaplib
 import os
+import threading
 import time
+from http.server import SimpleHTTPRequestHandler, ThreadingHTTPServer
 
 import pytest
 from click.testing import CliRunner
@@ -93,6 +95,42 @@ def without_internet(monkeypatch):
     monkeypatch.setattr(http, "_internet_on", lambda: False)
 
 
+class LocalHTTPServer(ThreadingHTTPServer):
+    def __init__(self, handler_class):
+        super().__init__(("127.0.0.1", 0), handler_class)
+        self.url = "http://127.0.0.1:%d" % self.server_address[1]
+        self._thread = threading.Thread(target=self.serve_forever, daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        if self._thread.is_alive():
+            self.shutdown()
+            self._thread.join()
+        self.server_close()
+
+
+@pytest.fixture
+def http_server():
+    """Starts a local HTTP server with the request handler class or the static
+    files of the directory, the servers are stopped at the end of the test"""
+    servers = []
+
+    def _start(handler_class=SimpleHTTPRequestHandler, directory=None):
+        handler_class = type(
+            handler_class.__name__,
+            (handler_class,),
+            dict(log_message=lambda *_: None),
+        )
+        if directory:
+            handler_class = functools.partial(handler_class, directory=str(directory))
+        servers.append(LocalHTTPServer(handler_class))
+        return servers[-1]
+
+    yield _start
+    for server in servers:
+        server.stop()
+
+
 @pytest.fixture
 def receive_email():  # pylint:disable=redefined-outer-name, too-many-locals
     def _receive_email(from_who):
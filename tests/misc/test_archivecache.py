@@ -0,0 +1,175 @@
+# Copyright (c) 2014-present PlatformIO <contact@platformio.org>
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+# pylint: disable=protected-access, redefined-outer-name
+
+import json
+import os
+import re
+
+import pytest
+
+from platformio.builder.tools import pioarchivecache
+
+
+class _Node:
+    def __init__(self, path):
+        self.path = path
+
+    def get_abspath(self):
+        return self.path
+
+
+class ArchiveEnv(dict):
+    """The minimal build environment of `pioarchivecache` tool"""
+
+    def subst(self, value):
+        value = value.replace("${ENV['PATH']}", os.environ["PATH"])
+        while "$" in value:
+            value = re.sub(
+                r"\$\{?(\w+)\}?", lambda m: str(self.get(m.group(1), "")), value
+            )
+        return value
+
+    def Dir(self, path):  # pylint: disable=invalid-name
+        return _Node(os.path.abspath(self.subst(path)))
+
+
+@pytest.fixture(autouse=True)
+def reset_fingerprints():
+    pioarchivecache._fingerprints.clear()
+
+
+def _make_package(path, name, version, uri=None):
+    os.makedirs(os.path.join(path, "include"))
+    with open(os.path.join(path, "include", "core.h"), "w", encoding="utf8") as fp:
+        fp.write("#define CORE 1\n")
+    with open(os.path.join(path, ".piopm"), "w", encoding="utf8") as fp:
+        json.dump(
+            dict(
+                type="framework",
+                name=name,
+                version=version,
+                spec=dict(owner=None, id=None, name=name, requirements=None, uri=uri),
+            ),
+            fp,
+        )
+
+
+def _make_env(tmp_path, name, defines="-DFOO"):
+    project_dir = tmp_path / name
+    for path in ("include", "lib/Foo/src"):
+        (project_dir / path).mkdir(parents=True, exist_ok=True)
+    (project_dir / "include" / "config.h").write_text("#define CONFIG 1\n")
+    (project_dir / "lib" / "Foo" / "src" / "foo.c").write_text("int foo;\n")
+    return ArchiveEnv(
+        CC="gcc",
+        PIOENV=name,
+        PROJECT_DIR=str(project_dir),
+        PROJECT_CORE_DIR=str(tmp_path / "core"),
+        PROJECT_PACKAGES_DIR=str(tmp_path / "core" / "packages"),
+        PROJECT_LIBDEPS_DIR=os.path.join("$PROJECT_DIR", ".pio", "libdeps"),
+        BUILD_DIR=os.path.join("$PROJECT_DIR", ".pio", "build", "$PIOENV"),
+        CCFLAGS="-Os -I$BUILD_DIR/config",
+        _CPPDEFFLAGS=defines,
+        CPPPATH=[
+            "$PROJECT_PACKAGES_DIR/framework-foo/include",
+            "$PROJECT_DIR/include",
+        ],
+        LIBPREFIX="lib",
+        LIBSUFFIX=".a",
+    )
+
+
+def test_package_fingerprint(tmp_path):
+    _make_package(str(tmp_path / "framework-foo"), "framework-foo", "1.2.3")
+    _make_package(
+        str(tmp_path / "framework-bar"),
+        "framework-bar",
+        "1.0.0",
+        uri="symlink://%s" % tmp_path,
+    )
+    assert (
+        pioarchivecache.get_package_fingerprint(
+            str(tmp_path / "framework-foo" / "include")
+        )
+        == "framework-foo@1.2.3"
+    )
+    assert (
+        pioarchivecache.get_package_fingerprint(
+            str(tmp_path / "framework-bar" / "include")
+        )
+        is None
+    )
+    assert pioarchivecache.get_package_fingerprint(str(tmp_path)) is None
+
+
+def test_archive_key(tmp_path):
+    _make_package(
+        str(tmp_path / "core" / "packages" / "framework-foo"), "framework-foo", "1.2.3"
+    )
+    env1 = _make_env(tmp_path, "env1")
+    env2 = _make_env(tmp_path, "env2")
+    src_dir = env1.subst("$PROJECT_DIR/lib/Foo/src")
+
+    def _key(env, src_dir=src_dir):
+        pioarchivecache._fingerprints.clear()
+        return pioarchivecache._compute_archive_key(env, src_dir, None)
+
+    key = _key(env1)
+    # the project and the build environment agnostic
+    assert _key(env2, env2.subst("$PROJECT_DIR/lib/Foo/src")) == key
+    assert _key(_make_env(tmp_path, "env3", defines="-DFOO -DBAR")) != key
+    # the content of the sources and the headers outside of packages
+    (tmp_path / "env1" / "lib" / "Foo" / "src" / "foo.c").write_text("int foo2;\n")
+    assert _key(env1) != key
+    key = _key(env1)
+    (tmp_path / "env1" / "include" / "config.h").write_text("#define CONFIG 2\n")
+    assert _key(env1) != key
+    # the files which are not compiled, e.g. the included sources
+    key = _key(env1)
+    (tmp_path / "env1" / "include" / "types.hpp").write_text("#pragma once\n")
+    assert _key(env1) != key
+    key = _key(env1)
+    (tmp_path / "env1" / "lib" / "Foo" / "src" / "table.inc").write_text("1, 2\n")
+    assert _key(env1) != key
+    # the installed package is identified by the version
+    key = _key(env1)
+    (
+        tmp_path / "core" / "packages" / "framework-foo" / "include" / "core.h"
+    ).write_text("#define CORE 2\n")
+    assert _key(env1) == key
+
+
+def test_store_archive(tmp_path):
+    env = _make_env(tmp_path, "env1")
+    archive_path = pioarchivecache._get_archive_path(env, "$BUILD_DIR/FrameworkArduino")
+    assert archive_path == os.path.join(
+        env.subst("$BUILD_DIR"), "libFrameworkArduino.a"
+    )
+    assert pioarchivecache._get_archive_path(env, "$BUILD_DIR/libfoo") == (
+        os.path.join(env.subst("$BUILD_DIR"), "libfoo.a")
+    )
+
+    os.makedirs(os.path.dirname(archive_path))
+    with open(archive_path, "wb") as fp:
+        fp.write(b"!<arch>\n")
+    cache_path = str(tmp_path / "cache" / "ab" / "abcdef.a")
+    pioarchivecache._store_archive(cache_path)([_Node(archive_path)], [], env)
+    assert os.listdir(os.path.dirname(cache_path)) == ["abcdef.a"]
+
+    restored_path = str(tmp_path / "libFoo.a")
+    pioarchivecache._restore_archive([_Node(restored_path)], [_Node(cache_path)], env)
+    with open(restored_path, "rb") as fp:
+        assert fp.read() == b"!<arch>\n"
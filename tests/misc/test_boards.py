@@ -0,0 +1,125 @@
+# Copyright (c) 2014-present PlatformIO <contact@platformio.org>
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+# pylint: disable=unused-argument
+
+import json
+import os
+import time
+
+import pytest
+
+from platformio import fs
+from platformio.platform import board
+from platformio.platform.base import PlatformBase
+from platformio.platform.exception import UnknownBoard
+from platformio.platform.factory import PlatformFactory
+from platformio.project.config import ProjectConfig
+
+
+def _write_board(boards_dir, board_id, **kwargs):
+    manifest = dict(
+        name="Board %s" % board_id,
+        url="https://example.com/%s" % board_id,
+        vendor="Vendor",
+        frameworks=["arduino"],
+        build=dict(mcu="mcu-%s" % board_id, f_cpu="16000000L", hwids=[["0x1", "0x2"]]),
+        upload=dict(maximum_ram_size=2048, maximum_size=32768),
+        debug=dict(tools={"probe": {"onboard": True}}),
+    )
+    manifest.update(kwargs)
+    path = os.path.join(boards_dir, "%s.json" % board_id)
+    with open(path, "w", encoding="utf8") as fp:
+        json.dump(manifest, fp)
+    return path
+
+
+def test_boards_index(func_isolated_pio_core, tmp_path, monkeypatch):
+    platform_dir = tmp_path / "platform"
+    (platform_dir / "boards").mkdir(parents=True)
+    (platform_dir / "platform.json").write_text(
+        json.dumps(dict(name="test", title="Test", version="1.0.0"))
+    )
+    for i in range(1000):
+        _write_board(str(platform_dir / "boards"), "board%d" % i)
+    _write_board(str(platform_dir / "boards"), "foreign", platform="other")
+    user_boards_dir = os.path.join(
+        ProjectConfig.get_instance().get("platformio", "core_dir"), "boards"
+    )
+    os.makedirs(user_boards_dir)
+    _write_board(user_boards_dir, "board1", name="Custom Board 1")
+
+    # the recent changes are not trusted
+    p = PlatformFactory.new(str(platform_dir))
+    assert len(p.get_boards()) == 1000
+    assert not os.path.isfile(p.get_boards_index_path())
+    monkeypatch.setattr(PlatformBase, "BOARDS_INDEX_RACY_DELAY", 0)
+
+    loaded_manifests = []
+    orig_load_json = fs.load_json
+    monkeypatch.setattr(
+        board.fs,
+        "load_json",
+        lambda path: (
+            os.path.basename(os.path.dirname(path)) == "boards"
+            and loaded_manifests.append(path)
+        )
+        or orig_load_json(path),
+    )
+    results = {}
+    for name in ("cold", "warm"):
+        loaded_manifests.clear()
+        p = PlatformFactory.new(str(platform_dir))
+        results[name] = [b.get_brief_data() for b in p.get_boards().values()]
+        assert len(loaded_manifests) == (1001 if name == "cold" else 0)
+    assert results["warm"] == results["cold"]
+    assert results["warm"][0]["name"] == "Custom Board 1"
+    assert results["warm"][0]["platform"] == "test"
+    assert results["warm"][2]["mcu"] == "MCU-BOARD10"
+    assert results["warm"][2]["debug"] == {"tools": {"probe": {"onboard": True}}}
+
+    # the manifests are loaded lazily
+    config = p.board_config("board5")
+    assert config.get("build.hwids") == [["0x1", "0x2"]]
+    assert config.get("platform") == "test"
+    assert not loaded_manifests
+    assert config.get("upload.maximum_size") == 32768
+    assert config.manifest["platform"] == "test"
+    assert loaded_manifests == [
+        os.path.join(str(platform_dir), "boards", "board5.json")
+    ]
+    with pytest.raises(UnknownBoard):
+        p.board_config("foreign")
+
+    # the user boards are validated by their modification times
+    path = _write_board(user_boards_dir, "board1", name="Custom Board 1.1")
+    os.utime(path, ns=(time.time_ns(), os.stat(path).st_mtime_ns + 10**9))
+    _write_board(user_boards_dir, "new", name="New Board")
+    os.utime(user_boards_dir, ns=(time.time_ns(), time.time_ns() + 10**9))
+    monkeypatch.setattr(PlatformBase, "BOARDS_INDEX_RACY_DELAY", -10)
+    p = PlatformFactory.new(str(platform_dir))
+    assert p.board_config("board1").get("name") == "Custom Board 1.1"
+    assert len(p.get_boards()) == 1001
+    assert p.get_boards()["new"].get_brief_data()["name"] == "New Board"
+
+    # a user board is removed while the index is validated
+    orig_listdir = os.listdir
+    monkeypatch.setattr(
+        os,
+        "listdir",
+        lambda path: orig_listdir(path)
+        + (["removed.json"] if path == user_boards_dir else []),
+    )
+    p = PlatformFactory.new(str(platform_dir))
+    assert p._get_boards_index_stamp() is None  # pylint: disable=protected-access
@@ -0,0 +1,112 @@
+# Copyright (c) 2014-present PlatformIO <contact@platformio.org>
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+# pylint: disable=unused-argument
+
+import multiprocessing
+import os
+import time
+
+from platformio import cache
+from platformio.cache import ContentCache
+
+
+def _write_items(worker_id):
+    with ContentCache("concurrent") as cc:
+        for i in range(50):
+            assert cc.set("key-%d-%d" % (worker_id, i), "data-%d" % i, "1h")
+            assert cc.get("key-%d-%d" % (worker_id, i)) == "data-%d" % i
+
+
+def test_content_cache(func_isolated_pio_core):
+    with ContentCache() as cc:
+        assert cc.get("unknown") is None
+        assert cc.set("key1", "data1", "1h")
+        assert cc.set("key2", "data2", "1h")
+        assert not cc.set("key3", "", "1h")
+        assert cc.get("key1") == "data1"
+        assert cc.set("key1", "new data1", "1d")
+        assert cc.get("key1") == "new data1"
+        cc.delete("key1")
+        assert cc.get("key1") is None
+        assert cc.get("key2") == "data2"
+        assert os.path.isfile(os.path.join(cc.cache_dir, ContentCache.DB_NAME))
+
+    # expired items are not returned and are removed on cleanup
+    with ContentCache() as cc:
+        assert cc.set("expired", "data", "1s")
+        assert cc.get("expired") == "data"
+        time.sleep(1.1)
+        assert cc.get("expired") is None
+        assert cc.delete()
+        assert cc.get("key2") == "data2"
+        cc.clean()
+        assert not os.path.isdir(cc.cache_dir)
+        assert cc.get("key2") is None
+
+
+def test_content_cache_eviction(func_isolated_pio_core, tmp_path, monkeypatch):
+    monkeypatch.setenv("PLATFORMIO_CACHE_DIR", str(tmp_path))
+    monkeypatch.setattr(ContentCache, "MAX_SIZE", 100)
+    monkeypatch.setattr(ContentCache, "ACCESS_UPDATE_INTERVAL", 0)
+    now = [1000000]
+    monkeypatch.setattr(cache, "time", lambda: now[0])
+    with ContentCache() as cc:
+        for i in range(5):
+            now[0] += 1
+            cc.set("key%d" % i, "x" * 30, "1d")
+        now[0] += 1
+        assert cc.get("key0")
+    # least recently used items are evicted by the periodic cleanup
+    now[0] += ContentCache.CLEANUP_INTERVAL
+    with ContentCache() as cc:
+        assert [cc.get("key%d" % i) is not None for i in range(5)] == [
+            True,
+            False,
+            False,
+            True,
+            True,
+        ]
+
+
+def test_content_cache_migration(func_isolated_pio_core):
+    cc = ContentCache()
+    os.makedirs(cc.cache_dir, exist_ok=True)
+    valid_path = cc.get_cache_path("valid")
+    expired_path = cc.get_cache_path("expired")
+    with open(valid_path, "w", encoding="utf8") as fp:
+        fp.write("valid data")
+    with open(expired_path, "w", encoding="utf8") as fp:
+        fp.write("expired data")
+    with open(os.path.join(cc.cache_dir, "db.data"), "w", encoding="utf8") as fp:
+        fp.write("%d=valid\n%d=expired\n" % (time.time() + 3600, time.time() - 1))
+    with cc:
+        assert cc.get("valid") == "valid data"
+        assert cc.get("expired") is None
+    assert not set(os.listdir(cc.cache_dir)) & set(["db.data", "valid", "expired"])
+
+
+def test_content_cache_concurrency(func_isolated_pio_core):
+    processes = [
+        multiprocessing.Process(target=_write_items, args=(i,)) for i in range(4)
+    ]
+    for p in processes:
+        p.start()
+    for p in processes:
+        p.join()
+        assert p.exitcode == 0
+    with ContentCache("concurrent") as cc:
+        for worker_id in range(4):
+            for i in range(50):
+                assert cc.get("key-%d-%d" % (worker_id, i)) == "data-%d" % i
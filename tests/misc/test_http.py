@@ -0,0 +1,121 @@
+# Copyright (c) 2014-present PlatformIO <contact@platformio.org>
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+# pylint: disable=unused-argument
+
+import time
+from http.server import BaseHTTPRequestHandler
+
+import requests
+
+from platformio import http
+
+
+def _make_responses_handler(statuses):
+    """Responds with the `statuses` in turn, then with "200 OK"
+    and counts the accepted connections"""
+    state = dict(connections=0, requests=0)
+    statuses = list(statuses)
+
+    class _RequestHandler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"
+
+        def setup(self):
+            super().setup()
+            state["connections"] += 1
+
+        def do_GET(self):  # pylint: disable=invalid-name
+            state["requests"] += 1
+            status, headers = statuses.pop(0) if statuses else (200, {})
+            self.send_response(status)
+            for name, value in headers.items():
+                self.send_header(name, value)
+            self.send_header("Content-Length", "2")
+            self.end_headers()
+            self.wfile.write(b"ok")
+
+    return _RequestHandler, state
+
+
+def test_shared_connection_pool(http_server):
+    handler_class, state = _make_responses_handler([])
+    base_url = http_server(handler_class).url
+    for _ in range(3):
+        with http.HTTPSession() as session:
+            assert session.get(base_url + "/file").text == "ok"
+    assert http.fetch_remote_content(base_url + "/file") == "ok"
+    for _ in range(3):
+        client = http.HTTPClient(base_url)
+        assert client.send_request("get", "/api").status_code == 200
+        del client
+    assert state["requests"] == 7
+    # the plain sessions and the registry clients reuse their connections
+    assert state["connections"] == 2
+
+
+def test_rate_limit_backoff(monkeypatch, http_server):
+    monkeypatch.setattr(http.HTTPSession, "RATE_LIMITER", http.HTTPRateLimiter())
+    handler_class, state = _make_responses_handler(
+        [(429, {"Retry-After": "1"}), (429, {"Retry-After": "1"})]
+    )
+    client = http.HTTPClient(http_server(handler_class).url)
+    started = time.time()
+    assert client.send_request("get", "/api").status_code == 200
+    assert time.time() - started >= 2
+    assert state["requests"] == 3
+    # the server has recovered, the requests are not delayed
+    started = time.time()
+    assert client.send_request("get", "/api").status_code == 200
+    assert time.time() - started < 1
+
+    # without "Retry-After" the delay is doubled
+    limiter = http.HTTPRateLimiter()
+    response = requests.models.Response()
+    response.status_code = 429
+    for delay in (1, 2, 4):
+        assert limiter.update("host", response)
+        assert limiter._hosts["host"][1] == delay  # pylint: disable=protected-access
+    response.status_code = 200
+    assert not limiter.update("host", response)
+    assert not limiter._hosts  # pylint: disable=protected-access
+    assert http.HTTPRateLimiter.parse_retry_after("120") == 120
+    assert http.HTTPRateLimiter.parse_retry_after("Wed, 21 Oct 2015 07:28:00 GMT") == 0
+    assert http.HTTPRateLimiter.parse_retry_after("unknown") is None
+
+
+def test_internet_probe_cache(monkeypatch, http_server):
+    calls = []
+    results = [False, True]
+    monkeypatch.setattr(
+        http, "_probe_internet", lambda: calls.append(1) or results.pop(0)
+    )
+    monkeypatch.setattr(http, "_CONNECTIVITY_STATE", dict(online=False, checked_at=0))
+    assert not http.ensure_internet_on()
+    assert not http.ensure_internet_on()
+    assert len(calls) == 1
+    # a failed probe is repeated later, the positive result is kept
+    http._CONNECTIVITY_STATE["checked_at"] -= 10  # pylint: disable=protected-access
+    assert http.ensure_internet_on()
+    assert http.ensure_internet_on()
+    assert len(calls) == 2
+
+    # a received response proves the connection
+    monkeypatch.setattr(
+        http, "_CONNECTIVITY_STATE", dict(online=False, checked_at=time.time())
+    )
+    assert not http.ensure_internet_on()
+    with http.HTTPSession() as session:
+        session.get(http_server(_make_responses_handler([])[0]).url)
+    assert http.ensure_internet_on()
+    assert len(calls) == 2
@@ -0,0 +1,89 @@
+# Copyright (c) 2014-present PlatformIO <contact@platformio.org>
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import os
+import re
+from pathlib import Path
+
+from platformio.builder.ldf import LibBuilderIndex
+from platformio.run.cli import cli as cmd_run
+
+
+class DummyLibBuilder:
+    def __init__(self, path):
+        self.path = str(path)
+
+    def __repr__(self):
+        return "DummyLibBuilder(%r)" % self.path
+
+
+def test_lib_builders_index(tmp_path: Path):
+    lib_foo = DummyLibBuilder(tmp_path / "foo")
+    nested = DummyLibBuilder(tmp_path / "foo" / "nested")
+    lib_bar = DummyLibBuilder(tmp_path / "bar")
+    (tmp_path / "foo" / "nested").mkdir(parents=True)
+    (tmp_path / "bar").mkdir()
+    (tmp_path / "foobar").mkdir()
+    os.symlink(str(tmp_path / "bar"), str(tmp_path / "bar-link"))
+    index = LibBuilderIndex([lib_foo, nested, lib_bar])
+    assert index.is_actual([lib_bar, lib_foo, nested])
+    assert not index.is_actual([lib_foo, lib_bar])
+    assert index.find(str(tmp_path / "foo" / "foo.h")) == [lib_foo]
+    assert set(index.find(str(tmp_path / "foo" / "nested" / "a.h"))) == set(
+        [lib_foo, nested]
+    )
+    assert not index.find(str(tmp_path / "foobar" / "foobar.h"))
+    assert not index.find(str(tmp_path / "foo.h"))
+    # resolve symbolic links
+    assert index.find(str(tmp_path / "bar-link" / "src" / "bar.h")) == [lib_bar]
+
+
+def test_lib_deps_resolving(clirunner, validate_cliresult, tmp_path: Path):
+    lib_nums = 40
+    project_dir = tmp_path / "project"
+    for i in range(lib_nums):
+        src_dir = project_dir / "lib" / ("lib%d" % i) / "src"
+        src_dir.mkdir(parents=True)
+        (src_dir / ("lib%d.h" % i)).write_text("")
+        # the odd libraries are the dependencies of the even ones
+        if i % 2 == 0:
+            (src_dir / ("lib%d.c" % i)).write_text("#include <lib%d.h>\n" % (i + 1))
+    (project_dir / "lib" / "unused" / "src").mkdir(parents=True)
+    (project_dir / "lib" / "unused" / "src" / "unused.h").write_text("")
+    (project_dir / "src").mkdir()
+    (project_dir / "src" / "main.c").write_text(
+        "".join("#include <lib%d.h>\n" % i for i in range(0, lib_nums, 2))
+        + "int main() {\n}\n"
+    )
+    (project_dir / "platformio.ini").write_text(
+        """
+[env:native]
+platform = native
+lib_ldf_mode = deep+
+    """
+    )
+    result = clirunner.invoke(cmd_run, ["--project-dir", str(project_dir), "--verbose"])
+    validate_cliresult(result)
+    graph = result.output[
+        result.output.index("Dependency Graph") : result.output.index("Building in")
+    ]
+    deps = {}
+    parent = None
+    for margin, name in re.findall(r"^((?:\|   )*)\|-- (\w+)", graph, re.M):
+        if margin:
+            deps[parent].append(name)
+        else:
+            parent = name
+            deps[parent] = []
+    assert deps == {"lib%d" % i: ["lib%d" % (i + 1)] for i in range(0, lib_nums, 2)}
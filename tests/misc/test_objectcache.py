@@ -0,0 +1,208 @@
+# Copyright (c) 2014-present PlatformIO <contact@platformio.org>
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+# pylint: disable=protected-access
+
+import os
+import shlex
+import shutil
+import subprocess
+import threading
+from http.server import BaseHTTPRequestHandler
+
+import pytest
+
+from platformio.builder.tools import pioobjectcache
+
+CC = "x86_64-linux-gnu-gcc"
+
+
+def _spawn(sh, escape, cmd, args, env):  # pylint: disable=unused-argument
+    return subprocess.call([sh, "-c", " ".join(escape(arg) for arg in args)], env=env)
+
+
+def _pspawn(  # pylint: disable=too-many-arguments,too-many-positional-arguments,unused-argument
+    sh, escape, cmd, args, env, stdout, stderr
+):
+    return subprocess.call(
+        [sh, "-c", " ".join(escape(arg) for arg in args)],
+        env=env,
+        stdout=stdout,
+        stderr=stderr,
+    )
+
+
+def _make_project(project_dir, config="1"):
+    os.makedirs(os.path.join(project_dir, "include"))
+    os.makedirs(os.path.join(project_dir, "src"))
+    with open(
+        os.path.join(project_dir, "include", "config.h"), "w", encoding="utf8"
+    ) as fp:
+        fp.write("#define CONFIG %s\n" % config)
+    with open(os.path.join(project_dir, "src", "main.c"), "w", encoding="utf8") as fp:
+        fp.write('#include "config.h"\nint value = CONFIG;\n')
+    os.makedirs(os.path.join(project_dir, ".pio", "build"))
+    return [
+        CC,
+        "-o",
+        os.path.join(project_dir, ".pio", "build", "main.o"),
+        "-c",
+        "-Os",
+        "-g",
+        "-I%s" % os.path.join(project_dir, "include"),
+        os.path.join(project_dir, "src", "main.c"),
+    ]
+
+
+def _compile(cache, project_dir, args, output=None):
+    calls = []
+
+    def _tracked_spawn(*spawn_args):
+        calls.append(spawn_args[3])
+        return _spawn(*spawn_args)
+
+    spawn = pioobjectcache._object_cache_spawn(
+        _tracked_spawn, _pspawn, cache, [("$PROJECT_DIR", project_dir)]
+    )
+    assert spawn("sh", shlex.quote, args[0], args, dict(os.environ)) == 0
+    assert os.path.isfile(output or args[args.index("-o") + 1])
+    return calls
+
+
+@pytest.mark.skipif(not shutil.which(CC), reason="%s is not installed" % CC)
+def test_compile(tmp_path):
+    cache = pioobjectcache.ObjectCache(str(tmp_path / "cache"))
+    args1 = _make_project(str(tmp_path / "project1"))
+    assert len(_compile(cache, str(tmp_path / "project1"), args1)) == 1
+    assert cache.stats == dict(hits=0, remote_hits=0, misses=1, stored=1)
+
+    # another location of the same project
+    args2 = _make_project(str(tmp_path / "project2"))
+    assert not _compile(cache, str(tmp_path / "project2"), args2)
+    assert cache.stats["hits"] == 1
+    with open(args1[2], "rb") as fp1, open(args2[2], "rb") as fp2:
+        assert fp1.read() == fp2.read()
+
+    # the long command line in the response file
+    args3 = _make_project(str(tmp_path / "project3"))
+    response_path = str(tmp_path / "project3" / "longcmd.tmp")
+    with open(response_path, "w", encoding="utf8") as fp:
+        fp.write(" ".join('"%s"' % arg for arg in args3[1:]))
+    assert not _compile(
+        cache, str(tmp_path / "project3"), [CC, "@%s" % response_path], args3[2]
+    )
+    assert cache.stats["hits"] == 2
+
+    # the changed header
+    args4 = _make_project(str(tmp_path / "project4"), config="2")
+    assert len(_compile(cache, str(tmp_path / "project4"), args4)) == 1
+    assert cache.stats["misses"] == 2
+
+    # not a compile command
+    link_args = [CC, "-r", "-nostdlib", "-o", str(tmp_path / "program.o"), args1[2]]
+    assert _compile(cache, str(tmp_path / "project1"), link_args) == [link_args]
+    assert cache.stats == dict(hits=2, remote_hits=0, misses=2, stored=2)
+
+
+def test_parse_compile_command():
+    assert pioobjectcache._parse_compile_command(
+        ["gcc", "-o", "main.o", "-c", "-DX=1", "src/main.cpp"]
+    ) == (
+        ["gcc", "-o", "main.o", "-c", "-DX=1", "src/main.cpp"],
+        "main.o",
+        "src/main.cpp",
+    )
+    # dependency files, assembly and several sources
+    for args in (
+        ["gcc", "-o", "main.o", "-c", "-MMD", "main.c"],
+        ["gcc", "-o", "main.o", "-c", "main.s"],
+        ["gcc", "-o", "main.o", "-c", "main.c", "extra.c"],
+        ["gcc", "-o", "firmware.elf", "main.o"],
+    ):
+        assert pioobjectcache._parse_compile_command(args) is None
+
+
+def test_parse_cache_size():
+    assert pioobjectcache.parse_cache_size("500") == 500
+    assert pioobjectcache.parse_cache_size("64KB") == 64 * 1024
+    assert pioobjectcache.parse_cache_size("1.5 GiB") == 1536 * 1024 * 1024
+    with pytest.raises(ValueError):
+        pioobjectcache.parse_cache_size("big")
+
+
+def test_lru_eviction(tmp_path):
+    cache = pioobjectcache.ObjectCache(str(tmp_path / "cache"), max_size=2500)
+    obj_path = tmp_path / "main.o"
+    obj_path.write_bytes(b"\0" * 1000)
+    for index, key in enumerate(("aa01", "bb02", "cc03")):
+        cache.put(key, str(obj_path))
+        os.utime(cache.get_local_path(key), (index, index))
+    # recently used
+    assert cache.get("aa01", str(tmp_path / "restored.o"))
+    cache.cleanup()
+    assert os.path.isfile(cache.get_local_path("aa01"))
+    assert not os.path.isfile(cache.get_local_path("bb02"))
+    assert os.path.isfile(cache.get_local_path("cc03"))
+
+    # concurrent writers
+    threads = [
+        threading.Thread(target=cache.put, args=("dd04", str(obj_path)))
+        for _ in range(8)
+    ]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert os.listdir(os.path.dirname(cache.get_local_path("dd04"))) == ["dd04.o"]
+
+
+class _StorageHandler(BaseHTTPRequestHandler):
+    storage = {}
+
+    def do_GET(self):  # pylint: disable=invalid-name
+        data = self.storage.get(self.path)
+        self.send_response(200 if data is not None else 404)
+        self.send_header("Content-Length", str(len(data or b"")))
+        self.end_headers()
+        self.wfile.write(data or b"")
+
+    def do_PUT(self):  # pylint: disable=invalid-name
+        self.storage[self.path] = self.rfile.read(int(self.headers["Content-Length"]))
+        self.send_response(201)
+        self.send_header("Content-Length", "0")
+        self.end_headers()
+
+
+def test_remote_storage(tmp_path, monkeypatch, http_server):
+    for name in ("HTTP_PROXY", "http_proxy", "ALL_PROXY", "all_proxy"):
+        monkeypatch.delenv(name, raising=False)
+    server = http_server(_StorageHandler)
+    url = server.url + "/cache"
+    obj_path = tmp_path / "main.o"
+    obj_path.write_bytes(b"\x7fELF")
+    pioobjectcache.ObjectCache(url=url).put("aa01", str(obj_path))
+    assert _StorageHandler.storage == {"/cache/aa01": b"\x7fELF"}
+
+    cache = pioobjectcache.ObjectCache(str(tmp_path / "cache"), url=url)
+    assert not cache.get("bb02", str(tmp_path / "restored.o"))
+    assert cache.get("aa01", str(tmp_path / "restored.o"))
+    assert (tmp_path / "restored.o").read_bytes() == b"\x7fELF"
+    assert os.path.isfile(cache.get_local_path("aa01"))
+    assert cache.stats == dict(hits=0, remote_hits=1, misses=1, stored=0)
+    server.stop()
+
+    # the unavailable storage is disabled
+    cache = pioobjectcache.ObjectCache(url=url)
+    assert not cache.get("aa01", str(tmp_path / "restored.o"))
+    assert cache.url is None
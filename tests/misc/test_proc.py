@@ -0,0 +1,110 @@
+# Copyright (c) 2014-present PlatformIO <contact@platformio.org>
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import os
+import random
+
+from platformio import proc
+
+
+def _char_by_char_reading(text):
+    """A reference implementation of the former `BuildAsyncPipe`"""
+    calls = []
+    line = ""
+    print_immediately = False
+    for char in text:
+        if line and char.strip() and line[-3:] == (char * 3):
+            print_immediately = True
+        if print_immediately:
+            if line:
+                calls.append(("data", line))
+                line = ""
+            calls.append(("data", char))
+            if char == "\n":
+                print_immediately = False
+        else:
+            line += char
+            if char != "\n":
+                continue
+            calls.append(("line", line))
+            line = ""
+    return calls
+
+
+def _merge_data_calls(calls):
+    result = []
+    for kind, data in calls:
+        if kind == "data" and result and result[-1][0] == "data":
+            result[-1] = ("data", result[-1][1] + data)
+        else:
+            result.append((kind, data))
+    return result
+
+
+def _pipe_through(pipe, data, chunk_size=None):
+    chunk_size = chunk_size or len(data) or 1
+    for i in range(0, len(data), chunk_size):
+        os.write(pipe.fileno(), data[i : i + chunk_size])
+    pipe.close()
+
+
+def test_build_async_pipe():
+    rnd = random.Random(5)
+    text = "".join(
+        rnd.choice(
+            [
+                "gcc -c -o main.o main.c\n",
+                "Uploading ....",
+                "..........",
+                "=====>     ",
+                " 100%\r\n",
+                "Привіт\n",
+                "\t\t\t\t",
+                "aaaa\n",
+                "x",
+                "\n",
+            ]
+        )
+        for _ in range(2000)
+    )
+    text += "\n"
+    expected = _merge_data_calls(_char_by_char_reading(text.replace("\r\n", "\n")))
+    for chunk_size in (1, 3, 7, 4096, None):
+        calls = []
+        pipe = proc.BuildAsyncPipe(
+            line_callback=lambda line, calls=calls: calls.append(("line", line)),
+            data_callback=lambda data, calls=calls: calls.append(("data", data)),
+        )
+        _pipe_through(pipe, text.encode(), chunk_size)
+        assert _merge_data_calls(calls) == expected
+
+
+def test_async_pipes_long_lines():
+    lines = [
+        "gcc -o .pio/build/env/src/main%d.o -c %s src/main%d.c\n"
+        % (i, " ".join("-I.pio/libdeps/env/Library%d/src" % j for j in range(200)), i)
+        for i in range(50)
+    ]
+    data = "".join(lines).encode()
+    for pipe_cls, kwargs in (
+        (proc.BuildAsyncPipe, dict(data_callback=lambda _: None)),
+        (proc.LineBufferedAsyncPipe, {}),
+    ):
+        received = []
+        pipe = pipe_cls(
+            line_callback=lambda line, received=received: received.append(line),
+            **kwargs
+        )
+        _pipe_through(pipe, data, 4096)
+        assert received == lines
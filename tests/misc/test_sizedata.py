@@ -0,0 +1,256 @@
+# Copyright (c) 2014-present PlatformIO <contact@platformio.org>
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+# pylint: disable=protected-access, redefined-outer-name
+
+import os
+import shutil
+import subprocess
+
+import pytest
+from elftools.elf.elffile import ELFFile
+
+from platformio.builder.tools import piosize, piosizediff
+
+TOOLCHAIN_PREFIX = "x86_64-linux-gnu-"
+UNITS_NUMS = 4
+SYMBOLS_PER_UNIT = 250
+
+skip_without_toolchain = pytest.mark.skipif(
+    not all(
+        shutil.which(TOOLCHAIN_PREFIX + tool)
+        for tool in ("gcc", "g++", "addr2line", "c++filt")
+    ),
+    reason="%s toolchain is not installed" % TOOLCHAIN_PREFIX,
+)
+
+
+class _Method:
+    def __init__(self, env, method):
+        self.env = env
+        self.method = method
+
+    def __call__(self, *args, **kwargs):
+        return self.method(self.env, *args, **kwargs)
+
+
+class SizeEnv(dict):
+    """The minimal build environment of `piosize` tool"""
+
+    def __init__(self, build_dir, options=None):
+        super().__init__(ENV={"PATH": os.environ["PATH"]})
+        self.build_dir = build_dir
+        self.options = options or {}
+        for name in (
+            "pioSizeDetermineSection",
+            "pioSizeIsValidSymbol",
+            "pioSizeIsRamSection",
+            "pioSizeIsFlashSection",
+            "pioSizeCalculateFirmwareSize",
+        ):
+            setattr(self, name, _Method(self, getattr(piosize, name)))
+
+    def subst(self, value):
+        return value.replace("$BUILD_DIR", self.build_dir).replace(
+            "$CC", TOOLCHAIN_PREFIX + "gcc"
+        )
+
+    def GetProjectOption(self, name, default=None):  # pylint: disable=invalid-name
+        return self.options.get(name, default)
+
+    @staticmethod
+    def Exit(code):  # pylint: disable=invalid-name
+        raise SystemExit(code)
+
+
+def _build_firmware(src_dir, dwarf_version):
+    sources = []
+    for i in range(UNITS_NUMS):
+        lines = ["namespace unit%d {" % i]
+        for j in range(SYMBOLS_PER_UNIT):
+            lines.extend(
+                [
+                    "int var%d = %d;" % (j, j),
+                    "static char buffer%d[%d];" % (j, j + 1),
+                    "struct Counter%d { static int value; };" % j,
+                    "int Counter%d::value = %d;" % (j, j),
+                    "int func%d(int x) {" % j,
+                    "  static int calls;",
+                    "  buffer%d[0] = calls++;" % j,
+                    "  return x + var%d + Counter%d::value + buffer%d[0];" % (j, j, j),
+                    "}",
+                ]
+            )
+        lines.append("}")
+        sources.append(src_dir / ("unit%d.cpp" % i))
+        sources[-1].write_text("\n".join(lines))
+    sources.append(src_dir / "main.c")
+    sources[-1].write_text("int counter;\nint main(void) { return counter; }\n")
+    elf_path = src_dir / "firmware.elf"
+    subprocess.run(
+        [TOOLCHAIN_PREFIX + "g++", "-gdwarf-%d" % dwarf_version, "-o", str(elf_path)]
+        + [str(p) for p in sources],
+        check=True,
+    )
+    return str(elf_path)
+
+
+def _raise_oserror(*_):
+    raise OSError("Read-only file system")
+
+
+@skip_without_toolchain
+@pytest.mark.parametrize("dwarf_version", [4, 5])
+def test_symbols_info(dwarf_version, tmp_path, monkeypatch):
+    elf_path = _build_firmware(tmp_path, dwarf_version)
+    env = SizeEnv(str(tmp_path))
+    with open(elf_path, "rb") as fp:
+        elffile = ELFFile(fp)
+        sections = piosize._collect_sections_info(env, elffile)
+
+        expected = piosize._collect_symbols_info_with_tools(
+            env, elffile, elf_path, sections
+        )
+        symbols = piosize._collect_symbols_info_in_process(env, elffile, sections)
+        assert len(symbols) > UNITS_NUMS * SYMBOLS_PER_UNIT * 4
+        assert symbols == expected
+        located = {s["name"]: s for s in symbols if s.get("file")}
+        assert located["counter"]["file"].endswith("main.c")
+        assert located["counter"]["line"] == 1
+        assert located["_ZN5unit08Counter05valueE"]["line"] == 5
+
+        # the cache is not writable
+        with monkeypatch.context() as m:
+            m.setattr(piosize, "replace", _raise_oserror)
+            assert (
+                piosize._collect_symbols_info(env, elffile, elf_path, sections)
+                == symbols
+            )
+        assert not [
+            name for name in os.listdir(env.build_dir) if name.startswith("sizedata")
+        ]
+
+        # cached by the hash of ELF file
+        assert piosize._collect_symbols_info(env, elffile, elf_path, sections) == (
+            symbols
+        )
+        assert os.path.isfile(os.path.join(env.build_dir, "sizedata-cache.json"))
+        with monkeypatch.context() as m:
+            m.setattr(
+                piosize,
+                "_collect_symbols_info_in_process",
+                lambda *_: pytest.fail("not cached"),
+            )
+            assert (
+                piosize._collect_symbols_info(env, elffile, elf_path, sections)
+                == symbols
+            )
+
+
+def _make_size_info(text_size, symbols_nums):
+    sections = {
+        ".text": dict(size=text_size, start_addr=0, in_flash=True),
+        ".data": dict(size=1024, start_addr=0x10000, in_ram=True, in_flash=True),
+        ".bss": dict(size=4096, start_addr=0x20000, in_ram=True),
+    }
+    symbols = [
+        dict(
+            name="func%d" % i,
+            section=".text",
+            size=text_size // symbols_nums,
+            file="src/unit%d.c" % (i % 100),
+            line=i,
+        )
+        for i in range(symbols_nums)
+    ]
+    symbols.append(dict(name="buffer", section=".bss", size=4096))
+    return sections, symbols
+
+
+def _make_snapshot(env, text_size, symbols_nums):
+    return piosizediff._make_size_snapshot(
+        env, *_make_size_info(text_size, symbols_nums)
+    )
+
+
+def test_size_snapshot(tmp_path):
+    env = SizeEnv(str(tmp_path))
+    snapshot = _make_snapshot(env, 2000, 10)
+    assert snapshot["ram_size"] == 1024 + 4096
+    assert snapshot["flash_size"] == 2000 + 1024
+    assert snapshot["files"]["path"][-1] == "unknown"
+    assert snapshot["files"]["ram_size"][-1] == 4096
+    assert snapshot["files"]["flash_size"][0] == 200
+    assert snapshot["symbols"]["name"][:2] == ["func0", "func1"]
+    assert snapshot["symbols"]["section"][-1] == 2
+
+    snapshot_path = str(tmp_path / "sizesnapshot.json")
+    piosizediff._save_size_snapshot(snapshot, snapshot_path)
+    assert piosizediff._load_size_snapshot(snapshot_path) == snapshot
+    (tmp_path / "legacy.json").write_text('{"version": 0}')
+    assert piosizediff._load_size_snapshot(str(tmp_path / "legacy.json")) is None
+    assert piosizediff._load_size_snapshot(str(tmp_path / "missing.json")) is None
+
+
+def test_size_diff(tmp_path):
+    env = SizeEnv(str(tmp_path))
+    baseline = _make_snapshot(env, 800000, 80000)
+    current = _make_snapshot(env, 880000, 80000)
+    diff = piosizediff._diff_size_snapshots(baseline, current)
+    assert diff["total"] == [("ram", 5120, 5120), ("flash", 801024, 881024)]
+    assert diff["sections"] == [(".text", 800000, 880000)]
+    assert diff["files"][0] == ("src/unit0.c", 8000, 8800)
+    assert len(diff["symbols"]) == 80000
+    assert "func0 (src/unit0.c)" in piosizediff._format_size_diff(diff)
+
+    # thresholds
+    thresholds = piosizediff._parse_size_thresholds(
+        [".text = 100000", "flash=5%", "ram = 0"]
+    )
+    assert thresholds == {
+        ".text": (100000, False),
+        "flash": (5.0, True),
+        "ram": (0, False),
+    }
+    errors = piosizediff._check_size_thresholds(diff, thresholds)
+    assert len(errors) == 1
+    assert "`flash` grew by 80000 bytes" in errors[0]
+    # the shrunk firmware
+    assert not piosizediff._check_size_thresholds(
+        piosizediff._diff_size_snapshots(current, _make_snapshot(env, 1000, 10)),
+        thresholds,
+    )
+    with pytest.raises(ValueError):
+        piosizediff._parse_size_thresholds([".text = big"])
+
+
+def test_dump_size_diff(tmp_path, monkeypatch):
+    env = SizeEnv(str(tmp_path), dict(sizediff_thresholds=["flash = 1000"]))
+    snapshot_path = str(tmp_path / "sizesnapshot.json")
+
+    def _dump(text_size):
+        monkeypatch.setattr(
+            piosize, "collect_size_info", lambda *_: _make_size_info(text_size, 10)
+        )
+        piosizediff.DumpSizeDiff(None, None, None, env)
+        return piosizediff._load_size_snapshot(snapshot_path)["flash_size"]
+
+    assert _dump(2000) == 3024
+    assert _dump(2500) == 3524
+    # the baseline is kept when the growth exceeds the thresholds
+    with pytest.raises(SystemExit):
+        _dump(4000)
+    assert piosizediff._load_size_snapshot(snapshot_path)["flash_size"] == 3524
+    with pytest.raises(SystemExit):
+        _dump(4000)
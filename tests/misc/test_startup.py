@@ -0,0 +1,105 @@
+# Copyright (c) 2014-present PlatformIO <contact@platformio.org>
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+# pylint: disable=unused-argument, protected-access
+
+import json
+import subprocess
+import sys
+from pathlib import Path
+
+import pytest
+
+from platformio import cliindex
+from platformio.__main__ import cli as cli_pio
+from platformio.cli import PlatformioCLI
+
+# the modules which must not be imported on the CLI startup
+HEAVY_MODULES = ("requests", "semantic_version", "tabulate", "SCons", "starlette")
+
+
+def _get_imported_modules(args, cwd=None):
+    """Returns the names of the all modules imported by the Python process"""
+    output = subprocess.run(
+        [sys.executable, "-X", "importtime"] + args,
+        cwd=cwd,
+        capture_output=True,
+        text=True,
+        check=False,
+    ).stderr
+    modules = set()
+    for line in output.splitlines():
+        if line.startswith("import time:") and "[us]" not in line:
+            modules.add(line[12:].split("|")[2].strip())
+    return modules
+
+
+def test_startup_modules():
+    modules = _get_imported_modules(["-c", "import platformio.__main__"])
+    assert "platformio.cli" in modules
+    for name in HEAVY_MODULES:
+        assert name not in modules
+
+
+@pytest.mark.parametrize(
+    "command", ["--version", "run --list-targets", "project config --json-output"]
+)
+def test_command_startup_modules(command, tmp_path, isolated_pio_core):
+    (tmp_path / "platformio.ini").write_text("[env:native]\nplatform = native\n")
+    args = command.split()
+    if args[0] == "run":
+        # the build system is out of the scope
+        args.extend(["--project-dir", str(tmp_path / "missing")])
+    modules = _get_imported_modules(["-m", "platformio"] + args, str(tmp_path))
+    assert "platformio.cli" in modules
+    lazy_modules = HEAVY_MODULES if args[0] != "run" else ("SCons", "starlette")
+    for name in lazy_modules:
+        assert name not in modules
+
+
+def test_commands_index(tmp_path, monkeypatch):
+    index_path = tmp_path / cliindex.INDEX_NAME
+    monkeypatch.setattr(cliindex, "get_index_path", lambda *_: str(index_path))
+    monkeypatch.setattr(PlatformioCLI, "_pio_commands", {})
+    monkeypatch.setattr(PlatformioCLI, "_pio_commands_scanned", False)
+
+    # generated when missing
+    commands = PlatformioCLI._find_pio_commands()
+    assert commands == cliindex.find_commands()
+    assert commands["pkg"] == "platformio.package.cli"
+    assert commands["boards"] == "platformio.commands.boards"
+    assert cliindex.load_index() == commands
+
+    # loaded without scanning of the package
+    monkeypatch.setattr(PlatformioCLI, "_pio_commands", {})
+    monkeypatch.setattr(PlatformioCLI, "_pio_commands_scanned", False)
+    with monkeypatch.context() as m:
+        m.setattr(Path, "rglob", lambda *_: pytest.fail("scanned"))
+        assert PlatformioCLI._find_pio_commands() == commands
+        assert "run" in cli_pio.list_commands(None)
+
+    # the outdated index
+    data = json.loads(index_path.read_text())
+    del data["commands"]["run"]
+    data["commands"]["system"] = "platformio.removed.cli"
+    index_path.write_text(json.dumps(data))
+    monkeypatch.setattr(PlatformioCLI, "_pio_commands", {})
+    assert cli_pio.get_command(None, "run").name == "run"
+    assert PlatformioCLI._pio_commands_scanned
+    assert cliindex.load_index() == commands
+
+    # the index of another version
+    data["version"] = "0.0.0"
+    index_path.write_text(json.dumps(data))
+    assert cliindex.load_index() is None
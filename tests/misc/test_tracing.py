@@ -0,0 +1,130 @@
+# Copyright (c) 2014-present PlatformIO <contact@platformio.org>
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+# pylint: disable=protected-access
+
+import json
+import os
+import threading
+
+from platformio import tracing
+from platformio.builder.tools import piotrace
+
+
+@tracing.traced("scons")
+def _build_frameworks():
+    return 42
+
+
+def test_disabled():
+    assert not tracing.is_enabled()
+    with tracing.span("noop"):
+        pass
+    tracing.begin("noop")
+    tracing.end("noop")
+    assert _build_frameworks() == 42
+    assert tracing.stop() is None
+
+
+def test_trace(tmp_path):
+    trace_path = str(tmp_path / "trace.json")
+    tracer = tracing.start(trace_path, "pio run")
+    try:
+        with tracing.span("env", cat="env", targets=["upload"]):
+            assert _build_frameworks() == 42
+        tracing.begin("Build targets")
+        thread = threading.Thread(
+            target=lambda: tracer.add_span("main.o", 10, 25, "compile"),
+            name="Job 1",
+        )
+        thread.start()
+        thread.join()
+
+        # the trace of the child process
+        child_path = tmp_path / "child.json"
+        child_path.write_text(
+            json.dumps(
+                dict(
+                    traceEvents=[
+                        dict(name="program.elf", ph="X", ts=30, dur=5, pid=1, tid=1)
+                    ]
+                )
+            )
+        )
+        assert len(tracer.merge(str(child_path))) == 1
+        assert not child_path.exists()
+        assert tracer.merge(str(child_path)) == []
+    finally:
+        assert tracing.stop() == trace_path
+    assert not tracing.is_enabled()
+
+    with open(trace_path, encoding="utf8") as fp:
+        data = json.load(fp)
+    events = {e["name"]: e for e in data["traceEvents"]}
+    assert events["process_name"]["ph"] == "M"
+    assert events["process_name"]["args"] == {"name": "pio run"}
+    assert events["env"]["ph"] == "X"
+    assert events["env"]["args"] == {"targets": ["upload"]}
+    assert events["env"]["pid"] == os.getpid()
+    # nested spans
+    span = events["_build_frameworks"]
+    assert span["cat"] == "scons"
+    assert events["env"]["ts"] <= span["ts"]
+    assert span["ts"] + span["dur"] <= events["env"]["ts"] + events["env"]["dur"]
+    # closed on save
+    assert events["Build targets"]["dur"] >= 0
+    # another thread has own track
+    assert events["main.o"]["dur"] == 15
+    assert events["main.o"]["tid"] != events["env"]["tid"]
+    assert {"Job 1", threading.current_thread().name} == {
+        e["args"]["name"] for e in data["traceEvents"] if e["name"] == "thread_name"
+    }
+    assert events["program.elf"]["pid"] == 1
+
+
+def test_describe_command():
+    assert piotrace._describe_command(
+        ["gcc", "-o", "src/main.o", "-c", "-Os", "src/main.c"]
+    ) == ("src/main.o", "compile")
+    assert piotrace._describe_command(
+        ["g++", "-o", "firmware.elf", "-Wl,--gc-sections", "src/main.o"]
+    ) == ("firmware.elf", "link")
+    assert piotrace._describe_command(
+        ["/toolchain/bin/xtensa-esp32-elf-ar", "rc", "libFrameworkArduino.a", "a.o"]
+    ) == ("libFrameworkArduino.a", "archive")
+    assert piotrace._describe_command(["ranlib", "libFrameworkArduino.a"]) == (
+        "libFrameworkArduino.a",
+        "archive",
+    )
+    assert piotrace._describe_command(["objcopy", "-O", "binary", "a.elf"]) == (
+        "objcopy",
+        "command",
+    )
+
+
+def test_trace_spawn(tmp_path):
+    build_dir = str(tmp_path / "build")
+    tracer = tracing.start(str(tmp_path / "trace.json"))
+    try:
+        calls = []
+        spawn = piotrace._trace_spawn(lambda *args: calls.append(args) or 0, build_dir)
+        args = ["gcc", "-o", os.path.join(build_dir, "src", "main.o"), "-c", "main.c"]
+        assert spawn("sh", None, "gcc", args, {}) == 0
+        assert calls == [("sh", None, "gcc", args, {})]
+        events = [e for e in tracer._events if e["ph"] == "X"]
+        assert [(e["name"], e["cat"]) for e in events] == [
+            (os.path.join("src", "main.o"), "compile")
+        ]
+    finally:
+        tracing.stop()
@@ -0,0 +1,158 @@
+# Copyright (c) 2014-present PlatformIO <contact@platformio.org>
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+# pylint: disable=unused-argument
+
+import hashlib
+import os
+import re
+import socket
+import threading
+from http.server import BaseHTTPRequestHandler
+
+import pytest
+import requests
+
+from platformio.package.download import FileDownloader
+from platformio.package.exception import PackageException
+
+PAYLOAD = bytes(range(256)) * 4096  # 1 MiB
+CHECKSUM = hashlib.sha256(PAYLOAD).hexdigest()
+
+
+def _make_payload_handler(payload, ranges=True, disconnects=0, cut_after=100 * 1024):
+    """Serves the `payload` with the optional support of the ranged requests,
+    the first `disconnects` responses are cut after the `cut_after` bytes"""
+    state = dict(disconnects=disconnects, requests=[])
+    lock = threading.Lock()
+
+    class _RequestHandler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"
+
+        def do_GET(self):  # pylint: disable=invalid-name
+            start, end = 0, len(payload) - 1
+            match = re.match(r"bytes=(\d+)-(\d*)$", self.headers.get("Range", ""))
+            with lock:
+                state["requests"].append(self.headers.get("Range"))
+                disconnect = state["disconnects"] > 0
+                state["disconnects"] -= 1
+            if ranges and match:
+                start = int(match.group(1))
+                end = int(match.group(2)) if match.group(2) else end
+                self.send_response(206)
+                self.send_header(
+                    "Content-Range", "bytes %d-%d/%d" % (start, end, len(payload))
+                )
+            else:
+                self.send_response(200)
+            if ranges:
+                self.send_header("Accept-Ranges", "bytes")
+                self.send_header("ETag", '"payload"')
+            self.send_header("Content-Type", "application/octet-stream")
+            self.send_header("Content-Length", str(end - start + 1))
+            self.end_headers()
+            body = payload[start : end + 1]
+            if disconnect:
+                self.wfile.write(body[:cut_after])
+                self.wfile.flush()
+                self.close_connection = True
+                self.connection.shutdown(socket.SHUT_RDWR)
+                return
+            self.wfile.write(body)
+
+    return _RequestHandler, state
+
+
+def _serve_payload(http_server, *args, **kwargs):
+    handler_class, state = _make_payload_handler(*args, **kwargs)
+    return http_server(handler_class).url + "/payload.bin", state
+
+
+def _download(url, dst_dir, checksum=CHECKSUM):
+    fd = FileDownloader(url, str(dst_dir))
+    fd.start(with_progress=False, silent=True, checksum=checksum)
+    return fd.get_filepath()
+
+
+def test_resume_after_disconnect(tmp_path, monkeypatch, http_server):
+    monkeypatch.setattr(FileDownloader, "MAX_CONNECTIONS", 1)
+    url, state = _serve_payload(http_server, PAYLOAD, disconnects=3)
+    path = _download(url, tmp_path)
+    with open(path, "rb") as fp:
+        assert fp.read() == PAYLOAD
+    assert not os.path.exists(path + ".part")
+    # every reconnection continues from the last received byte
+    offsets = [
+        int(re.match(r"bytes=(\d+)-%d$" % (len(PAYLOAD) - 1), r).group(1))
+        for r in state["requests"][1:]
+    ]
+    assert state["requests"][0] is None
+    assert len(offsets) == 3 and offsets == sorted(set(offsets)) and offsets[0] > 0
+
+
+def test_parallel_ranges(tmp_path, monkeypatch, http_server):
+    monkeypatch.setattr(FileDownloader, "SEGMENT_SIZE", 64 * 1024)
+    monkeypatch.setattr(FileDownloader, "PARALLEL_MIN_SIZE", 128 * 1024)
+    url, state = _serve_payload(http_server, PAYLOAD, disconnects=5, cut_after=10000)
+    path = _download(url, tmp_path)
+    with open(path, "rb") as fp:
+        assert fp.read() == PAYLOAD
+    segments = len(PAYLOAD) // (64 * 1024)
+    # the initial request, segments and resumed segments
+    assert len(state["requests"]) >= 1 + segments
+    for start in range(0, len(PAYLOAD), 64 * 1024):
+        assert "bytes=%d-%d" % (start, start + 64 * 1024 - 1) in state["requests"]
+
+
+def test_resume_part_file(tmp_path, http_server):
+    url, state = _serve_payload(http_server, PAYLOAD)
+    with open(str(tmp_path / "payload.bin.part"), "wb") as fp:
+        fp.write(PAYLOAD[:300000])
+    path = _download(url, tmp_path)
+    with open(path, "rb") as fp:
+        assert fp.read() == PAYLOAD
+    assert state["requests"] == [None, "bytes=300000-%d" % (len(PAYLOAD) - 1)]
+
+    # a partial file of the unknown checksum is not trusted
+    os.remove(path)
+    url, state = _serve_payload(http_server, PAYLOAD)
+    with open(str(tmp_path / "payload.bin.part"), "wb") as fp:
+        fp.write(b"garbage")
+    path = _download(url, tmp_path, checksum=None)
+    with open(path, "rb") as fp:
+        assert fp.read() == PAYLOAD
+    assert state["requests"] == [None]
+
+
+def test_no_ranges_support(tmp_path, http_server):
+    url, state = _serve_payload(http_server, PAYLOAD, ranges=False)
+    with open(str(tmp_path / "payload.bin.part"), "wb") as fp:
+        fp.write(PAYLOAD[:300000])
+    path = _download(url, tmp_path)
+    with open(path, "rb") as fp:
+        assert fp.read() == PAYLOAD
+    assert state["requests"] == [None]
+
+    os.remove(path)
+    url, _ = _serve_payload(http_server, PAYLOAD, ranges=False, disconnects=1)
+    with pytest.raises(requests.exceptions.RequestException):
+        _download(url, tmp_path)
+    assert not os.path.exists(path)
+
+
+def test_checksum_mismatch(tmp_path, http_server):
+    url, _ = _serve_payload(http_server, PAYLOAD, disconnects=1)
+    with pytest.raises(PackageException, match="does not match"):
+        _download(url, tmp_path, checksum=hashlib.sha256(b"other").hexdigest())
+    assert not os.listdir(str(tmp_path))
@@ -12,27 +12,44 @@
 # See the License for the specific language governing permissions and
 # limitations under the License.
 
-# pylint: disable=unused-argument
+# pylint: disable=unused-argument, too-many-lines
 
+import errno
+import gzip
+import hashlib
+import io
+import json
 import logging
 import os
+import shutil
+import tarfile
 import time
+import zipfile
+from http.server import SimpleHTTPRequestHandler
 from pathlib import Path
 from random import random
 
 import pytest
 import semantic_version
 
-from platformio import fs, util
+from platformio import app, fs, util
+from platformio.package.cli import cli as package_cli
 from platformio.package.exception import (
     MissingPackageManifestError,
+    PackageException,
     UnknownPackageError,
 )
-from platformio.package.manager.library import LibraryPackageManager
+from platformio.package.manager.library import (
+    LibraryPackageManager,
+    remove_unnecessary_library_store_packages,
+)
 from platformio.package.manager.platform import PlatformPackageManager
 from platformio.package.manager.tool import ToolPackageManager
-from platformio.package.meta import PackageSpec
+from platformio.package.manifest.parser import ManifestParserFactory
+from platformio.package.meta import PackageItem, PackageMetadata, PackageSpec
 from platformio.package.pack import PackagePacker
+from platformio.registry.client import RegistryClient
+from platformio.registry.index import RegistryIndex
 
 
 def test_download(isolated_pio_core):
@@ -254,6 +271,71 @@ def test_install_force(isolated_pio_core, tmpdir_factory):
     assert pkg.metadata.version.major > 5
 
 
+def _pack_library(dst_dir, name, version, files=None):
+    archive_path = os.path.join(str(dst_dir), "%s-%s.tar.gz" % (name, version))
+    with tarfile.open(archive_path, "w:gz") as tf:
+        items = dict(files or {})
+        items["library.json"] = json.dumps(dict(name=name, version=version))
+        for path, contents in items.items():
+            data = contents.encode()
+            info = tarfile.TarInfo(path)
+            info.size = len(data)
+            tf.addfile(info, io.BytesIO(data))
+    return archive_path
+
+
+def test_install_moves_package(isolated_pio_core, tmp_path, monkeypatch):
+    storage_dir = tmp_path / "storage"
+    lm = LibraryPackageManager(str(storage_dir))
+    lm.set_log_level(logging.ERROR)
+    copied = []
+    orig_copytree = shutil.copytree
+
+    def _copytree(src, dst, *args, **kwargs):
+        copied.append(dst)
+        return orig_copytree(src, dst, *args, **kwargs)
+
+    monkeypatch.setattr(shutil, "copytree", _copytree)
+    v1_path = _pack_library(tmp_path, "Foo", "1.0.0", {"src/foo.h": "v1"})
+    v2_path = _pack_library(tmp_path, "Foo", "2.0.0", {"src/foo.h": "v2"})
+    lm.install("file://%s" % v1_path)
+    # detach existing
+    lm.install("file://%s" % v2_path)
+    assert not copied
+    lm.memcache_reset()
+    assert sorted(
+        (os.path.basename(pkg.path), str(pkg.metadata.version))
+        for pkg in lm.get_installed()
+    ) == [("Foo", "2.0.0"), ("Foo@src-%s" % _hash_uri(v1_path), "1.0.0")]
+    assert (storage_dir / "Foo" / "src" / "foo.h").read_text() == "v2"
+    assert not os.listdir(lm.get_tmp_dir())
+
+    # fall back to copying across devices
+    orig_replace = os.replace
+
+    def _replace(src, dst):
+        if str(dst).startswith(str(storage_dir)):
+            _raise_exdev()
+        return orig_replace(src, dst)
+
+    monkeypatch.setattr(os, "replace", _replace)
+    lm.install("file://%s" % v1_path, force=True)
+    assert copied
+    assert (storage_dir / "Foo" / "src" / "foo.h").read_text() == "v1"
+    assert (
+        storage_dir / ("Foo@src-%s" % _hash_uri(v2_path)) / "src" / "foo.h"
+    ).read_text() == "v2"
+    assert not os.listdir(lm.get_tmp_dir())
+
+
+def _hash_uri(path):
+    return hashlib.md5(("file://%s" % path).encode()).hexdigest()
+
+
+def _raise_exdev(*_):
+    raise OSError(errno.EXDEV, os.strerror(errno.EXDEV))
+
+
 def test_symlink(tmp_path: Path):
     external_pkg_dir = tmp_path / "External"
     external_pkg_dir.mkdir()
@@ -482,6 +564,82 @@ def test_get_installed(isolated_pio_core, tmpdir_factory):
     assert str(pm.get_package("check-system").metadata.version) == "3.0.0"
 
 
+def test_get_installed_index(isolated_pio_core, tmp_path, monkeypatch):
+    storage_dir = tmp_path / "storage"
+    for i in range(500):
+        pkg_dir = storage_dir / ("tool-%d" % i)
+        pkg_dir.mkdir(parents=True)
+        (pkg_dir / "package.json").write_text(
+            json.dumps(
+                dict(
+                    name="tool-%d" % i,
+                    version="1.0.%d" % i,
+                    system=["unknown"] if i % 100 == 0 else "*",
+                )
+            )
+        )
+        if i % 2:
+            PackageItem(
+                str(pkg_dir),
+                PackageMetadata(
+                    "tool", "tool-%d" % i, "1.0.%d" % i, PackageSpec("tool-%d" % i)
+                ),
+            ).dump_meta()
+    # the recent changes are not trusted
+    pm = ToolPackageManager(str(storage_dir))
+    assert len(pm.get_installed()) == 495
+    assert not pm.load_installed_index()["stamp"]
+    monkeypatch.setattr(ToolPackageManager, "INSTALLED_INDEX_RACY_DELAY", 0)
+
+    loaded_files = []
+    orig_load_json = fs.load_json
+    orig_read_manifest_contents = ManifestParserFactory.read_manifest_contents
+    monkeypatch.setattr(
+        fs, "load_json", lambda path: loaded_files.append(path) or orig_load_json(path)
+    )
+    monkeypatch.setattr(
+        ManifestParserFactory,
+        "read_manifest_contents",
+        staticmethod(
+            lambda path: loaded_files.append(path) or orig_read_manifest_contents(path)
+        ),
+    )
+    results = {}
+    for name in ("cold", "warm"):
+        loaded_files.clear()
+        pm = ToolPackageManager(str(storage_dir))
+        results[name] = (
+            pm.get_installed(),
+            sorted(
+                os.path.basename(path)
+                for path in loaded_files
+                if os.path.basename(path) in (".piopm", "package.json")
+            ),
+        )
+    assert len(results["cold"][0]) == 495
+    assert results["cold"][1] == sorted([".piopm"] * 250 + ["package.json"] * 500)
+    # the packages are restored from the index
+    assert results["warm"][0] == results["cold"][0]
+    assert not results["warm"][1]
+
+    # the index is validated by the modification times
+    (storage_dir / "tool-1" / ".piopm").unlink()
+    shutil.rmtree(str(storage_dir / "tool-2"))
+    (storage_dir / "tool-3" / "package.json").write_text(
+        json.dumps(dict(name="tool-3", version="2.0.0"))
+    )
+    PackageItem(
+        str(storage_dir / "tool-3"),
+        PackageMetadata("tool", "tool-3", "2.0.0", PackageSpec("tool-3")),
+    ).dump_meta()
+    pm = ToolPackageManager(str(storage_dir))
+    installed = pm.get_installed()
+    assert len(installed) == 494
+    assert not pm.get_package("tool-2")
+    assert str(pm.get_package("tool-1").metadata.version) == "1.0.1"
+    assert str(pm.get_package("tool-3").metadata.version) == "2.0.0"
+
+
 def test_uninstall(isolated_pio_core, tmpdir_factory):
     tmp_dir = tmpdir_factory.mktemp("tmp")
     storage_dir = tmpdir_factory.mktemp("storage")
@@ -616,3 +774,346 @@ def test_update_without_metadata(isolated_pio_core, tmpdir_factory):
     new_pkg = lm.update(pkg)
     assert len(lm.get_installed()) == 4
     assert new_pkg.metadata.spec.owner == "heman"
+
+
+def _publish_registry_packages(www_dir, src_dir, manifests):
+    packages = {}
+    for manifest in manifests:
+        pkg_dir = src_dir / manifest["name"]
+        pkg_dir.mkdir(parents=True)
+        (pkg_dir / "library.json").write_text(json.dumps(manifest))
+        (pkg_dir / "src").mkdir()
+        (pkg_dir / "src" / ("%s.h" % manifest["name"])).write_text(manifest["name"])
+        tarball_path = PackagePacker(str(pkg_dir)).pack(str(www_dir))
+        packages[manifest["name"].lower()] = dict(
+            id=len(packages) + 1,
+            name=manifest["name"],
+            owner=dict(username="test"),
+            tarball=os.path.basename(tarball_path),
+            checksum=fs.calculate_file_hashsum("sha256", tarball_path),
+        )
+    return packages
+
+
+def _mock_registry(monkeypatch, base_url, packages, *managers):
+    """Returns the names of the resolved packages"""
+    resolved = []
+
+    def _fetch_registry_package(spec):
+        resolved.append(spec.name.lower())
+        data = packages[spec.name.lower()]
+        version = dict(
+            name="1.0.0",
+            files=[
+                dict(
+                    download_url="%s/%s" % (base_url, data["tarball"]),
+                    checksum=dict(sha256=data["checksum"]),
+                )
+            ],
+        )
+        return dict(data, version=version, versions=[version])
+
+    monkeypatch.setattr(
+        "platformio.package.manager._registry.RegistryFileMirrorIterator",
+        lambda url: iter([(url, None)]),
+    )
+    for pm in managers:
+        monkeypatch.setattr(pm, "fetch_registry_package", _fetch_registry_package)
+        monkeypatch.setattr(
+            pm,
+            "search_registry_packages",
+            lambda spec, *_: [_fetch_registry_package(spec)],
+        )
+    return resolved
+
+
+def test_install_prefetch_dependencies(  # pylint: disable=too-many-locals
+    isolated_pio_core, tmp_path, monkeypatch, http_server
+):
+    www_dir = tmp_path / "www"
+    www_dir.mkdir()
+    graph = {
+        "Root": ["Dep0", "Dep1", "Dep2"],
+        "Dep0": ["Dep00", "Dep01"],
+        "Dep1": ["Dep10", "Dep01"],
+        "Dep10": ["Dep100"],
+    }
+    dep_names = sorted(
+        set(name for items in graph.values() for name in items) - set(["Root"])
+    )
+    packages = _publish_registry_packages(
+        www_dir,
+        tmp_path / "src",
+        [
+            dict(
+                name=name,
+                version="1.0.0",
+                dependencies=[
+                    dict(owner="test", name=dep_name, version="^1.0.0")
+                    for dep_name in graph.get(name, [])
+                ],
+            )
+            for name in ["Root"] + dep_names
+        ],
+    )
+
+    events = []
+    lm = LibraryPackageManager(str(tmp_path / "storage"))
+    lm.set_log_level(logging.ERROR)
+    orig_download = lm.download
+    orig_unpack = lm.unpack
+
+    def _download(url, *args, **kwargs):
+        result = orig_download(url, *args, **kwargs)
+        events.append(("download", url.rsplit("/", 1)[1]))
+        return result
+
+    def _unpack(src, *args, **kwargs):
+        events.append(("unpack", os.path.basename(src)))
+        return orig_unpack(src, *args, **kwargs)
+
+    monkeypatch.setattr(lm, "download", _download)
+    monkeypatch.setattr(lm, "unpack", _unpack)
+
+    base_url = http_server(directory=www_dir).url
+    resolved = _mock_registry(monkeypatch, base_url, packages, lm)
+    lm.install("test/Root@^1.0.0")
+
+    assert sorted(os.path.basename(pkg.path) for pkg in lm.get_installed()) == sorted(
+        ["Root"] + dep_names
+    )
+    # the whole dependency graph is downloaded in parallel before the first
+    # dependency is unpacked, the root package is unpacked while it is being
+    # downloaded
+    assert [kind for kind, _ in events] == (
+        ["download"] * len(dep_names) + ["download", "unpack"] * len(dep_names)
+    )
+    # each package is resolved once
+    assert sorted(resolved) == sorted(name.lower() for name in ["Root"] + dep_names)
+    assert len(os.listdir(lm.get_download_dir())) == len(packages) + 1  # usage.db
+
+
+def test_install_streaming(func_isolated_pio_core, tmp_path, monkeypatch, http_server):
+    www_dir = tmp_path / "www"
+    www_dir.mkdir()
+    archive_path = _pack_library(www_dir, "Foo", "1.0.0", {"src/foo.h": "foo"})
+    checksum = fs.calculate_file_hashsum("sha256", archive_path)
+    storage_dir = tmp_path / "storage"
+    lm = LibraryPackageManager(str(storage_dir))
+    lm.set_log_level(logging.ERROR)
+    orig_calculate_file_hashsum = fs.calculate_file_hashsum
+
+    def _unpack(*_):
+        raise AssertionError("the archive is unpacked from the stream")
+
+    base_url = http_server(directory=www_dir).url
+    url = "%s/%s" % (base_url, os.path.basename(archive_path))
+
+    # the archive is hashed and unpacked while it is being downloaded
+    monkeypatch.setattr(fs, "calculate_file_hashsum", _unpack)
+    monkeypatch.setattr(lm, "unpack", _unpack)
+    app.set_setting("enable_download_cache", False)
+    pkg = lm.install_from_uri(url, PackageSpec("test/Foo"), checksum)
+    assert (Path(pkg.path) / "src" / "foo.h").read_text() == "foo"
+    dl_path = lm.compute_download_path(url, checksum)
+    assert not os.path.isfile(dl_path)
+
+    # keep the archive in the downloads cache
+    app.set_setting("enable_download_cache", True)
+    lm.uninstall(pkg)
+    lm.install_from_uri(url, PackageSpec("test/Foo"), checksum)
+    assert orig_calculate_file_hashsum("sha256", dl_path) == checksum
+    monkeypatch.undo()
+
+    # corrupted archive
+    lm.uninstall(pkg)
+    with pytest.raises(PackageException, match="checksum"):
+        lm.install_from_uri(url, PackageSpec("test/Foo"), "0" * 64)
+    assert not lm.get_installed()
+    assert os.listdir(lm.get_tmp_dir()) == []
+
+
+def test_install_zip_single_request(func_isolated_pio_core, tmp_path, http_server):
+    www_dir = tmp_path / "www"
+    www_dir.mkdir()
+    lm = LibraryPackageManager(str(tmp_path / "storage"))
+    lm.set_log_level(logging.ERROR)
+    # the archives which are not unpacked from a stream reuse the response
+    with zipfile.ZipFile(str(www_dir / "Bar.zip"), "w") as zf:
+        zf.writestr("library.json", json.dumps(dict(name="Bar", version="1.0.0")))
+        zf.writestr("src/bar.h", "bar")
+    requests = []
+
+    class _RequestHandler(SimpleHTTPRequestHandler):
+        def do_GET(self):  # pylint: disable=invalid-name
+            requests.append(self.path)
+            super().do_GET()
+
+    base_url = http_server(_RequestHandler, directory=www_dir).url
+    pkg = lm.install_from_uri(base_url + "/Bar.zip", PackageSpec("test/Bar"))
+    assert (Path(pkg.path) / "src" / "bar.h").read_text() == "bar"
+    assert requests == ["/Bar.zip"]
+
+
+def test_install_from_library_store(
+    func_isolated_pio_core, tmp_path, monkeypatch, http_server
+):
+    www_dir = tmp_path / "www"
+    www_dir.mkdir()
+    packages = _publish_registry_packages(
+        www_dir,
+        tmp_path / "src",
+        [
+            dict(
+                name="Foo",
+                version="1.0.0",
+                dependencies=[dict(owner="test", name="Bar", version="^1.0.0")],
+            ),
+            dict(name="Bar", version="1.0.0"),
+        ],
+    )
+    env_lms = [
+        LibraryPackageManager(str(tmp_path / "libdeps" / env)) for env in ("a", "b")
+    ]
+    app.set_setting("enable_library_store", True)
+    base_url = http_server(directory=www_dir).url
+    _mock_registry(monkeypatch, base_url, packages, *env_lms)
+    for lm in env_lms:
+        lm.set_log_level(logging.ERROR)
+        # the files are copied by default
+        app.set_setting("enable_library_store_hardlinks", lm == env_lms[1])
+        lm.install("test/Foo@^1.0.0")
+        assert [pkg.metadata.name for pkg in lm.get_installed()] == ["Bar", "Foo"]
+
+    store_lm = LibraryPackageManager(LibraryPackageManager.get_store_dir())
+    store_pkgs = store_lm.get_installed()
+    assert [pkg.metadata.name for pkg in store_pkgs] == ["Bar", "Foo"]
+    assert [store_lm.get_store_refcount(pkg) for pkg in store_pkgs] == [2, 2]
+    # the hard linked files are shared, the metadata is not
+    for lm in env_lms:
+        pkg = lm.get_package("test/Foo")
+        assert pkg.metadata.spec == store_pkgs[1].metadata.spec
+        assert os.path.samefile(
+            os.path.join(pkg.path, "src", "Foo.h"),
+            os.path.join(store_pkgs[1].path, "src", "Foo.h"),
+        ) == (lm == env_lms[1])
+        assert not os.path.samefile(
+            os.path.join(pkg.path, ".piopm"),
+            os.path.join(store_pkgs[1].path, ".piopm"),
+        )
+
+    # uninstall the linked packages
+    env_lms[0].uninstall("test/Foo")
+    assert not env_lms[0].get_installed()
+    assert [store_lm.get_store_refcount(pkg) for pkg in store_pkgs] == [1, 1]
+    assert not remove_unnecessary_library_store_packages()
+    env_lms[1].uninstall("test/Bar")
+    assert [
+        os.path.basename(pkg.path)
+        for pkg in remove_unnecessary_library_store_packages()
+    ] == [os.path.basename(store_pkgs[0].path)]
+    store_lm.memcache_reset()
+    assert [pkg.metadata.name for pkg in store_lm.get_installed()] == ["Foo"]
+    assert (Path(env_lms[1].package_dir) / "Foo" / "src" / "Foo.h").read_text() == "Foo"
+
+
+def test_install_from_registry_index(  # pylint: disable=too-many-locals,too-many-arguments,too-many-positional-arguments
+    clirunner,
+    validate_cliresult,
+    func_isolated_pio_core,
+    tmp_path,
+    monkeypatch,
+    http_server,
+):
+    www_dir = tmp_path / "www"
+    www_dir.mkdir()
+    packages = _publish_registry_packages(
+        www_dir,
+        tmp_path / "src",
+        [
+            dict(
+                name="Foo",
+                version="1.0.0",
+                dependencies=[dict(owner="test", name="Bar", version="^1.0.0")],
+            ),
+            dict(name="Bar", version="1.0.0"),
+        ],
+    )
+    lm = LibraryPackageManager(str(tmp_path / "storage"))
+    lm.set_log_level(logging.ERROR)
+    base_url = http_server(directory=www_dir).url
+    snapshot = []
+    for data in packages.values():
+        versions = [
+            dict(
+                name=name,
+                released_at=released_at,
+                files=[
+                    dict(
+                        name=data["tarball"],
+                        system="*",
+                        download_url="%s/%s" % (base_url, data["tarball"]),
+                        checksum=dict(sha256=data["checksum"]),
+                    )
+                ],
+            )
+            for name, released_at in (
+                ("1.0.0", "2024-01-01 00:00:00"),
+                ("2.0.0", "2025-01-01 00:00:00"),
+            )
+        ]
+        snapshot.append(
+            dict(
+                id=data["id"],
+                type="library",
+                name=data["name"],
+                owner=data["owner"],
+                versions=versions,
+                platforms=["espressif32"] if data["name"] == "Bar" else ["*"],
+            )
+        )
+    with open(str(www_dir / "index.json.gz"), "wb") as fp:
+        fp.write(gzip.compress(json.dumps(dict(packages=snapshot)).encode()))
+
+    result = clirunner.invoke(
+        package_cli, ["index", "update", "--source", base_url + "/index.json.gz"]
+    )
+    validate_cliresult(result)
+    assert "updated with 2 packages" in result.output
+    # refresh from the previous source
+    result = clirunner.invoke(package_cli, ["index", "update"])
+    validate_cliresult(result)
+    assert base_url in result.output
+
+    # resolve without the registry API
+    def _no_network(*args, **kwargs):
+        raise AssertionError("The registry API has been requested")
+
+    monkeypatch.setattr(RegistryClient, "list_packages", _no_network)
+    monkeypatch.setattr(RegistryClient, "get_package", _no_network)
+    monkeypatch.setattr(
+        "platformio.package.manager._registry.RegistryFileMirrorIterator",
+        lambda url: iter([(url, None)]),
+    )
+    app.set_setting("enable_registry_index", True)
+    lm.install("test/Foo@^1.0.0")
+    lm.install("Bar@<2")
+    assert [
+        (pkg.metadata.name, str(pkg.metadata.version)) for pkg in lm.get_installed()
+    ] == [("Bar", "1.0.0"), ("Foo", "1.0.0")]
+
+    index = RegistryIndex.get_instance()
+    assert index.get_package("library", "test", "bar")["versions"][0]["name"] == "2.0.0"
+    assert index.get_package("library", id_=packages["foo"]["id"])["name"] == "Foo"
+    assert not index.get_package("tool", "test", "Foo")
+    assert [
+        p["name"] for p in index.search(dict(types="library", names=["foo", "bar"]))
+    ] == ["Foo", "Bar"]
+    assert [
+        p["name"]
+        for p in index.search(
+            dict(types="library", names=["foo", "bar"], platforms=["atmelavr"])
+        )
+    ] == ["Foo"]
+    # the qualifiers which are not indexed are answered by the registry
+    assert index.search(dict(types="library", keywords=["wifi"])) is None
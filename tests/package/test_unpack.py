@@ -0,0 +1,122 @@
+# Copyright (c) 2014-present PlatformIO <contact@platformio.org>
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import io
+import os
+import stat
+import tarfile
+import time
+import zipfile
+
+import pytest
+
+from platformio.package.exception import PackageException
+from platformio.package.unpack import BaseArchiver, FileUnpacker
+
+MTIME = 1600000000
+
+
+def _make_files(nums):
+    return {
+        "pkg/dir%d/file%d.%s"
+        % (i % 7, i, "sh" if i % 5 == 0 else "c"): ("data %d" % i).encode()
+        * (i % 13)
+        for i in range(nums)
+    }
+
+
+def _make_tar(path, files, links=False):
+    with tarfile.open(path, "w:gz") as tf:
+        for name, data in files.items():
+            info = tarfile.TarInfo(name)
+            info.size = len(data)
+            info.mtime = MTIME
+            info.mode = 0o755 if name.endswith(".sh") else 0o644
+            tf.addfile(info, io.BytesIO(data))
+        if links:
+            target = next(iter(files))
+            for name, link_type in (
+                ("pkg/symlink.c", tarfile.SYMTYPE),
+                ("pkg/hardlink.c", tarfile.LNKTYPE),
+            ):
+                info = tarfile.TarInfo(name)
+                info.type = link_type
+                info.linkname = (
+                    os.path.relpath(target, "pkg")
+                    if link_type == tarfile.SYMTYPE
+                    else target
+                )
+                tf.addfile(info)
+            # files after links
+            info = tarfile.TarInfo("pkg/last.c")
+            info.size = 4
+            tf.addfile(info, io.BytesIO(b"last"))
+    return path
+
+
+def _make_zip(path, files):
+    with zipfile.ZipFile(path, "w", compression=zipfile.ZIP_DEFLATED) as zf:
+        for name, data in files.items():
+            info = zipfile.ZipInfo(name, time.localtime(MTIME)[:6])
+            info.external_attr = (0o755 if name.endswith(".sh") else 0o644) << 16
+            zf.writestr(info, data)
+    return path
+
+
+def _unpack(archive_path, dst_dir):
+    with FileUnpacker(str(archive_path)) as fu:
+        assert fu.unpack(str(dst_dir), silent=True)
+    result = {}
+    for root, _, files in os.walk(dst_dir):
+        for name in files:
+            path = os.path.join(root, name)
+            with open(path, "rb") as fp:
+                result[os.path.relpath(path, dst_dir)] = (
+                    fp.read(),
+                    stat.S_IMODE(os.stat(path).st_mode),
+                    int(os.stat(path).st_mtime),
+                )
+    return result
+
+
+@pytest.mark.parametrize("archive_type", ["tar", "zip"])
+def test_parallel_unpack(tmp_path, monkeypatch, archive_type):
+    files = _make_files(500)
+    if archive_type == "tar":
+        archive_path = _make_tar(tmp_path / "archive.tar.gz", files, links=True)
+    else:
+        archive_path = _make_zip(tmp_path / "archive.zip", files)
+    monkeypatch.setattr(BaseArchiver, "MAX_WORKERS", 4)
+    result = _unpack(archive_path, tmp_path / "parallel")
+    monkeypatch.setattr(BaseArchiver, "MAX_WORKERS", 1)
+    assert result == _unpack(archive_path, tmp_path / "serial")
+    for name, data in files.items():
+        assert result[os.path.normpath(name)][0] == data
+    assert result[os.path.normpath("pkg/dir5/file5.sh")][1:] == (0o755, MTIME)
+
+    # unpack a stream
+    if archive_type == "tar":
+        with open(archive_path, "rb") as fp:
+            with FileUnpacker(fileobj=fp) as fu:
+                assert fu.unpack(str(tmp_path / "stream"))
+        assert result == _unpack(archive_path, tmp_path / "stream")
+
+
+def test_unpack_insecure_items(tmp_path):
+    files = _make_files(100)
+    files["pkg/../../evil.c"] = b"evil"
+    archive_path = _make_tar(tmp_path / "archive.tar.gz", files)
+    with pytest.raises((PackageException, tarfile.TarError)):
+        _unpack(archive_path, tmp_path / "dst")
+    assert not (tmp_path / "evil.c").exists()
@@ -12,11 +12,13 @@
 # See the License for the specific language governing permissions and
 # limitations under the License.
 
-# pylint: disable=redefined-outer-name
+# pylint: disable=redefined-outer-name, protected-access
 
 import configparser
 import os
 import sys
+import threading
+import time
 from pathlib import Path
 
 import pytest
@@ -731,3 +733,215 @@ test_testing_command = /usr/bin/flash-tool -p $UPLOAD_PORT -b $UPLOAD_SPEED
     assert result["warnings"] and len(result["warnings"]) == 2
     assert "deprecated" in result["warnings"][0]
     assert "Invalid variable declaration" in result["warnings"][1]
+
+
+def test_resolved_values_cache(tmp_path: Path, monkeypatch):
+    project_dir = tmp_path / "project"
+    project_dir.mkdir()
+    project_conf = project_dir / "platformio.ini"
+    project_conf.write_text("""
+[common]
+build_flags = -D COMMON ${sysenv.__PIO_TEST_CNF_FLAG}
+
+[env:myenv]
+extends = common
+build_flags = ${common.build_flags} -D ENV
+custom_time = ${UNIX_TIME}
+custom_dir = ${PROJECT_DIR}
+    """)
+    monkeypatch.setenv("__PIO_TEST_CNF_FLAG", "-D FIRST")
+    config = ProjectConfig(str(project_conf))
+    assert config.get("env:myenv", "build_flags") == ["-D COMMON -D FIRST -D ENV"]
+    # the returned list is a copy
+    config.get("env:myenv", "build_flags").append("-D MODIFIED")
+    assert config.get("env:myenv", "build_flags") == ["-D COMMON -D FIRST -D ENV"]
+
+    # the system environment variable of the nested value
+    monkeypatch.setenv("__PIO_TEST_CNF_FLAG", "-D SECOND")
+    assert config.get("env:myenv", "build_flags") == ["-D COMMON -D SECOND -D ENV"]
+    monkeypatch.setenv("PLATFORMIO_BUILD_FLAGS", "-D SYSENV")
+    assert config.get("env:myenv", "build_flags") == [
+        "-D COMMON -D SECOND -D ENV",
+        "-D SYSENV",
+    ]
+    monkeypatch.delenv("PLATFORMIO_BUILD_FLAGS")
+
+    # the working directory
+    assert config.get("env:myenv", "custom_dir") == os.getcwd()
+    with fs.cd(str(project_dir)):
+        assert config.get("env:myenv", "custom_dir") == str(project_dir)
+        assert config.get("platformio", "name") == "project"
+    assert config.get("platformio", "name") == os.path.basename(os.getcwd())
+
+    # the volatile values are not cached
+    assert ("env:myenv", "custom_time") not in [key[1:3] for key in config._cache]
+
+    # the modifications
+    config.set("common", "build_flags", "-D UPDATED")
+    assert config.get("env:myenv", "build_flags") == ["-D UPDATED -D ENV"]
+    config.remove_option("env:myenv", "build_flags")
+    assert config.get("env:myenv", "build_flags") == ["-D UPDATED"]
+    config.remove_section("common")
+    assert config.get("env:myenv", "build_flags") == []
+    config.add_section("common")
+    config.update([("common", [("build_flags", "-D RESTORED")])])
+    assert config.get("env:myenv", "build_flags") == ["-D RESTORED"]
+    config.update([("env:myenv", [("build_flags", "-D NEW")])], clear=True)
+    assert config.get("env:myenv", "build_flags") == ["-D NEW"]
+
+
+def test_resolved_values_cache_threads(tmp_path: Path, monkeypatch):
+    project_conf = tmp_path / "platformio.ini"
+    project_conf.write_text(
+        "[env:myenv]\n"
+        "custom_a = ${sysenv.__PIO_TEST_CNF_A}\n"
+        "custom_b = ${sysenv.__PIO_TEST_CNF_B}\n"
+    )
+    monkeypatch.setenv("__PIO_TEST_CNF_A", "a1")
+    monkeypatch.setenv("__PIO_TEST_CNF_B", "b1")
+    config = ProjectConfig(str(project_conf))
+
+    # both values are being resolved at the same time
+    barrier = threading.Barrier(2)
+    orig_get = config._get
+
+    def _get(section, option, default):
+        if not option.startswith("custom_"):
+            return orig_get(section, option, default)
+        barrier.wait(timeout=10)
+        try:
+            return orig_get(section, option, default)
+        finally:
+            barrier.wait(timeout=10)
+
+    monkeypatch.setattr(config, "_get", _get)
+    results = {}
+    threads = [
+        threading.Thread(
+            target=lambda name=name: results.update(
+                {name: config.get("env:myenv", name)}
+            )
+        )
+        for name in ("custom_a", "custom_b")
+    ]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert results == {"custom_a": "a1", "custom_b": "b1"}
+
+    # each value depends only on own variable
+    calls = []
+    monkeypatch.setattr(
+        config, "_get", lambda *args: calls.append(args[1]) or orig_get(*args)
+    )
+    monkeypatch.setenv("__PIO_TEST_CNF_B", "b2")
+    assert config.get("env:myenv", "custom_a") == "a1"
+    assert config.get("env:myenv", "custom_b") == "b2"
+    assert calls == ["custom_b"]
+
+
+def test_parsed_cache(tmp_path: Path, monkeypatch):
+    cache_dir = tmp_path / "cache"
+    project_conf = tmp_path / "platformio.ini"
+    project_conf.write_text("""
+[platformio]
+extra_configs = extra.ini
+
+[env:myenv]
+build_flags = -D MAIN
+    """)
+    extra_conf = tmp_path / "extra.ini"
+    extra_conf.write_text("""
+[env:myenv]
+custom_option = extra
+    """)
+    past = time.time() - 60
+    for path in (project_conf, extra_conf):
+        os.utime(str(path), (past, past))
+    with fs.cd(str(tmp_path)):
+        expected = ProjectConfig(str(project_conf)).as_tuple()
+
+        monkeypatch.setenv("PLATFORMIO_CONF_CACHE_DIR", str(cache_dir))
+        assert ProjectConfig(str(project_conf)).as_tuple() == expected
+        assert len(os.listdir(str(cache_dir))) == 2
+        read_calls = []
+        original_read = configparser.ConfigParser.read
+        monkeypatch.setattr(
+            configparser.ConfigParser,
+            "read",
+            lambda self, *args: read_calls.append(args) or original_read(self, *args),
+        )
+        assert ProjectConfig(str(project_conf)).as_tuple() == expected
+        assert not read_calls
+
+        # the modified file is parsed again
+        extra_conf.write_text("""
+[env:myenv]
+custom_option = modified
+    """)
+        config = ProjectConfig(str(project_conf))
+        assert config.get("env:myenv", "custom_option") == "modified"
+        assert config.get("env:myenv", "build_flags") == ["-D MAIN"]
+        assert read_calls == [("extra.ini", "utf-8")]
+
+
+def test_deep_extends_cache(tmp_path: Path, monkeypatch):
+    lines = ["[platformio]", "default_envs = env0", "", "[base0]"]
+    lines.append("build_flags = -D LEVEL0 ${sysenv.__PIO_TEST_CNF_UNKNOWN}")
+    for level in range(1, 10):
+        lines.extend(
+            [
+                "",
+                "[base%d]" % level,
+                "extends = base%d" % (level - 1),
+                "build_flags = ${base%d.build_flags} -D LEVEL%d" % (level - 1, level),
+                "custom_option%d = ${this.__env__}" % level,
+            ]
+        )
+    for index in range(100):
+        lines.extend(
+            [
+                "",
+                "[env:env%d]" % index,
+                "extends = base9",
+                "platform = native",
+                "build_flags = ${base9.build_flags} -D ENV%d" % index,
+                "build_src_flags = ${this.build_flags}",
+            ]
+        )
+    project_conf = tmp_path / "platformio.ini"
+    project_conf.write_text("\n".join(lines))
+    config = ProjectConfig(str(project_conf))
+
+    calls = []
+
+    def _count_calls(name):
+        orig = getattr(ProjectConfig, name)
+
+        def _wrapper(self, *args):
+            calls.append(name)
+            return orig(self, *args)
+
+        return _wrapper
+
+    # the uncached resolvers of the values
+    for name in ("_traverse_for_value", "_expand_interpolations"):
+        monkeypatch.setattr(ProjectConfig, name, _count_calls(name))
+
+    def _resolve_all():
+        del calls[:]
+        return [config.items(env=env) for env in config.envs()]
+
+    cold_result = _resolve_all()
+    assert calls
+    warm_result = _resolve_all()
+    # the values are not resolved again
+    assert not calls
+    assert cold_result == warm_result
+    assert (
+        dict(cold_result[42])["build_src_flags"][0].split()
+        == " ".join(
+            ["-D LEVEL%d" % level for level in range(10)] + ["-D ENV42"]
+        ).split()
+    )
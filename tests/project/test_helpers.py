@@ -0,0 +1,62 @@
+# Copyright (c) 2014-present PlatformIO <contact@platformio.org>
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import os
+from pathlib import Path
+
+from platformio import fs
+from platformio.project import helpers
+from platformio.project.config import ProjectConfig
+
+
+def test_project_checksum_manifest(tmp_path: Path, monkeypatch):
+    project_dir = tmp_path / "project"
+    (project_dir / "src" / "nested").mkdir(parents=True)
+    (project_dir / "lib" / "foo" / "src").mkdir(parents=True)
+    (project_dir / "src" / "main.cpp").write_text("")
+    (project_dir / "src" / "nested" / "util.h").write_text("")
+    (project_dir / "src" / "readme.txt").write_text("")
+    (project_dir / "lib" / "foo" / "src" / "foo.c").write_text("")
+    (project_dir / "platformio.ini").write_text("[env:native]\nplatform = native\n")
+    # trust the timestamps of the directories created above
+    monkeypatch.setattr(helpers, "MANIFEST_MTIME_SAFE_DELTA", -(10**12))
+
+    with fs.cd(str(project_dir)):
+        config = ProjectConfig()
+        manifest = {}
+        checksum = helpers.compute_project_checksum(config)
+        assert helpers.compute_project_checksum(config, manifest) == checksum
+        assert str(project_dir / "src" / "nested") in manifest
+
+        # unchanged directories are not re-listed
+        def _scandir(path):
+            raise AssertionError("re-listed %s" % path)
+
+        with monkeypatch.context() as m:
+            m.setattr(os, "scandir", _scandir)
+            assert helpers.compute_project_checksum(config, manifest) == checksum
+
+        # a new file changes a timestamp of its directory
+        (project_dir / "lib" / "foo" / "src" / "bar.h").write_text("")
+        new_checksum = helpers.compute_project_checksum(config, manifest)
+        assert new_checksum != checksum
+        assert new_checksum == helpers.compute_project_checksum(config)
+
+        # removed directories are dropped from the manifest
+        fs.rmtree(str(project_dir / "src" / "nested"))
+        assert helpers.compute_project_checksum(config, manifest) not in (
+            checksum,
+            new_checksum,
+        )
+        assert str(project_dir / "src" / "nested") not in manifest